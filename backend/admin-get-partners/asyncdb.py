@@ -0,0 +1,154 @@
+'''
+asyncio variant of db.py on psycopg 3, for handlers whose queries do not
+depend on each other. fetch() sends a list of statements in pipeline mode:
+they go out together and cost one round trip instead of one each.
+The pool and its connections live on one event loop per container, run in a
+background thread; run() executes a coroutine there and waits for it, so a
+synchronous handler(event, context) can take the async path (DB_ASYNC=1).
+Connections are in autocommit, since the async paths only read: returning
+one to the pool costs no ROLLBACK round trip. The pool takes db.py's
+DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_CONNECT_TIMEOUT and DB_HEALTHCHECK_AFTER;
+hot statements of queries.py are prepared by psycopg (DB_PREPARE=0 turns
+that off). Each pipeline is one entry in the request trace (tracing.py).
+psycopg is imported on first use, like psycopg2 in db.py.
+Vendored into every function with an async path; keep the copies identical
+(scripts/check_shared.py).
+'''
+
+import asyncio
+import atexit
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Coroutine, Dict, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import db
+import queries
+import tracing
+
+ENABLED = os.environ.get('DB_ASYNC', '0') == '1'
+
+# A queries.Statement (rows come back as its records) or plain SQL (tuples), and its arguments
+Call = Tuple[Union[queries.Statement, str], Sequence[Any]]
+
+T = TypeVar('T')
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_pool: Any = None
+_pool_lock = asyncio.Lock()
+_last_used: Dict[int, float] = {}
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='asyncdb', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run(coroutine: Coroutine[Any, Any, T]) -> T:
+    '''Run coroutine on the container's event loop and wait for its result; callable from any thread.'''
+    return asyncio.run_coroutine_threadsafe(coroutine, _event_loop()).result()
+
+
+async def _check(conn: Any) -> None:
+    # Like db.py: only a connection idle for a while is pinged before reuse
+    if time.monotonic() - _last_used.get(id(conn), 0.0) < db.HEALTHCHECK_AFTER:
+        return
+    from psycopg_pool import AsyncConnectionPool
+    await AsyncConnectionPool.check_connection(conn)
+
+
+async def get_pool() -> Any:
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                from psycopg_pool import AsyncConnectionPool
+                pool = AsyncConnectionPool(
+                    os.environ['DATABASE_URL'],
+                    min_size=1,
+                    max_size=db.POOL_SIZE,
+                    timeout=db.POOL_TIMEOUT,
+                    check=_check,
+                    kwargs={
+                        'autocommit': True,
+                        'prepare_threshold': 5 if queries.PREPARE else None,
+                        'connect_timeout': db.CONNECT_TIMEOUT,
+                        'keepalives': 1,
+                        'keepalives_idle': 30,
+                        'keepalives_interval': 10,
+                        'keepalives_count': 3,
+                    },
+                    open=False,
+                )
+                await pool.open()
+                _pool = pool
+    return _pool
+
+
+@atexit.register
+def _close() -> None:
+    if _pool is not None:
+        run(_pool.close())
+
+
+@asynccontextmanager
+async def connection() -> AsyncIterator[Any]:
+    '''Borrow a pooled connection (autocommit) for the duration of the block.'''
+    pool = await get_pool()
+    started = time.perf_counter()
+    async with pool.connection() as conn:
+        tracing.add_phase('connect', time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            _last_used[id(conn)] = time.monotonic()
+
+
+@asynccontextmanager
+async def _no_pipeline() -> AsyncIterator[None]:
+    yield
+
+
+async def fetch(conn: Any, calls: Sequence[Call]) -> List[List[Any]]:
+    '''
+    Rows of each (statement, args) call, in order. Several statements are
+    sent in one pipeline before any result is read, and run one after another
+    on the server, each in its own transaction.
+    '''
+    started = time.perf_counter()
+    cursors = []
+    # A single statement gains nothing from pipeline mode and pays its bookkeeping
+    async with conn.pipeline() if len(calls) > 1 else _no_pipeline():
+        for statement, args in calls:
+            cur = conn.cursor()
+            if isinstance(statement, queries.Statement):
+                await cur.execute(statement.sql, args, prepare=True if statement.prepare and queries.PREPARE else None)
+            else:
+                await cur.execute(statement, args)
+            cursors.append(cur)
+    results = []
+    for (statement, _), cur in zip(calls, cursors):
+        rows = await cur.fetchall()
+        if isinstance(statement, queries.Statement) and statement.record is not None:
+            rows = [statement.record._make(row) for row in rows]
+        results.append(rows)
+    tracing.record_query(
+        'PIPELINE ' + '; '.join(s.name if isinstance(s, queries.Statement) else s for s, _ in calls),
+        time.perf_counter() - started,
+        sum(len(rows) for rows in results)
+    )
+    return results
+
+
+async def fetch_one(conn: Any, statement: queries.Statement, args: Sequence[Any] = ()) -> Optional[Any]:
+    '''The first record of a single statement, or None.'''
+    rows = (await fetch(conn, [(statement, args)]))[0]
+    return rows[0] if rows else None
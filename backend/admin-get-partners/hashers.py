@@ -0,0 +1,142 @@
+'''
+Pluggable password hashing with configurable cost.
+verify() recognises every stored format we have issued; needs_rehash() tells
+the login handlers to upgrade a hash that is not in the preferred scheme or
+uses weaker parameters than configured.
+
+Formats:
+    pbkdf2_sha256$<iterations>$<salt>$<hex>   current PBKDF2 format
+    <salt>$<hex>                              legacy PBKDF2, 100000 iterations
+    $2b$<rounds>$...                          bcrypt
+'''
+
+import hashlib
+import hmac
+import os
+import secrets
+from typing import Dict, List, Optional
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2_sha256')
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', '100000'))
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+# Threads for hash_passwords(); 0 means one per CPU
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', '0')) or os.cpu_count() or 1
+
+LEGACY_PBKDF2_ITERATIONS = 100000
+
+
+class PBKDF2Hasher:
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations: int = PBKDF2_ITERATIONS):
+        self.iterations = iterations
+
+    def _derive(self, password: str, salt: str, iterations: int) -> str:
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations).hex()
+
+    def encode(self, password: str) -> str:
+        salt = secrets.token_hex(16)
+        return '%s$%d$%s$%s' % (self.algorithm, self.iterations, salt, self._derive(password, salt, self.iterations))
+
+    def matches(self, encoded: str) -> bool:
+        return encoded.startswith(self.algorithm + '$') or (encoded.count('$') == 1 and not encoded.startswith('$'))
+
+    def parse(self, encoded: str):
+        if encoded.startswith(self.algorithm + '$'):
+            _, iterations, salt, digest = encoded.split('$', 3)
+            return int(iterations), salt, digest
+        salt, digest = encoded.split('$', 1)
+        return LEGACY_PBKDF2_ITERATIONS, salt, digest
+
+    def verify(self, password: str, encoded: str) -> bool:
+        try:
+            iterations, salt, digest = self.parse(encoded)
+        except ValueError:
+            return False
+        return hmac.compare_digest(self._derive(password, salt, iterations), digest)
+
+    def needs_rehash(self, encoded: str) -> bool:
+        if not encoded.startswith(self.algorithm + '$'):
+            return True
+        try:
+            iterations, _, _ = self.parse(encoded)
+        except ValueError:
+            return True
+        return iterations < self.iterations
+
+
+class BcryptHasher:
+    algorithm = 'bcrypt'
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS):
+        self.rounds = rounds
+
+    def encode(self, password: str) -> str:
+        import bcrypt
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    def matches(self, encoded: str) -> bool:
+        return encoded.startswith(('$2a$', '$2b$', '$2y$'))
+
+    def verify(self, password: str, encoded: str) -> bool:
+        import bcrypt
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), encoded.encode('utf-8'))
+        except ValueError:
+            return False
+
+    def needs_rehash(self, encoded: str) -> bool:
+        try:
+            return int(encoded.split('$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+HASHERS: Dict[str, type] = {
+    PBKDF2Hasher.algorithm: PBKDF2Hasher,
+    BcryptHasher.algorithm: BcryptHasher,
+}
+
+
+def get_hasher(algorithm: str = PASSWORD_HASHER):
+    return HASHERS[algorithm]()
+
+
+def identify(encoded: str):
+    '''Hasher able to verify encoded, or None for an unknown format.'''
+    if not encoded:
+        return None
+    for hasher_class in (BcryptHasher, PBKDF2Hasher):
+        hasher = hasher_class()
+        if hasher.matches(encoded):
+            return hasher
+    return None
+
+
+def hash_password(password: str) -> str:
+    return get_hasher().encode(password)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    '''
+    Hash a batch of passwords, in order, on HASH_WORKERS threads. PBKDF2 and
+    bcrypt both release the GIL while hashing, so the threads run in parallel.
+    '''
+    if len(passwords) < 2 or HASH_WORKERS < 2:
+        return [hash_password(password) for password in passwords]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(HASH_WORKERS, len(passwords))) as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def verify_password(password: str, encoded: Optional[str]) -> bool:
+    hasher = identify(encoded or '')
+    return bool(hasher) and hasher.verify(password, encoded)
+
+
+def needs_rehash(encoded: str) -> bool:
+    '''True when encoded is not in the preferred scheme or uses weaker parameters.'''
+    preferred = get_hasher()
+    if not preferred.matches(encoded):
+        return True
+    return preferred.needs_rehash(encoded)
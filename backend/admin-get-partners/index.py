@@ -1,163 +1,238 @@
-import json
-import os
-from typing import Dict, Any
-import psycopg2
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import asyncdb
+import db
+import hashers
+import auth
+import outbox
+import partitions
+import queries
+import sync
+import web
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    '''
-    Business: Get all partners, approve/reject applications (admin only)
-    Args: event with httpMethod GET/POST, body for POST (partner_id, password, action)
-    Returns: List of partners (GET) or approval result (POST)
-    '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        admin_email = event.get('headers', {}).get('x-user-id', '')
-        partner_id = body_data.get('partner_id')
-        password = body_data.get('password', '')
-        action = body_data.get('action', 'approve')
-        
-        if not admin_email or not partner_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Missing admin email or partner_id'})
-            }
-        
-        database_url = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(database_url)
+ACTIONS = ('approve', 'reject')
+
+COLUMNS = queries.PartnerListItem._fields
+
+ALLOW_HEADERS = 'Content-Type, X-Admin-Id, X-Auth-Token, If-None-Match'
+
+# Serialized partner lists by ETag, per container
+RESPONSES = web.BodyCache(size=16, ttl=60.0)
+
+def update_application(request: web.Request) -> Dict[str, Any]:
+    body_data = request.json()
+    if not isinstance(body_data, dict):
+        raise web.HttpError(400, 'Invalid request body')
+    token = auth.token_from_event(request.event)
+    partner_id = body_data.get('partner_id')
+    password = body_data.get('password', '')
+    action = body_data.get('action', 'approve')
+    
+    if not token or not partner_id:
+        raise web.HttpError(400, 'Missing session token or partner_id')
+    
+    if action not in ACTIONS:
+        raise web.HttpError(400, 'Unknown action')
+    
+    # Same rule as admin-manage: an approved partner must be able to log in
+    if action == 'approve' and (not isinstance(password, str) or len(password) < 6):
+        raise web.HttpError(400, 'Password of at least 6 characters is required to approve')
+    
+    identity = auth.authenticate(token)
+    
+    if not identity or not identity.is_admin:
+        raise web.HttpError(403, 'Access denied: admin only')
+    
+    # Only a hash of the password is stored; hashing happens before borrowing a connection
+    password_hash = hashers.hash_password(password) if action == 'approve' else None
+    
+    with db.connection() as conn:
         cur = conn.cursor()
         
-        cur.execute("SELECT is_admin FROM partners WHERE email = %s AND is_approved = TRUE", (admin_email,))
-        admin_row = cur.fetchone()
-        
-        if not admin_row or not admin_row[0]:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 403,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Access denied: admin only'})
-            }
+        auth.revoke_partner_sessions(cur, partner_id)
         
         if action == 'approve':
-            cur.execute(
-                "UPDATE partners SET is_approved = TRUE, password_hash = %s WHERE id = %s",
-                (password, partner_id)
-            )
-        elif action == 'reject':
-            cur.execute("DELETE FROM partners WHERE id = %s", (partner_id,))
+            partner = queries.fetch_one(cur, queries.PARTNER_APPROVE, (password_hash, partner_id))
+            # The partner is notified by the outbox worker after commit, without the password
+            if partner:
+                outbox.enqueue(cur, [outbox.partner_approved(partner._asdict())])
+        else:
+            queries.execute(cur, queries.PARTNER_DELETE, (partner_id,))
         
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'success': True, 'action': action})
-        }
-    
-    if method != 'GET':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    params = event.get('queryStringParameters') or {}
-    admin_id = params.get('admin_id')
+    
+    return web.json_response(200, {'success': True, 'action': action})
+
+def partners_payload(request: web.Request, rows: List[Any], selected: Optional[List[str]]) -> Any:
+    return web.rows_payload(request, [row._asdict() for row in rows], COLUMNS, selected)
+
+def fetch_partners(request: web.Request, cur: Any, selected: Optional[List[str]]) -> Dict[str, Any]:
+    partners = partners_payload(request, queries.fetch_all(cur, queries.PARTNER_LIST), selected)
+    
+    return {
+        'success': True,
+        'partners': partners,
+        'watermark': sync.watermark(cur)
+    }
+
+def fetch_changes(request: web.Request, cur: Any, since: datetime, selected: Optional[List[str]]) -> Dict[str, Any]:
+    partners = partners_payload(request, queries.fetch_all(cur, queries.PARTNER_CHANGES, (since, since)), selected)
+    # Rejected applications are deleted; their tombstones tell the client to drop them
+    deleted = [row.id for row in queries.fetch_all(cur, queries.PARTNER_TOMBSTONES, (since,))]
+    
+    return {
+        'success': True,
+        'partners': partners,
+        'deleted': deleted,
+        'watermark': sync.watermark(cur, since)
+    }
+
+async def fetch_partners_async(request: web.Request, conn: Any, selected: Optional[List[str]]) -> Dict[str, Any]:
+    watermark, rows = await asyncdb.fetch(conn, [sync.watermark_query(), (queries.PARTNER_LIST, ())])
+    
+    return {
+        'success': True,
+        'partners': partners_payload(request, rows, selected),
+        'watermark': watermark[0].watermark.isoformat()
+    }
+
+async def fetch_changes_async(request: web.Request, conn: Any, since: datetime,
+                              selected: Optional[List[str]]) -> Dict[str, Any]:
+    watermark, rows, deleted = await asyncdb.fetch(conn, [
+        sync.watermark_query(since),
+        (queries.PARTNER_CHANGES, (since, since)),
+        (queries.PARTNER_TOMBSTONES, (since,))
+    ])
+    
+    return {
+        'success': True,
+        'partners': partners_payload(request, rows, selected),
+        'deleted': [row.id for row in deleted],
+        'watermark': watermark[0].watermark.isoformat()
+    }
+
+def overview_response(result: Any) -> Dict[str, Any]:
+    if not result.is_admin:
+        return web.error(403, 'Access denied. Admin only.')
+    
+    payload = result._asdict()
+    del payload['is_admin']
+    return web.json_response(200, dict(payload, success=True))
+
+def overview(admin_id: str) -> Dict[str, Any]:
+    # The admin check is part of the one statement
+    with db.connection() as conn:
+        cur = conn.cursor()
+        result = queries.fetch_one(cur, queries.ADMIN_OVERVIEW, (admin_id, partitions.recent_cutoff()))
+        cur.close()
+    
+    return overview_response(result)
+
+async def overview_async(admin_id: str) -> Dict[str, Any]:
+    async with asyncdb.connection() as conn:
+        result = await asyncdb.fetch_one(conn, queries.ADMIN_OVERVIEW, (admin_id, partitions.recent_cutoff()))
+    
+    return overview_response(result)
+
+def require_admin_id(request: web.Request) -> str:
+    admin_id = request.query.get('admin_id')
     
     if not admin_id:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'admin_id is required'})
-        }
-    
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
-    
-    cur.execute("SELECT is_admin FROM partners WHERE id = %s", (admin_id,))
-    admin_check = cur.fetchone()
-    
-    if not admin_check or not admin_check[0]:
+        raise web.HttpError(400, 'admin_id is required')
+    
+    return admin_id
+
+def list_version(row: Any) -> str:
+    return '.'.join(str(value or 0) for value in row)
+
+def list_partners(request: web.Request) -> Dict[str, Any]:
+    admin_id = require_admin_id(request)
+    
+    if request.query.get('view') == 'overview':
+        return overview(admin_id)
+    
+    since = sync.parse_since(request)
+    selected = web.select_fields(request, COLUMNS)
+    
+    with db.connection() as conn:
+        cur = conn.cursor()
+        
+        admin_check = queries.fetch_one(cur, queries.PARTNER_IS_ADMIN, (admin_id,))
+        
+        if not admin_check or not admin_check.value:
+            cur.close()
+            return web.error(403, 'Access denied. Admin only.')
+        
+        version = list_version(queries.fetch_one(cur, queries.PARTNER_LIST_VERSION))
+        result = web.conditional(
+            request,
+            web.etag(version, sorted(request.query.items())),
+            (lambda: fetch_changes(request, cur, since, selected)) if since is not None
+            else (lambda: fetch_partners(request, cur, selected)),
+            RESPONSES
+        )
         cur.close()
-        conn.close()
-        return {
-            'statusCode': 403,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Access denied. Admin only.'})
-        }
-    
-    cur.execute("""
-        SELECT 
-            p.id, p.name, p.email, p.phone, p.traffic_source, 
-            p.experience, p.is_approved, p.created_at,
-            COUNT(l.id) as leads_count,
-            SUM(CASE WHEN l.status = 'approved' THEN l.commission_amount ELSE 0 END) as total_commission
-        FROM partners p
-        LEFT JOIN leads l ON p.id = l.partner_id
-        WHERE p.is_admin = FALSE
-        GROUP BY p.id
-        ORDER BY p.created_at DESC
-    """)
-    
-    rows = cur.fetchall()
-    
-    partners = []
-    for row in rows:
-        partners.append({
-            'id': row[0],
-            'name': row[1],
-            'email': row[2],
-            'phone': row[3],
-            'traffic_source': row[4],
-            'experience': row[5],
-            'is_approved': row[6],
-            'created_at': row[7].isoformat() if row[7] else None,
-            'leads_count': row[8] or 0,
-            'total_commission': float(row[9]) if row[9] else 0
-        })
-    
-    cur.close()
-    conn.close()
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'success': True,
-            'partners': partners
-        })
-    }
\ No newline at end of file
+    return result
+
+async def list_partners_async(request: web.Request) -> Dict[str, Any]:
+    admin_id = require_admin_id(request)
+    
+    if request.query.get('view') == 'overview':
+        return await overview_async(admin_id)
+    
+    since = sync.parse_since(request)
+    selected = web.select_fields(request, COLUMNS)
+    
+    async with asyncdb.connection() as conn:
+        # The admin check and the list version do not depend on each other: one round trip
+        admin_check, version = await asyncdb.fetch(conn, [
+            (queries.PARTNER_IS_ADMIN, (admin_id,)),
+            (queries.PARTNER_LIST_VERSION, ())
+        ])
+        
+        if not admin_check or not admin_check[0].value:
+            return web.error(403, 'Access denied. Admin only.')
+        
+        result = await web.conditional_async(
+            request,
+            web.etag(list_version(version[0]), sorted(request.query.items())),
+            (lambda: fetch_changes_async(request, conn, since, selected)) if since is not None
+            else (lambda: fetch_partners_async(request, conn, selected)),
+            RESPONSES
+        )
+    
+    return result
+
+async def update_application_async(request: web.Request) -> Dict[str, Any]:
+    # Writes stay on db.py; only the reads have an async path
+    return await asyncio.to_thread(update_application, request)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Get all partners, approve/reject applications (admin only)
+    Args: event with httpMethod GET/POST, body for POST (partner_id, password, action);
+          GET since=<watermark> returns only partners changed after it;
+          fields (comma-separated columns) and format=compact shape the list;
+          GET view=overview returns the admin overview instead
+    Returns: List of partners with a watermark (GET, with an ETag; 304 when
+             If-None-Match still matches; with since, the changed partners and
+             the ids of deleted ones), the overview (pending applications,
+             recent leads, per-status counts, top partners by commission,
+             one query) or approval result (POST)
+    '''
+    if asyncdb.ENABLED:
+        return asyncdb.run(handle(event, context))
+    return web.dispatch(event, context, {'GET': list_partners, 'POST': update_application},
+                        allow_headers=ALLOW_HEADERS)
+
+async def handle(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    handler() on the asyncio path: independent reads go out in one pipeline
+    (asyncdb.py). handler() takes it with DB_ASYNC=1; a runtime with async
+    handlers can call it directly.
+    '''
+    return await web.dispatch_async(event, context, {'GET': list_partners_async, 'POST': update_application_async},
+                                    allow_headers=ALLOW_HEADERS)
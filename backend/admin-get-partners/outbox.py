@@ -0,0 +1,162 @@
+'''
+Transactional outbox for notifications about admin changes.
+Events are inserted in the same transaction as the change that causes them,
+so a request costs one extra insert and never waits on the recipient;
+scripts/outbox_worker.py delivers them afterwards. Delivery is at least
+once: a worker that dies mid-batch leaves its events to be sent again, so
+recipients deduplicate by event id. Passwords are never part of a payload.
+Vendored into every function that emits events.
+'''
+
+import json
+import os
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '10'))
+BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', '30'))
+BACKOFF_MAX = 6 * 3600.0
+
+LEAD_STATUS_CHANGED = 'lead.status_changed'
+PARTNER_APPROVED = 'partner.approved'
+
+# (event_type, partner_id, payload)
+Event = Tuple[str, int, Dict[str, Any]]
+
+# Rows stay locked until the batch is marked, so concurrent workers skip them
+CLAIM_SQL = '''
+    SELECT id, event_type, partner_id, payload, attempts, created_at
+    FROM {schema}.outbox
+    WHERE status = 'pending' AND available_at <= CURRENT_TIMESTAMP
+    ORDER BY available_at, id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+'''.format(schema=SCHEMA)
+
+
+def lead_status_changed(lead: Dict[str, Any], previous_status: Optional[str],
+                        previous_commission: Any) -> Optional[Event]:
+    '''Event for an updated lead row, or None when neither status nor commission changed.'''
+    if lead['status'] == previous_status and lead['commission_amount'] == previous_commission:
+        return None
+    return (LEAD_STATUS_CHANGED, lead['partner_id'], {
+        'lead_id': lead['id'],
+        'partner_id': lead['partner_id'],
+        'client_name': lead['client_name'],
+        'previous_status': previous_status,
+        'status': lead['status'],
+        'previous_commission': previous_commission,
+        'commission_amount': lead['commission_amount'],
+    })
+
+
+def partner_approved(partner: Dict[str, Any]) -> Event:
+    return (PARTNER_APPROVED, partner['id'], {
+        'partner_id': partner['id'],
+        'name': partner['name'],
+        'email': partner['email'],
+    })
+
+
+def enqueue(cur: Any, events: List[Optional[Event]]) -> int:
+    '''Insert events (None entries are skipped) in the caller's transaction; returns how many.'''
+    rows = [
+        (event_type, partner_id, json.dumps(payload, ensure_ascii=False, default=str))
+        for event_type, partner_id, payload in (event for event in events if event)
+    ]
+    if not rows:
+        return 0
+    from psycopg2.extras import execute_values
+    execute_values(
+        cur,
+        'INSERT INTO {schema}.outbox (event_type, partner_id, payload) VALUES %s'.format(schema=SCHEMA),
+        rows,
+        template='(%s, %s, %s::jsonb)',
+        page_size=len(rows)
+    )
+    return len(rows)
+
+
+def backoff(attempts: int) -> float:
+    '''Seconds before retry number `attempts`: exponential, capped, half of it jittered.'''
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def drain_batch(conn: Any, sink: Callable[[Dict[str, Any]], None], batch_size: int = 100) -> Dict[str, int]:
+    '''
+    Claim up to batch_size due events, pass each to sink and record the
+    outcome in one transaction. sink raises to report a failed delivery;
+    the event is retried after backoff() until MAX_ATTEMPTS, then marked dead.
+    Returns counts of claimed, delivered, retried and dead events.
+    '''
+    cur = conn.cursor()
+    cur.execute(CLAIM_SQL, (batch_size,))
+    rows = cur.fetchall()
+
+    delivered: List[int] = []
+    failed: List[Tuple[int, int, float, str]] = []
+    for event_id, event_type, partner_id, payload, attempts, created_at in rows:
+        try:
+            sink({
+                'id': event_id,
+                'type': event_type,
+                'partner_id': partner_id,
+                'payload': payload,
+                'created_at': created_at.isoformat(),
+            })
+        except Exception as exc:
+            error = '%s: %s' % (type(exc).__name__, exc)
+            failed.append((event_id, attempts + 1, backoff(attempts + 1), error[:1000]))
+        else:
+            delivered.append(event_id)
+
+    if delivered:
+        cur.execute(
+            '''
+            UPDATE {schema}.outbox
+            SET status = 'delivered', attempts = attempts + 1, delivered_at = CURRENT_TIMESTAMP, last_error = NULL
+            WHERE id = ANY(%s)
+            '''.format(schema=SCHEMA),
+            (delivered,)
+        )
+    if failed:
+        from psycopg2.extras import execute_values
+        execute_values(
+            cur,
+            '''
+            UPDATE {schema}.outbox o
+            SET attempts = v.attempts,
+                last_error = v.error,
+                available_at = CURRENT_TIMESTAMP + v.delay * INTERVAL '1 second',
+                status = CASE WHEN v.attempts >= {max_attempts} THEN 'dead' ELSE 'pending' END
+            FROM (VALUES %s) AS v(id, attempts, delay, error)
+            WHERE o.id = v.id
+            '''.format(schema=SCHEMA, max_attempts=MAX_ATTEMPTS),
+            failed,
+            template='(%s::bigint, %s::integer, %s::float8, %s)',
+            page_size=len(failed)
+        )
+    conn.commit()
+    cur.close()
+
+    dead = sum(1 for _, attempts, _, _ in failed if attempts >= MAX_ATTEMPTS)
+    return {'claimed': len(rows), 'delivered': len(delivered), 'retried': len(failed) - dead, 'dead': dead}
+
+
+def purge_delivered(conn: Any, keep_days: int) -> int:
+    '''Delete events delivered more than keep_days ago; returns how many.'''
+    cur = conn.cursor()
+    cur.execute(
+        '''
+        DELETE FROM {schema}.outbox
+        WHERE status = 'delivered' AND delivered_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        '''.format(schema=SCHEMA),
+        (keep_days,)
+    )
+    purged = cur.rowcount
+    conn.commit()
+    cur.close()
+    return purged
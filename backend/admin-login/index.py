@@ -5,95 +5,61 @@ Args: event - dict с httpMethod, body (email, password)
 Returns: HTTP response с токеном или ошибкой
 '''
 
-import json
-import os
 from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import bcrypt
+import db
+import hashers
+import queries
+import ratelimit
+import web
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    # CORS preflight
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    body_data = json.loads(event.get('body', '{}'))
-    email = body_data.get('email', '').strip()
-    password = body_data.get('password', '')
+def upgrade_password_hash(admin_id: int, old_hash: str, password: str) -> None:
+    '''Пересчёт хеша текущей схемой; хеширование выполняется до получения соединения'''
+    new_hash = hashers.hash_password(password)
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        queries.execute(cursor, queries.ADMIN_REHASH, (new_hash, admin_id, old_hash))
+        conn.commit()
+        cursor.close()
+
+def login(request: web.Request) -> Dict[str, Any]:
+    body_data = request.json()
+    if not isinstance(body_data, dict):
+        raise web.HttpError(400, 'Неверный формат запроса')
+    email = str(body_data.get('email') or '').strip()
+    password = str(body_data.get('password') or '')
     
+    # Проверка входных данных до обращения к БД
     if not email or not password:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Email и пароль обязательны'})
-        }
+        raise web.HttpError(400, 'Email и пароль обязательны')
     
-    # Подключение к БД
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    # Ограничение частоты попыток по IP и email до поиска и проверки пароля
+    ratelimit.check('admin_login', request.client_ip(), email)
     
     # Поиск администратора
-    cursor.execute(
-        "SELECT id, email, password_hash, name FROM t_p62408730_traffic_partnership.admins WHERE email = %s",
-        (email,)
-    )
-    admin = cursor.fetchone()
-    
-    cursor.close()
-    conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        admin = queries.fetch_one(cursor, queries.ADMIN_LOGIN, (email,))
+        cursor.close()
     
     if not admin:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Неверный email или пароль'})
-        }
+        return web.error(401, 'Неверный email или пароль')
     
-    # Проверка пароля
-    password_bytes = password.encode('utf-8')
-    hash_bytes = admin['password_hash'].encode('utf-8')
+    # Проверка пароля (соединение уже возвращено в пул)
+    if not hashers.verify_password(password, admin.password_hash):
+        return web.error(401, 'Неверный email или пароль')
     
-    if not bcrypt.checkpw(password_bytes, hash_bytes):
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Неверный email или пароль'})
-        }
+    if hashers.needs_rehash(admin.password_hash):
+        upgrade_password_hash(admin.id, admin.password_hash, password)
     
     # Успешный вход
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'success': True,
-            'admin': {
-                'id': admin['id'],
-                'email': admin['email'],
-                'name': admin['name']
-            }
-        })
-    }
+    return web.json_response(200, {
+        'success': True,
+        'admin': {
+            'id': admin.id,
+            'email': admin.email,
+            'name': admin.name
+        }
+    })
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return web.dispatch(event, context, {'POST': login})
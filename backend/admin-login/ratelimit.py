@@ -0,0 +1,159 @@
+'''
+Token-bucket rate limiting for the login and registration endpoints, keyed
+by client IP and by email. Each limit is a bucket of `capacity` attempts
+that refills at capacity/period per second.
+Every container keeps its own buckets in memory: once a local bucket is
+empty the request is refused without touching the database. Otherwise the
+attempt is taken from the shared bucket in the UNLOGGED rate_limits table,
+refilled and consumed by one upsert, so the limit holds across containers.
+A refusal raises HttpError 429 with Retry-After before any password hashing
+or write of the endpoint itself. Keys are stored as digests, not as emails
+or addresses. RATELIMIT=0 turns limiting off (e.g. for load tests).
+Vendored into every function that limits requests.
+'''
+
+import hashlib
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Tuple
+
+import db
+import web
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+ENABLED = os.environ.get('RATELIMIT', '1') != '0'
+LOCAL_KEYS = 10000
+# Share of shared-bucket updates that also drop buckets idle for a day
+# (longer than any of them takes to refill)
+PURGE_PROBABILITY = 0.01
+
+
+class Limit(NamedTuple):
+    capacity: float
+    rate: float
+
+
+def _limit(name: str, default: str) -> Limit:
+    '''Limit from "<attempts>/<seconds>", e.g. 10/900 is ten attempts per 15 minutes.'''
+    capacity, period = os.environ.get(name, default).split('/')
+    return Limit(float(capacity), float(capacity) / float(period))
+
+
+LIMITS: Dict[str, Dict[str, Limit]] = {
+    'login': {
+        'ip': _limit('RATELIMIT_LOGIN_IP', '30/60'),
+        'email': _limit('RATELIMIT_LOGIN_EMAIL', '10/900'),
+    },
+    'admin_login': {
+        'ip': _limit('RATELIMIT_ADMIN_LOGIN_IP', '10/60'),
+        'email': _limit('RATELIMIT_ADMIN_LOGIN_EMAIL', '5/900'),
+    },
+    'register': {
+        'ip': _limit('RATELIMIT_REGISTER_IP', '5/3600'),
+        'email': _limit('RATELIMIT_REGISTER_EMAIL', '3/86400'),
+    },
+}
+
+ROW_TEMPLATE = '(%s, %s::float8, %s::float8, %s::float8 - 1, CURRENT_TIMESTAMP)'
+
+# Tokens of an existing bucket after refilling it for the time since its last update
+REFILL = 'LEAST(EXCLUDED.capacity, b.tokens + EXTRACT(EPOCH FROM EXCLUDED.updated_at - b.updated_at) * EXCLUDED.rate)'
+
+# A new bucket starts full minus this attempt; an existing one is only
+# updated, and its key returned, when it holds a whole token
+TAKE_SQL = '''
+    INSERT INTO {schema}.rate_limits AS b (key, capacity, rate, tokens, updated_at)
+    VALUES {{rows}}
+    ON CONFLICT (key) DO UPDATE
+    SET tokens = {refill} - 1, capacity = EXCLUDED.capacity, rate = EXCLUDED.rate, updated_at = EXCLUDED.updated_at
+    WHERE {refill} >= 1
+    RETURNING key
+'''.format(schema=SCHEMA, refill=REFILL)
+
+PURGE_SQL = '''
+    DELETE FROM {schema}.rate_limits WHERE updated_at < CURRENT_TIMESTAMP - INTERVAL '1 day'
+'''.format(schema=SCHEMA)
+
+# key -> (tokens, monotonic time of the last update)
+_local: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _key(scope: str, kind: str, value: str) -> str:
+    digest = hashlib.sha256(value.strip().lower().encode('utf-8')).hexdigest()[:32]
+    return '%s:%s:%s' % (scope, kind, digest)
+
+
+def _refilled(key: str, limit: Limit, now: float) -> float:
+    tokens, updated = _local.get(key, (limit.capacity, now))
+    return min(limit.capacity, tokens + (now - updated) * limit.rate)
+
+
+def _take_local(buckets: List[Tuple[str, Limit]]) -> float:
+    '''Take one token from every local bucket, or none; returns 0 or the seconds to wait.'''
+    now = time.monotonic()
+    with _local_lock:
+        tokens = [_refilled(key, limit, now) for key, limit in buckets]
+        wait = max((1 - have) / limit.rate for have, (_, limit) in zip(tokens, buckets))
+        spend = 1 if wait <= 0 else 0
+        for have, (key, _) in zip(tokens, buckets):
+            _local[key] = (have - spend, now)
+            _local.move_to_end(key)
+        while len(_local) > LOCAL_KEYS:
+            _local.popitem(last=False)
+    return max(wait, 0.0)
+
+
+def _drain_local(keys: List[str]) -> None:
+    '''Empty local buckets the shared state refused, so retries stop here.'''
+    now = time.monotonic()
+    with _local_lock:
+        for key in keys:
+            _local[key] = (0.0, now)
+
+
+def _take_shared(buckets: List[Tuple[str, Limit]]) -> List[str]:
+    '''Take one token from each shared bucket that has one; returns the refused keys.'''
+    args: List[object] = []
+    for key, limit in buckets:
+        args.extend((key, limit.capacity, limit.rate, limit.capacity))
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(TAKE_SQL.format(rows=', '.join([ROW_TEMPLATE] * len(buckets))), args)
+        taken = {row[0] for row in cur.fetchall()}
+        if random.random() < PURGE_PROBABILITY:
+            cur.execute(PURGE_SQL)
+        conn.commit()
+        cur.close()
+    return [key for key, _ in buckets if key not in taken]
+
+
+def _refuse(wait: float) -> web.HttpError:
+    retry_after = max(1, int(math.ceil(wait)))
+    return web.HttpError(429, 'Слишком много попыток. Повторите позже.', {
+        'Retry-After': str(retry_after),
+        'Access-Control-Expose-Headers': 'Retry-After'
+    }, retry_after=retry_after)
+
+
+def check(scope: str, ip: str, email: str) -> None:
+    '''Count one attempt of scope ("login", "admin_login", "register"); raises HttpError 429 over the limit.'''
+    if not ENABLED:
+        return
+    limits = LIMITS[scope]
+    buckets = [(_key(scope, kind, value), limits[kind]) for kind, value in (('ip', ip), ('email', email)) if value]
+    if not buckets:
+        return
+    wait = _take_local(buckets)
+    if wait > 0:
+        raise _refuse(wait)
+    refused = _take_shared(buckets)
+    if refused:
+        _drain_local(refused)
+        rates = dict(buckets)
+        raise _refuse(max(1 / rates[key].rate for key in refused))
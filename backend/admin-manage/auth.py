@@ -0,0 +1,133 @@
+'''
+Session tokens issued by auth-login and verified by the other functions.
+Only the SHA-256 of a token is stored. Verified identities are kept in a
+bounded in-process TTL/LRU cache, so a warm container authorizes repeat
+requests without a database round trip. Revocations made in another
+container become visible once the cached entry expires (AUTH_CACHE_TTL).
+'''
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import db
+import queries
+
+SESSION_TTL_HOURS = int(os.environ.get('SESSION_TTL_HOURS', '168'))
+CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '1024'))
+
+
+class Identity(NamedTuple):
+    partner_id: int
+    email: str
+    is_admin: bool
+
+
+class IdentityCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token_hash: str) -> Optional[Identity]:
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[token_hash]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token_hash)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token_hash: str, identity: Identity, session_remaining: Optional[float] = None) -> None:
+        ttl = self.ttl if session_remaining is None else min(self.ttl, max(session_remaining, 0.0))
+        deadline = time.monotonic() + ttl
+        with self._lock:
+            self._entries[token_hash] = (identity, deadline)
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_partner(self, partner_id: Any) -> None:
+        self.invalidate_partners([partner_id])
+
+    def invalidate_partners(self, partner_ids: Iterable[Any]) -> None:
+        ids = {str(partner_id) for partner_id in partner_ids}
+        with self._lock:
+            for token_hash in [k for k, v in self._entries.items() if str(v[0].partner_id) in ids]:
+                del self._entries[token_hash]
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+_cache = IdentityCache()
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def token_from_event(event: Dict[str, Any]) -> str:
+    headers = event.get('headers') or {}
+    token = headers.get('x-auth-token') or headers.get('X-Auth-Token') or ''
+    if not token:
+        authorization = headers.get('authorization') or headers.get('Authorization') or ''
+        if authorization.lower().startswith('bearer '):
+            token = authorization[7:]
+    return token.strip()
+
+
+def create_session(cur: Any, partner_id: int) -> str:
+    '''Persist a new session for partner_id in the caller's transaction; returns the raw token.'''
+    token = secrets.token_urlsafe(32)
+    queries.execute(cur, queries.SESSION_PURGE_EXPIRED, (partner_id,))
+    queries.execute(cur, queries.SESSION_INSERT, (hash_token(token), partner_id, SESSION_TTL_HOURS))
+    return token
+
+
+def authenticate(token: str) -> Optional[Identity]:
+    '''Identity of an approved partner for a live session token, or None.'''
+    if not token:
+        return None
+    token_hash = hash_token(token)
+    identity = _cache.get(token_hash)
+    if identity is not None:
+        return identity
+
+    with db.connection() as conn:
+        cur = conn.cursor()
+        row = queries.fetch_one(cur, queries.SESSION_IDENTITY, (token_hash,))
+        cur.close()
+
+    if not row:
+        return None
+    identity = Identity(row.partner_id, row.email, bool(row.is_admin))
+    _cache.put(token_hash, identity, float(row.expires_in))
+    return identity
+
+
+def revoke_partner_sessions(cur: Any, partner_id: Any) -> None:
+    '''Delete every session of partner_id (caller commits) and drop it from this container's cache.'''
+    queries.execute(cur, queries.SESSIONS_REVOKE, (partner_id,))
+    _cache.invalidate_partner(partner_id)
+
+
+def revoke_sessions(cur: Any, partner_ids: List[Any]) -> None:
+    '''revoke_partner_sessions() for several partners in one statement.'''
+    queries.execute(cur, queries.SESSIONS_REVOKE_MANY, (list(partner_ids),))
+    _cache.invalidate_partners(partner_ids)
+
+
+def cache_stats() -> Dict[str, int]:
+    return _cache.stats()
@@ -0,0 +1,98 @@
+'''
+Set-based statements behind the batch variants of admin-manage POST and PUT.
+Each batch is one statement per step over a VALUES list, inside the caller's
+transaction; the caller validates the items and reports per-item results.
+'''
+
+from typing import Any, Dict, List, Set, Tuple
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+MAX_BATCH = 500
+
+
+def approve_partners(cur: Any, approvals: List[Tuple[int, str]]) -> Dict[int, Dict[str, Any]]:
+    '''Approve (partner_id, password_hash) pairs; returns the updated partners by id.'''
+    from psycopg2.extras import execute_values
+    rows = execute_values(
+        cur,
+        '''
+        UPDATE {schema}.partners p
+        SET is_approved = true, password_hash = v.password_hash, updated_at = CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v(id, password_hash)
+        WHERE p.id = v.id
+        RETURNING p.id, p.name, p.email
+        '''.format(schema=SCHEMA),
+        approvals,
+        template='(%s::integer, %s)',
+        page_size=max(len(approvals), 1),
+        fetch=True
+    )
+    return {row['id']: dict(row) for row in rows}
+
+
+def partners_with_leads(cur: Any, partner_ids: List[int]) -> Set[int]:
+    '''
+    Partners that still have leads, live or archived. leads_archive has no
+    foreign key to partners, so only this check keeps its rows from orphaning.
+    '''
+    cur.execute(
+        '''
+        SELECT partner_id FROM {schema}.leads WHERE partner_id = ANY(%s)
+        UNION
+        SELECT partner_id FROM {schema}.leads_archive WHERE partner_id = ANY(%s)
+        '''.format(schema=SCHEMA),
+        (partner_ids, partner_ids)
+    )
+    return {row['partner_id'] for row in cur.fetchall()}
+
+
+def delete_partners(cur: Any, partner_ids: List[int]) -> Set[int]:
+    '''Delete partners, leaving tombstones for since= readers; returns the ids that existed.'''
+    cur.execute(
+        '''
+        WITH deleted AS (
+            DELETE FROM {schema}.partners WHERE id = ANY(%s) RETURNING id
+        )
+        INSERT INTO {schema}.partner_tombstones (partner_id)
+        SELECT id FROM deleted
+        ON CONFLICT (partner_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at
+        RETURNING partner_id AS id
+        '''.format(schema=SCHEMA),
+        (partner_ids,)
+    )
+    return {row['id'] for row in cur.fetchall()}
+
+
+def update_leads(cur: Any, changes: List[Tuple[int, str, Any]]) -> List[Dict[str, Any]]:
+    '''
+    Set (lead_id, status, commission_amount) on each lead; returns the updated
+    rows with their previous status and commission for the partner_stats
+    deltas. Rows are locked in id order so that overlapping batches cannot
+    deadlock.
+    '''
+    from psycopg2.extras import execute_values
+    return execute_values(
+        cur,
+        '''
+        WITH changes (id, status, commission_amount) AS (VALUES %s),
+        previous AS (
+            SELECT l.id, l.status, l.commission_amount
+            FROM {schema}.leads l
+            JOIN changes c ON c.id = l.id
+            ORDER BY l.id
+            FOR UPDATE OF l
+        )
+        UPDATE {schema}.leads l
+        SET status = c.status, commission_amount = c.commission_amount, updated_at = CURRENT_TIMESTAMP
+        FROM changes c
+        JOIN previous ON previous.id = c.id
+        WHERE l.id = c.id
+        RETURNING l.*, previous.status AS previous_status,
+                  previous.commission_amount AS previous_commission
+        '''.format(schema=SCHEMA),
+        changes,
+        template='(%s::integer, %s::varchar, %s::numeric)',
+        page_size=max(len(changes), 1),
+        fetch=True
+    )
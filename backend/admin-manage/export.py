@@ -0,0 +1,141 @@
+'''
+Streaming export of leads and partners as CSV or NDJSON.
+Rows are read through a server-side (named) cursor in batches and encoded
+straight into a binary sink, optionally gzip-compressed, so memory use does
+not depend on the table size. A function response is one buffered body, so
+the handler writes into a BoundedBuffer of MAX_RESPONSE_BYTES and larger
+exports go through scripts/export_admin_data.py.
+'''
+
+import csv
+import gzip
+import io
+import json
+import os
+from contextlib import closing
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, BinaryIO, Iterator, List, Sequence, Tuple
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+BATCH_SIZE = 2000
+
+# Largest export (after gzip, before base64) the handler returns
+MAX_RESPONSE_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(3 * 1024 * 1024)))
+
+# The export covers full history: live leads and the archived ones (V0011)
+LEAD_COLUMNS = ('id, partner_id, client_name, client_phone, client_email, project_address, estimate_amount, '
+                'status, commission_amount, notes, created_at, updated_at')
+
+QUERIES = {
+    'leads': '''
+        SELECT l.id, l.partner_id, p.name AS partner_name, p.email AS partner_email,
+               l.client_name, l.client_phone, l.client_email, l.project_address,
+               l.estimate_amount, l.status, l.commission_amount, l.notes,
+               l.created_at, l.updated_at
+        FROM (
+            SELECT {lead_columns} FROM {schema}.leads
+            UNION ALL
+            SELECT {lead_columns} FROM {schema}.leads_archive
+        ) l
+        JOIN {schema}.partners p ON l.partner_id = p.id
+        ORDER BY l.created_at DESC, l.id DESC
+    '''.format(schema=SCHEMA, lead_columns=LEAD_COLUMNS),
+    'partners': '''
+        SELECT id, name, email, phone, traffic_source, experience, created_at, is_approved
+        FROM {schema}.partners
+        ORDER BY created_at DESC, id DESC
+    '''.format(schema=SCHEMA),
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+class BoundedBuffer(io.BytesIO):
+    '''In-memory sink that raises ExportTooLarge instead of growing past limit bytes.'''
+
+    def __init__(self, limit: int) -> None:
+        super().__init__()
+        self.limit = limit
+
+    def write(self, data: Any) -> int:
+        if self.tell() + len(data) > self.limit:
+            raise ExportTooLarge(self.limit)
+        return super().write(data)
+
+
+def to_text(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def iter_batches(conn: Any, sql: str, batch_size: int = BATCH_SIZE) -> Iterator[Tuple[List[str], Sequence[tuple]]]:
+    '''Yield (columns, rows) batches from a named cursor; the caller owns the transaction.'''
+    cur = conn.cursor(name='export_cursor')
+    cur.itersize = batch_size
+    try:
+        cur.execute(sql)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = [column[0] for column in cur.description]
+            yield columns, rows
+    finally:
+        cur.close()
+
+
+def write_csv(batches: Iterator[Tuple[List[str], Sequence[tuple]]], out: BinaryIO) -> int:
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    count = 0
+    header_written = False
+    for columns, rows in batches:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows([to_text(value) for value in row] for row in rows)
+        count += len(rows)
+    text.detach()
+    return count
+
+
+def write_ndjson(batches: Iterator[Tuple[List[str], Sequence[tuple]]], out: BinaryIO) -> int:
+    count = 0
+    for columns, rows in batches:
+        chunk = ''.join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=to_text) + '\n'
+            for row in rows
+        )
+        out.write(chunk.encode('utf-8'))
+        count += len(rows)
+    return count
+
+
+WRITERS = {
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+}
+
+
+def export(conn: Any, entity: str, fmt: str, out: BinaryIO, compress: bool = False,
+           batch_size: int = BATCH_SIZE) -> int:
+    '''Write all rows of entity to out; returns the number of rows written.'''
+    batches = iter_batches(conn, QUERIES[entity], batch_size)
+    # Closes the named cursor while its transaction is still open, also when the sink gives up
+    with closing(batches):
+        if not compress:
+            return WRITERS[fmt](batches, out)
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6) as gz:
+            return WRITERS[fmt](batches, gz)
@@ -5,209 +5,474 @@ Args: event - dict с httpMethod, body, queryStringParameters
 Returns: HTTP response с данными или результатом операции
 '''
 
-import json
-import os
-from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import bcrypt
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Set, Tuple
+import db
+import hashers
+import auth
+import outbox
+import partner_stats
+import queries
+import web
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    # CORS preflight
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    # Подключение к БД
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    # GET - получить всех партнёров и лиды
-    if method == 'GET':
-        action = event.get('queryStringParameters', {}).get('action', 'partners')
+LIST_ACTIONS = ('partners', 'leads')
+
+# Пределы столбцов leads: status VARCHAR(50), commission_amount DECIMAL(12, 2)
+STATUS_MAX_LENGTH = 50
+AMOUNT_LIMIT = Decimal(10) ** 10
+
+# Поля, доступные в параметре fields=, и их выражения в запросе списка
+LIST_FIELDS = {
+    'partners': {name: name for name in (
+        'id', 'name', 'email', 'phone', 'traffic_source', 'experience', 'created_at', 'is_approved'
+    )},
+    'leads': dict(
+        {name: 'l.' + name for name in (
+            'id', 'partner_id', 'client_name', 'client_phone', 'client_email', 'project_address',
+            'estimate_amount', 'status', 'commission_amount', 'notes',
+            'created_at', 'updated_at', 'client_phone_normalized'
+        )},
+        partner_name='p.name AS partner_name',
+        partner_email='p.email AS partner_email'
+    ),
+}
+
+def dict_cursor(conn: Any) -> Any:
+    # psycopg2.extras грузится только на путях, которые работают с БД
+    from psycopg2.extras import RealDictCursor
+    return conn.cursor(cursor_factory=RealDictCursor)
+
+def body_object(request: web.Request) -> Dict[str, Any]:
+    body_data = request.json()
+    if not isinstance(body_data, dict):
+        raise web.HttpError(400, 'Неверный формат запроса')
+    return body_data
+
+def export_data(action: str, export_format: str, compress: bool) -> Dict[str, Any]:
+    '''
+    Выгрузка CSV/NDJSON: строки читаются серверным курсором пачками.
+    Ответ функции собирается в памяти целиком, поэтому выгрузка ограничена
+    export.MAX_RESPONSE_BYTES (EXPORT_MAX_BYTES, по умолчанию 3 МБ после gzip):
+    больше - 413, такие выгрузки делает scripts/export_admin_data.py.
+    '''
+    import base64
+    import export
+    sink = export.BoundedBuffer(export.MAX_RESPONSE_BYTES)
+    try:
+        with db.connection() as conn:
+            export.export(conn, action, export_format, sink, compress=compress)
+    except export.ExportTooLarge:
+        raise web.HttpError(413, 'Выгрузка больше %d байт: используйте gzip=1 или scripts/export_admin_data.py'
+                            % export.MAX_RESPONSE_BYTES)
+    data = sink.getvalue()
+    
+    filename = '%s.%s%s' % (action, export_format, '.gz' if compress else '')
+    return web.response(
+        200,
+        base64.b64encode(data).decode('ascii') if compress else data.decode('utf-8'),
+        {
+            'Content-Type': 'application/gzip' if compress else export.FORMATS[export_format],
+            'Content-Disposition': 'attachment; filename="%s"' % filename
+        },
+        is_base64=compress
+    )
+
+# GET - получить всех партнёров и лиды
+def list_data(request: web.Request) -> Dict[str, Any]:
+    action = request.query.get('action', 'partners')
+    export_format = request.query.get('format')
+    
+    # format=compact - это форма ответа списка, а не выгрузка
+    if export_format and not web.is_compact(request):
+        import export
+        if export_format not in export.FORMATS or action not in export.QUERIES:
+            raise web.HttpError(400, 'Неизвестный формат или тип выгрузки')
+        return export_data(action, export_format, request.query.get('gzip') in ('1', 'true'))
+    
+    if action not in LIST_ACTIONS:
+        raise web.HttpError(400, 'Неизвестное действие')
+    
+    if 'q' in request.query:
+        return search_data(request, action)
+    
+    # С fields= из БД читаются только запрошенные столбцы
+    fields = LIST_FIELDS[action]
+    selected = web.select_fields(request, list(fields))
+    names = selected or list(fields)
+    columns = ', '.join(fields[name] for name in names)
+    
+    with db.connection() as conn:
+        # Строки-кортежи: в компактном формате они уходят в ответ без копирования
+        cursor = conn.cursor()
         
         if action == 'partners':
             cursor.execute("""
-                SELECT id, name, email, phone, traffic_source, experience, 
-                       created_at, is_approved
+                SELECT """ + columns + """
                 FROM t_p62408730_traffic_partnership.partners
                 ORDER BY created_at DESC
             """)
-            partners = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'partners': [dict(p) for p in partners]}, default=str)
-            }
-        
-        elif action == 'leads':
+        else:
+            # Читаются только секции лидов начиная с date_from (по умолчанию последние месяцы)
             cursor.execute("""
-                SELECT l.*, p.name as partner_name, p.email as partner_email
+                SELECT """ + columns + """
                 FROM t_p62408730_traffic_partnership.leads l
                 JOIN t_p62408730_traffic_partnership.partners p ON l.partner_id = p.id
+                WHERE l.created_at >= %s
                 ORDER BY l.created_at DESC
-            """)
-            leads = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'leads': [dict(l) for l in leads]}, default=str)
-            }
-    
-    # POST - одобрить партнёра
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        action = body_data.get('action')
-        
-        if action == 'approve':
-            partner_id = body_data.get('partner_id')
-            password = body_data.get('password', '')
-            
-            if not partner_id or not password or len(password) < 6:
-                cursor.close()
-                conn.close()
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'ID партнёра и пароль (минимум 6 символов) обязательны'})
-                }
+            """, (leads_since(request),))
+        rows = cursor.fetchall()
+        cursor.close()
+    
+    return web.json_response(200, {action: web.rows_payload(request, rows, names)})
+
+def leads_since(request: web.Request) -> datetime:
+    import partitions
+    value = request.query.get('date_from')
+    if not value:
+        return partitions.recent_cutoff()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise web.HttpError(400, 'date_from должен быть датой в формате ISO')
+
+def int_param(request: web.Request, name: str, default: int, maximum: int) -> int:
+    try:
+        value = int(request.query.get(name) or default)
+    except ValueError:
+        raise web.HttpError(400, 'Параметр %s должен быть числом' % name)
+    return max(0, min(value, maximum))
+
+# GET с q - поиск по подстроке и с опечатками, результаты по релевантности
+def search_data(request: web.Request, action: str) -> Dict[str, Any]:
+    import search
+    q = ' '.join(request.query.get('q', '').split())
+    if len(q) < search.MIN_QUERY_LENGTH:
+        raise web.HttpError(400, 'Введите не менее %d символов для поиска' % search.MIN_QUERY_LENGTH)
+    limit = max(1, int_param(request, 'limit', search.DEFAULT_LIMIT, search.MAX_LIMIT))
+    offset = int_param(request, 'offset', 0, search.MAX_OFFSET)
+    
+    with db.connection() as conn:
+        cursor = dict_cursor(conn)
+        since = leads_since(request) if action == 'leads' else None
+        rows, has_more = search.search(cursor, action, q, limit, offset, since)
+        cursor.close()
+    
+    return web.json_response(200, {
+        action: rows,
+        'has_more': has_more,
+        'next_offset': offset + len(rows) if has_more else None
+    })
+
+# POST - одобрить или отклонить партнёра
+def manage_partner(request: web.Request) -> Dict[str, Any]:
+    body_data = body_object(request)
+    action = body_data.get('action')
+    partner_id = body_data.get('partner_id')
+    
+    if 'partners' in body_data or 'partner_ids' in body_data:
+        return manage_partners_batch(body_data)
+    
+    if action == 'approve':
+        password = body_data.get('password', '')
+        
+        if not partner_id or not password or len(password) < 6:
+            raise web.HttpError(400, 'ID партнёра и пароль (минимум 6 символов) обязательны')
+        
+        # Хешируем пароль до получения соединения из пула
+        password_hash = hashers.hash_password(password)
+        
+        with db.connection() as conn:
+            cursor = dict_cursor(conn)
             
-            # Хешируем пароль
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            # Старые сессии партнёра больше недействительны
+            auth.revoke_partner_sessions(cursor, partner_id)
             
             # Обновляем партнёра
-            cursor.execute("""
-                UPDATE t_p62408730_traffic_partnership.partners
-                SET is_approved = true, password_hash = %s
-                WHERE id = %s
-                RETURNING id, name, email
-            """, (password_hash, partner_id))
-            
-            partner = cursor.fetchone()
+            partner = queries.fetch_one(cursor, queries.PARTNER_APPROVE, (password_hash, partner_id))
+            # Уведомление партнёру уходит через outbox; пароль в событие и в ответ не попадает
+            if partner:
+                partner = partner._asdict()
+                outbox.enqueue(cursor, [outbox.partner_approved(partner)])
             conn.commit()
             cursor.close()
-            conn.close()
-            
-            if not partner:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Партнёр не найден'})
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({
-                    'success': True,
-                    'partner': dict(partner),
-                    'password': password
-                })
-            }
-        
-        elif action == 'reject':
-            partner_id = body_data.get('partner_id')
-            
-            cursor.execute("""
-                DELETE FROM t_p62408730_traffic_partnership.partners
-                WHERE id = %s
-                RETURNING id
-            """, (partner_id,))
+        
+        if not partner:
+            return web.error(404, 'Партнёр не найден')
+        
+        return web.json_response(200, {
+            'success': True,
+            'partner': partner
+        })
+    
+    if action == 'reject':
+        import batch
+        partner_id = item_id(body_data, 'partner_id')
+        if not partner_id:
+            raise web.HttpError(400, 'ID партнёра обязателен')
+        
+        with db.connection() as conn:
+            cursor = dict_cursor(conn)
             
-            deleted = cursor.fetchone()
+            # Та же проверка, что в пакетном отклонении: лиды, в том числе архивные, держат партнёра
+            blocked = batch.partners_with_leads(cursor, [partner_id])
+            deleted = None
+            if not blocked:
+                auth.revoke_partner_sessions(cursor, partner_id)
+                deleted = queries.fetch_one(cursor, queries.PARTNER_DELETE, (partner_id,))
             conn.commit()
             cursor.close()
-            conn.close()
-            
-            if not deleted:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Партнёр не найден'})
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'success': True})
-            }
-    
-    # PUT - изменить статус лида
-    if method == 'PUT':
-        body_data = json.loads(event.get('body', '{}'))
-        lead_id = body_data.get('lead_id')
-        status = body_data.get('status')
-        commission = body_data.get('commission_amount')
-        
-        if not lead_id or not status:
-            cursor.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'error': 'ID лида и статус обязательны'})
-            }
         
+        if blocked:
+            return web.error(409, 'У партнёра есть лиды')
+        if not deleted:
+            return web.error(404, 'Партнёр не найден')
+        
+        return web.json_response(200, {'success': True})
+    
+    raise web.HttpError(400, 'Неизвестное действие')
+
+def batch_items(body_data: Dict[str, Any], key: str) -> List[Any]:
+    import batch
+    items = body_data.get(key)
+    if not isinstance(items, list) or not items:
+        raise web.HttpError(400, 'Поле %s должно быть непустым списком' % key)
+    if len(items) > batch.MAX_BATCH:
+        raise web.HttpError(400, 'Не более %d элементов за один запрос' % batch.MAX_BATCH)
+    return items
+
+def item_id(item: Any, key: str) -> Optional[int]:
+    value = item.get(key) if isinstance(item, dict) else item
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def batch_response(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    failed = sum(1 for result in results if not result['success'])
+    return web.json_response(200, {
+        'success': True,
+        'processed': len(results) - failed,
+        'failed': failed,
+        'results': results
+    })
+
+# POST со списком - одобрить или отклонить партнёров пакетом в одной транзакции.
+# Ошибки отдельных элементов не отменяют остальные: результат по каждому в results
+def manage_partners_batch(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    import batch
+    action = body_data.get('action')
+    
+    if action == 'approve':
+        items = batch_items(body_data, 'partners')
+        results: List[Dict[str, Any]] = []
+        pending: Dict[int, Dict[str, Any]] = {}
+        passwords: List[str] = []
+        for item in items:
+            partner_id = item_id(item, 'partner_id')
+            password = item.get('password') if isinstance(item, dict) else None
+            result: Dict[str, Any] = {'partner_id': partner_id, 'success': False}
+            results.append(result)
+            if not partner_id or not isinstance(password, str) or len(password) < 6:
+                result['error'] = 'ID партнёра и пароль (минимум 6 символов) обязательны'
+            elif partner_id in pending:
+                result['error'] = 'Партнёр повторяется в запросе'
+            else:
+                pending[partner_id] = result
+                passwords.append(password)
+        
+        # Хеши считаются параллельно и до получения соединения из пула
+        hashes = hashers.hash_passwords(passwords)
+        
+        approved: Dict[int, Dict[str, Any]] = {}
+        if pending:
+            with db.connection() as conn:
+                cursor = dict_cursor(conn)
+                auth.revoke_sessions(cursor, list(pending))
+                approved = batch.approve_partners(cursor, list(zip(pending, hashes)))
+                outbox.enqueue(cursor, [outbox.partner_approved(partner) for partner in approved.values()])
+                conn.commit()
+                cursor.close()
+        
+        for partner_id, result in pending.items():
+            if partner_id in approved:
+                result.update(success=True, partner=approved[partner_id])
+            else:
+                result['error'] = 'Партнёр не найден'
+        return batch_response(results)
+    
+    if action == 'reject':
+        items = batch_items(body_data, 'partner_ids')
+        results = []
+        pending = {}
+        for item in items:
+            partner_id = item_id(item, 'partner_id')
+            result = {'partner_id': partner_id, 'success': False}
+            results.append(result)
+            if not partner_id:
+                result['error'] = 'ID партнёра обязателен'
+            elif partner_id in pending:
+                result['error'] = 'Партнёр повторяется в запросе'
+            else:
+                pending[partner_id] = result
+        
+        blocked: Set[int] = set()
+        deleted: Set[int] = set()
+        if pending:
+            with db.connection() as conn:
+                cursor = dict_cursor(conn)
+                # Партнёра с лидами, в том числе архивными, не удаляем; он не должен сорвать весь пакет
+                blocked = batch.partners_with_leads(cursor, list(pending))
+                removable = [partner_id for partner_id in pending if partner_id not in blocked]
+                if removable:
+                    auth.revoke_sessions(cursor, removable)
+                    deleted = batch.delete_partners(cursor, removable)
+                conn.commit()
+                cursor.close()
+        
+        for partner_id, result in pending.items():
+            if partner_id in deleted:
+                result['success'] = True
+            elif partner_id in blocked:
+                result['error'] = 'У партнёра есть лиды'
+            else:
+                result['error'] = 'Партнёр не найден'
+        return batch_response(results)
+    
+    raise web.HttpError(400, 'Неизвестное действие')
+
+# PUT - изменить статус лида
+def update_lead(request: web.Request) -> Dict[str, Any]:
+    body_data = body_object(request)
+    
+    if 'leads' in body_data:
+        return update_leads_batch(body_data)
+    lead_id = item_id(body_data, 'lead_id')
+    status = body_data.get('status')
+    commission = body_data.get('commission_amount')
+    
+    # Те же проверки, что у элементов пакета: переполнение столбца не должно стать ответом 500
+    error = lead_change_error(lead_id, status, commission)
+    if error:
+        raise web.HttpError(400, error)
+    
+    with db.connection() as conn:
+        cursor = dict_cursor(conn)
+        
+        # Прежние статус и комиссия нужны для обновления сводки partner_stats
         cursor.execute("""
-            UPDATE t_p62408730_traffic_partnership.leads
+            WITH previous AS (
+                SELECT id, status, commission_amount
+                FROM t_p62408730_traffic_partnership.leads
+                WHERE id = %s
+                FOR UPDATE
+            )
+            UPDATE t_p62408730_traffic_partnership.leads l
             SET status = %s, commission_amount = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-            RETURNING *
-        """, (status, commission, lead_id))
+            FROM previous
+            WHERE l.id = previous.id
+            RETURNING l.*, previous.status AS previous_status,
+                      previous.commission_amount AS previous_commission
+        """, (lead_id, status, commission))
         
         lead = cursor.fetchone()
+        if lead:
+            lead = dict(lead)
+            previous_status = lead.pop('previous_status')
+            previous_commission = lead.pop('previous_commission')
+            partner_stats.apply_lead_change(
+                cursor, lead['partner_id'], lead['created_at'],
+                previous_status, previous_commission,
+                lead['status'], lead['commission_amount']
+            )
+            # Уведомление о смене статуса доставит воркер outbox после коммита
+            outbox.enqueue(cursor, [outbox.lead_status_changed(lead, previous_status, previous_commission)])
         conn.commit()
         cursor.close()
-        conn.close()
-        
-        if not lead:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Лид не найден'})
-            }
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'success': True, 'lead': dict(lead)}, default=str)
-        }
-    
-    cursor.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'isBase64Encoded': False,
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+    
+    if not lead:
+        return web.error(404, 'Лид не найден')
+    
+    return web.json_response(200, {'success': True, 'lead': lead})
+
+# PUT со списком - изменить статусы и комиссии лидов пакетом в одной транзакции
+def update_leads_batch(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    import batch
+    items = batch_items(body_data, 'leads')
+    results: List[Dict[str, Any]] = []
+    pending: Dict[int, Dict[str, Any]] = {}
+    changes: List[Tuple[int, str, Any]] = []
+    for item in items:
+        lead_id = item_id(item, 'lead_id')
+        status = item.get('status') if isinstance(item, dict) else None
+        commission = item.get('commission_amount') if isinstance(item, dict) else None
+        result: Dict[str, Any] = {'lead_id': lead_id, 'success': False}
+        results.append(result)
+        error = lead_change_error(lead_id, status, commission)
+        if error:
+            result['error'] = error
+        elif lead_id in pending:
+            result['error'] = 'Лид повторяется в запросе'
+        else:
+            pending[lead_id] = result
+            changes.append((lead_id, status, commission))
+    
+    if changes:
+        with db.connection() as conn:
+            cursor = dict_cursor(conn)
+            updated = batch.update_leads(cursor, changes)
+            leads = {}
+            stats_changes = []
+            events = []
+            for row in updated:
+                lead = dict(row)
+                previous_status = lead.pop('previous_status')
+                previous_commission = lead.pop('previous_commission')
+                stats_changes.append((
+                    lead['partner_id'], lead['created_at'], previous_status, previous_commission,
+                    lead['status'], lead['commission_amount']
+                ))
+                events.append(outbox.lead_status_changed(lead, previous_status, previous_commission))
+                leads[lead['id']] = lead
+            # Сводки partner_stats и lead_daily_stats обновляются одной вставкой каждая на все затронутые строки
+            partner_stats.apply_lead_changes(cursor, stats_changes)
+            outbox.enqueue(cursor, events)
+            conn.commit()
+            cursor.close()
+        
+        for lead_id, result in pending.items():
+            if lead_id in leads:
+                result.update(success=True, lead=leads[lead_id])
+            else:
+                result['error'] = 'Лид не найден'
+    
+    return batch_response(results)
+
+def lead_change_error(lead_id: Optional[int], status: Any, commission: Any) -> Optional[str]:
+    '''Ошибка проверки изменения лида или None, если его можно записать.'''
+    if not lead_id or not status or not isinstance(status, str):
+        return 'ID лида и статус обязательны'
+    if len(status) > STATUS_MAX_LENGTH:
+        return 'Статус длиннее %d символов' % STATUS_MAX_LENGTH
+    if not valid_amount(commission):
+        return 'Комиссия должна быть числом меньше %s по модулю' % AMOUNT_LIMIT
+    return None
+
+def valid_amount(value: Any) -> bool:
+    '''Число, которое помещается в DECIMAL(12, 2) после округления до копеек, или None.'''
+    if value is None:
+        return True
+    if isinstance(value, bool):
+        return False
+    try:
+        amount = Decimal(str(value))
+        # Postgres округляет до двух знаков половину от нуля, как ROUND_HALF_UP
+        return amount.is_finite() and abs(amount.quantize(Decimal('0.01'), ROUND_HALF_UP)) < AMOUNT_LIMIT
+    except InvalidOperation:
+        return False
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return web.dispatch(event, context, {'GET': list_data, 'POST': manage_partner, 'PUT': update_lead},
+                        allow_headers='Content-Type, X-Admin-Id')
@@ -0,0 +1,149 @@
+'''
+Ranked substring and fuzzy search over partners and leads for the admin panel.
+Results come in two tiers, both served by the pg_trgm GIN indexes (V0009):
+
+1. exact matches - ILIKE '%q%' on the text columns, or the digits of q inside
+   the phone number (a leading 8 also as 7 at its start, see phone_prefix) -
+   newest first, score 1;
+2. fuzzy matches for typos - q <% column (word_similarity) - only queried
+   when the first tier does not fill the page, ordered by similarity among
+   the first FUZZY_CANDIDATES matching rows.
+
+Splitting the tiers keeps a common term cheap: the planner can walk the
+created_at index and stop after one page of exact matches instead of scoring
+every matching row. Pages are limit/offset; one extra row tells whether there
+is a next page.
+'''
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+MIN_QUERY_LENGTH = 3
+MIN_PHONE_DIGITS = 3
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_OFFSET = 1000
+
+# pg_trgm defaults to 0.6, which misses a single typo in a short surname
+WORD_SIMILARITY_THRESHOLD = 0.5
+
+# word_similarity() costs ~10us per row; a typo of a common surname can match
+# tens of thousands of leads, so only this many fuzzy candidates are ranked
+FUZZY_CANDIDATES = 1000
+
+# Per entity: selected columns, source, text columns matched by ILIKE and word
+# similarity, the expression holding the phone digits, the recency order and
+# the partition key bounded by `since` (leads only)
+ENTITIES = {
+    'leads': {
+        'select': '''
+            l.id, l.partner_id, p.name AS partner_name, l.client_name, l.client_phone,
+            l.client_email, l.status, l.commission_amount, l.created_at
+        ''',
+        'from': '{schema}.leads l JOIN {schema}.partners p ON p.id = l.partner_id'.format(schema=SCHEMA),
+        'text': ('l.client_name',),
+        'phone': 'l.client_phone_normalized',
+        'order': 'l.created_at DESC, l.id DESC',
+        'since': 'l.created_at',
+    },
+    'partners': {
+        'select': '''
+            id, name, email, phone, traffic_source, is_approved, created_at
+        ''',
+        'from': '{schema}.partners'.format(schema=SCHEMA),
+        'text': ('name', 'email'),
+        'phone': "regexp_replace(phone, '[^0-9]', '', 'g')",
+        'order': 'created_at DESC, id DESC',
+        'since': None,
+    },
+}
+
+
+def like_pattern(value: str) -> str:
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + escaped + '%'
+
+
+def phone_prefix(digits: str) -> Optional[str]:
+    '''
+    The digits of a number typed with the trunk prefix 8, as they start a
+    stored one. Leads keep client_phone_normalized with a leading 8 of a
+    Russian number rewritten to 7 (normalize_phone in partner-create-lead),
+    so 8 916 ... has to be looked up as 7916... too.
+    '''
+    if digits.startswith('8') and len(digits) <= 11:
+        return '7' + digits[1:]
+    return None
+
+
+def build_queries(entity: str, q: str, since: Optional[datetime] = None) -> Tuple[str, str, Dict[str, Any]]:
+    '''SQL of the exact and the fuzzy tier with their shared parameters.'''
+    spec = ENTITIES[entity]
+    params: Dict[str, Any] = {'q': q, 'like': like_pattern(q)}
+    exact = ['%s ILIKE %%(like)s' % column for column in spec['text']]
+    digits = ''.join(ch for ch in q if ch.isdigit())
+    if len(digits) >= MIN_PHONE_DIGITS:
+        params['digits_like'] = like_pattern(digits)
+        exact.append('%s LIKE %%(digits_like)s' % spec['phone'])
+        prefix = phone_prefix(digits)
+        if prefix:
+            params['digits_prefix'] = prefix + '%'
+            exact.append('%s LIKE %%(digits_prefix)s' % spec['phone'])
+    exact_condition = ' OR '.join(exact)
+    recent = 'TRUE'
+    if since is not None and spec['since']:
+        params['since'] = since
+        recent = '%s >= %%(since)s' % spec['since']
+
+    exact_sql = '''
+        SELECT {select}, 1.0::real AS score
+        FROM {source}
+        WHERE ({condition}) AND {recent}
+        ORDER BY {order}
+        LIMIT %(limit)s
+    '''.format(select=spec['select'].strip(), source=spec['from'], condition=exact_condition, recent=recent,
+               order=spec['order'])
+
+    fuzzy_sql = '''
+        SELECT * FROM (
+            SELECT {select}, GREATEST({scores}) AS score
+            FROM {source}
+            WHERE ({condition}) AND NOT ({exact}) AND {recent}
+            LIMIT %(candidates)s
+        ) candidates
+        ORDER BY score DESC, created_at DESC, id DESC
+        LIMIT %(limit)s OFFSET %(offset)s
+    '''.format(
+        select=spec['select'].strip(),
+        scores=', '.join('word_similarity(%%(q)s::text, %s)' % column for column in spec['text']),
+        source=spec['from'],
+        condition=' OR '.join('%%(q)s::text <%%%% %s' % column for column in spec['text']),
+        exact=exact_condition,
+        recent=recent,
+    )
+    return exact_sql, fuzzy_sql, params
+
+
+def search(cur: Any, entity: str, q: str, limit: int = DEFAULT_LIMIT, offset: int = 0,
+           since: Optional[datetime] = None) -> Tuple[List[Any], bool]:
+    '''Return (rows, has_more) for one page of ranked matches; leads are limited to created_at >= since.'''
+    exact_sql, fuzzy_sql, params = build_queries(entity, q, since)
+    wanted = offset + limit + 1
+
+    cur.execute(exact_sql, dict(params, limit=wanted))
+    exact = cur.fetchall()
+    rows = list(exact[offset:])
+
+    if len(exact) < wanted:
+        cur.execute('SET LOCAL pg_trgm.word_similarity_threshold = %s', (WORD_SIMILARITY_THRESHOLD,))
+        cur.execute(fuzzy_sql, dict(
+            params,
+            candidates=FUZZY_CANDIDATES,
+            limit=wanted - offset - len(rows),
+            offset=max(0, offset - len(exact)),
+        ))
+        rows.extend(cur.fetchall())
+
+    return rows[:limit], len(rows) > limit
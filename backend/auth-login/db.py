@@ -0,0 +1,260 @@
+'''
+Shared PostgreSQL connection pool for backend functions.
+The pool lives at module level, so a warm container reuses open connections
+across invocations instead of paying a TCP + auth handshake per request.
+psycopg2 is imported on first use, so paths that never touch the database
+(CORS preflight, 405, validation errors) do not pay for loading the driver.
+Pool checkout and every cursor execute() are timed into the request trace
+(tracing.py). Each pooled connection carries the names of the statements
+prepared on it (queries.py).
+This file is vendored into every function directory; keep the copies identical
+(scripts/check_shared.py).
+'''
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import tracing
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '4'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+HEALTHCHECK_AFTER = float(os.environ.get('DB_HEALTHCHECK_AFTER', '30'))
+CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Bounded LIFO pool of psycopg2 connections.
+    Connections idle longer than HEALTHCHECK_AFTER seconds are pinged before
+    reuse; broken ones are dropped and replaced by a fresh connection.
+    '''
+
+    def __init__(self, dsn: str, maxsize: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.dsn = dsn
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle: List[Any] = []
+        self._last_used: Dict[int, float] = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self.counters: Dict[str, float] = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'reconnects': 0,
+            'timeouts': 0,
+        }
+
+    def _connect(self) -> Any:
+        import psycopg2
+        return psycopg2.connect(
+            self.dsn,
+            connect_timeout=CONNECT_TIMEOUT,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+            connection_factory=traced_connection_class(),
+        )
+
+    def _is_healthy(self, conn: Any) -> bool:
+        import psycopg2
+        if conn.closed:
+            return False
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for < HEALTHCHECK_AFTER:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn: Any) -> None:
+        import psycopg2
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self) -> Any:
+        import psycopg2
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while not self._idle and self._size >= self.maxsize:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout('No database connection available within %.1fs' % self.timeout)
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self.counters['waits'] += 1
+                self.counters['wait_time'] += time.monotonic() - started
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._size += 1
+
+        if conn is not None:
+            if self._is_healthy(conn):
+                self.counters['hits'] += 1
+                return conn
+            self.counters['reconnects'] += 1
+            self._last_used.pop(id(conn), None)
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+        self.counters['misses'] += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn: Any) -> None:
+        import psycopg2
+        import psycopg2.extensions
+        if conn.closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self) -> None:
+        import psycopg2
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            self._last_used.pop(id(conn), None)
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            result = dict(self.counters)
+            result['size'] = self._size
+            result['idle'] = len(self._idle)
+        return result
+
+
+_traced_connection: Any = None
+
+
+def traced_connection_class() -> Any:
+    '''
+    psycopg2 connection class whose cursors, whatever cursor_factory is asked
+    for, report each execute() duration and row count to tracing; commits are
+    reported as a COMMIT query.
+    '''
+    global _traced_connection
+    if _traced_connection is not None:
+        return _traced_connection
+    import psycopg2.extensions
+
+    cursor_classes: Dict[Any, Any] = {}
+
+    class TracedCursorMixin:
+        def execute(self, query: Any, vars: Any = None) -> Any:
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                tracing.record_query(query, time.perf_counter() - started, self.rowcount)
+
+    class TracedConnection(psycopg2.extensions.connection):
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            self.prepared: Set[str] = set()
+
+        def cursor(self, *args: Any, **kwargs: Any) -> Any:
+            factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+            traced = cursor_classes.get(factory)
+            if traced is None:
+                traced = cursor_classes[factory] = type('Traced' + factory.__name__, (TracedCursorMixin, factory), {})
+            kwargs['cursor_factory'] = traced
+            return super().cursor(*args, **kwargs)
+
+        def commit(self) -> None:
+            started = time.perf_counter()
+            try:
+                super().commit()
+            finally:
+                tracing.record_query('COMMIT', time.perf_counter() - started, 0)
+
+    _traced_connection = TracedConnection
+    return _traced_connection
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ['DATABASE_URL'])
+    return _pool
+
+
+@contextmanager
+def connection() -> Iterator[Any]:
+    '''
+    Borrow a pooled connection for the duration of the block.
+    Uncommitted work is rolled back when the connection is returned.
+    '''
+    import psycopg2
+    pool = get_pool()
+    started = time.perf_counter()
+    conn = pool.getconn()
+    tracing.add_phase('connect', time.perf_counter() - started)
+    try:
+        yield conn
+    except psycopg2.Error:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def pool_stats() -> Dict[str, float]:
+    '''Hit/miss, wait-time and reconnect counters of this container's pool.'''
+    if _pool is None:
+        return {}
+    return _pool.stats()
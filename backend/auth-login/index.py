@@ -1,28 +1,81 @@
-import json
-import os
+from functools import lru_cache
 from typing import Dict, Any
-import psycopg2
-import hashlib
-import secrets
-from pydantic import BaseModel, EmailStr, Field
+import db
+import hashers
+import auth
+import queries
+import ratelimit
+import web
 
-class LoginRequest(BaseModel):
-    email: EmailStr
-    password: str = Field(..., min_length=6)
+@lru_cache(maxsize=None)
+def login_model() -> Any:
+    '''
+    LoginRequest model, built on the first login. pydantic and email-validator
+    are only imported here, so preflight and 405 responses do not load them.
+    '''
+    from pydantic import BaseModel, EmailStr, Field
+
+    class LoginRequest(BaseModel):
+        email: EmailStr
+        password: str = Field(..., min_length=6)
+
+    return LoginRequest
+
+def login(request: web.Request) -> Dict[str, Any]:
+    body_data = request.json()
+    if not isinstance(body_data, dict):
+        raise web.HttpError(400, 'Неверный формат запроса')
+    LoginRequest = login_model()
+    from pydantic import ValidationError
+    try:
+        login_data = LoginRequest(**body_data)
+    except ValidationError:
+        raise web.HttpError(400, 'Укажите корректный email и пароль (минимум 6 символов)')
 
-def hash_password(password: str, salt: str = None) -> tuple:
-    if salt is None:
-        salt = secrets.token_hex(16)
-    hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-    password_hash = salt + '$' + hash_obj.hex()
-    return password_hash, salt
+    # Over the limit the attempt ends here, before the lookup and bcrypt
+    ratelimit.check('login', request.client_ip(), login_data.email)
 
-def verify_password(password: str, password_hash: str) -> bool:
-    if not password_hash or '$' not in password_hash:
-        return False
-    salt = password_hash.split('$')[0]
-    test_hash, _ = hash_password(password, salt)
-    return test_hash == password_hash
+    with db.connection() as conn:
+        cur = conn.cursor()
+        partner = queries.fetch_one(cur, queries.PARTNER_LOGIN, (login_data.email,))
+        cur.close()
+
+    if not partner:
+        return web.error(401, 'Неверный email или пароль')
+
+    password_hash = partner.password_hash
+
+    if not password_hash:
+        return web.error(403, 'Аккаунт не активирован. Ожидайте письмо с паролем.')
+
+    # Password is verified after the connection went back to the pool
+    if not hashers.verify_password(login_data.password, password_hash):
+        return web.error(401, 'Неверный email или пароль')
+
+    if not partner.is_approved:
+        return web.error(403, 'Ваша заявка на рассмотрении. Ожидайте одобрения.')
+
+    # Outdated hashes are upgraded; hashing happens before borrowing a connection
+    new_hash = hashers.hash_password(login_data.password) if hashers.needs_rehash(password_hash) else None
+
+    with db.connection() as conn:
+        cur = conn.cursor()
+        if new_hash:
+            queries.execute(cur, queries.PARTNER_REHASH, (new_hash, partner.id, password_hash))
+        session_token = auth.create_session(cur, partner.id)
+        conn.commit()
+        cur.close()
+
+    return web.json_response(200, {
+        'success': True,
+        'partner': {
+            'id': partner.id,
+            'name': partner.name,
+            'email': partner.email,
+            'is_admin': partner.is_admin
+        },
+        'session_token': session_token
+    })
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -30,105 +83,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Args: event with httpMethod POST, body with email and password
     Returns: Partner data with session token
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    body_data = json.loads(event.get('body', '{}'))
-    login_data = LoginRequest(**body_data)
-    
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
-    
-    cur.execute(
-        "SELECT id, name, email, password_hash, is_admin, is_approved FROM partners WHERE email = %s",
-        (login_data.email,)
-    )
-    
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    
-    if not result:
-        return {
-            'statusCode': 401,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Неверный email или пароль'})
-        }
-    
-    partner_id, name, email, password_hash, is_admin, is_approved = result
-    
-    if not password_hash:
-        return {
-            'statusCode': 403,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Аккаунт не активирован. Ожидайте письмо с паролем.'})
-        }
-    
-    if not verify_password(login_data.password, password_hash):
-        return {
-            'statusCode': 401,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Неверный email или пароль'})
-        }
-    
-    if not is_approved:
-        return {
-            'statusCode': 403,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Ваша заявка на рассмотрении. Ожидайте одобрения.'})
-        }
-    
-    session_token = secrets.token_urlsafe(32)
-    
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'success': True,
-            'partner': {
-                'id': partner_id,
-                'name': name,
-                'email': email,
-                'is_admin': is_admin
-            },
-            'session_token': session_token
-        })
-    }
+    return web.dispatch(event, context, {'POST': login})
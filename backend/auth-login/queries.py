@@ -0,0 +1,352 @@
+'''
+Fixed SQL statements of the backend functions, each defined once with
+schema-qualified names and the typed record its rows map to.
+Statements marked prepare=True are hot lookups: on a pooled connection
+(db.py) each is sent once with PREPARE and afterwards only EXECUTEd, so
+PostgreSQL skips parsing and planning on every call. Prepared statements
+outlive rollbacks and belong to the connection, so the set of prepared names
+is kept on the connection object and starts empty for a replacement
+connection. DB_PREPARE=0 turns this off (e.g. behind a pooler in transaction
+mode). Statements assembled per request (search, batch, export, lead pages)
+stay in their modules.
+Vendored into every function; keep the copies identical (scripts/check_shared.py).
+'''
+
+import os
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, NamedTuple, Optional, Sequence, Type
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+PREPARE = os.environ.get('DB_PREPARE', '1') != '0'
+
+
+class Statement:
+    __slots__ = ('name', 'sql', 'record', 'prepare', 'prepared_sql')
+
+    def __init__(self, name: str, sql: str, record: Optional[Type[Any]] = None, prepare: bool = False):
+        self.name = name
+        self.sql = sql.format(schema=SCHEMA)
+        self.record = record
+        self.prepare = prepare
+        # PREPARE takes $1, $2, ... where psycopg2 takes %s
+        parts = self.sql.split('%s')
+        self.prepared_sql = parts[0] + ''.join('$%d%s' % (i, part) for i, part in enumerate(parts[1:], 1))
+
+
+class PartnerLogin(NamedTuple):
+    id: int
+    name: str
+    email: str
+    password_hash: Optional[str]
+    is_admin: bool
+    is_approved: bool
+
+
+class AdminLogin(NamedTuple):
+    id: int
+    email: str
+    password_hash: str
+    name: str
+
+
+class SessionIdentity(NamedTuple):
+    partner_id: int
+    email: str
+    is_admin: bool
+    expires_in: Decimal
+
+
+class PartnerContact(NamedTuple):
+    id: int
+    name: str
+    email: str
+
+
+class PartnerListItem(NamedTuple):
+    id: int
+    name: str
+    email: str
+    phone: str
+    traffic_source: Optional[str]
+    experience: Optional[str]
+    is_approved: bool
+    created_at: datetime
+    leads_count: int
+    total_commission: Decimal
+
+
+class PartnerListVersion(NamedTuple):
+    partners: int
+    approved: int
+    max_id: Optional[int]
+    stats_version: int
+    deleted: int
+
+
+# Fields in the order of partner_stats.COLUMNS
+class PartnerStatistics(NamedTuple):
+    total_leads: int
+    new_leads: int
+    in_review_leads: int
+    approved_leads: int
+    rejected_leads: int
+    completed_leads: int
+    total_commission: Decimal
+
+
+class Id(NamedTuple):
+    id: int
+
+
+class Flag(NamedTuple):
+    value: bool
+
+
+class Version(NamedTuple):
+    version: int
+
+
+class Watermark(NamedTuple):
+    watermark: datetime
+
+
+# JSON columns arrive parsed; is_admin is None for an unknown admin id
+class AdminOverview(NamedTuple):
+    is_admin: Optional[bool]
+    pending: List[Any]
+    pending_count: int
+    recent_leads: List[Any]
+    status_counts: Any
+    top_partners: List[Any]
+
+
+# auth-login, admin-login
+
+PARTNER_LOGIN = Statement('partner_login', '''
+    SELECT id, name, email, password_hash, is_admin, is_approved
+    FROM {schema}.partners
+    WHERE email = %s
+''', PartnerLogin, prepare=True)
+
+PARTNER_REHASH = Statement('partner_rehash', '''
+    UPDATE {schema}.partners SET password_hash = %s WHERE id = %s AND password_hash = %s
+''')
+
+ADMIN_LOGIN = Statement('admin_login', '''
+    SELECT id, email, password_hash, name
+    FROM {schema}.admins
+    WHERE email = %s
+''', AdminLogin, prepare=True)
+
+ADMIN_REHASH = Statement('admin_rehash', '''
+    UPDATE {schema}.admins SET password_hash = %s WHERE id = %s AND password_hash = %s
+''')
+
+# Sessions (auth.py)
+
+SESSION_IDENTITY = Statement('session_identity', '''
+    SELECT p.id AS partner_id, p.email, p.is_admin,
+           EXTRACT(EPOCH FROM s.expires_at - CURRENT_TIMESTAMP) AS expires_in
+    FROM {schema}.sessions s
+    JOIN {schema}.partners p ON p.id = s.partner_id
+    WHERE s.token_hash = %s AND s.expires_at > CURRENT_TIMESTAMP AND p.is_approved = TRUE
+''', SessionIdentity, prepare=True)
+
+SESSION_PURGE_EXPIRED = Statement('session_purge_expired', '''
+    DELETE FROM {schema}.sessions WHERE partner_id = %s AND expires_at < CURRENT_TIMESTAMP
+''', prepare=True)
+
+SESSION_INSERT = Statement('session_insert', '''
+    INSERT INTO {schema}.sessions (token_hash, partner_id, expires_at)
+    VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+''', prepare=True)
+
+SESSIONS_REVOKE = Statement('sessions_revoke', '''
+    DELETE FROM {schema}.sessions WHERE partner_id = %s
+''')
+
+SESSIONS_REVOKE_MANY = Statement('sessions_revoke_many', '''
+    DELETE FROM {schema}.sessions WHERE partner_id = ANY(%s)
+''')
+
+# Partners
+
+PARTNER_REGISTER = Statement('partner_register', '''
+    INSERT INTO {schema}.partners (name, email, phone, traffic_source, experience)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING id
+''', Id)
+
+PARTNER_APPROVE = Statement('partner_approve', '''
+    UPDATE {schema}.partners SET is_approved = TRUE, password_hash = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s
+    RETURNING id, name, email
+''', PartnerContact)
+
+# A deleted partner leaves a tombstone for clients syncing the list with since=
+PARTNER_DELETE = Statement('partner_delete', '''
+    WITH deleted AS (
+        DELETE FROM {schema}.partners WHERE id = %s RETURNING id
+    )
+    INSERT INTO {schema}.partner_tombstones (partner_id)
+    SELECT id FROM deleted
+    ON CONFLICT (partner_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at
+    RETURNING partner_id AS id
+''', Id)
+
+PARTNER_IS_ADMIN = Statement('partner_is_admin', '''
+    SELECT is_admin AS value FROM {schema}.partners WHERE id = %s
+''', Flag, prepare=True)
+
+# Partners are only approved or deleted, and each one's leads bump its
+# partner_stats version, so these aggregates change with every visible
+# change of the list (one pass over a small table). The tombstone count also
+# changes when a partner is added and deleted between two polls, which
+# matters to since= bodies
+PARTNER_LIST_VERSION = Statement('partner_list_version', '''
+    SELECT COUNT(*) AS partners, COUNT(*) FILTER (WHERE p.is_approved) AS approved,
+           MAX(p.id) AS max_id, COALESCE(SUM(s.version), 0) AS stats_version,
+           (SELECT COUNT(*) FROM {schema}.partner_tombstones) AS deleted
+    FROM {schema}.partners p
+    LEFT JOIN {schema}.partner_stats s ON s.partner_id = p.id
+    WHERE p.is_admin = FALSE
+''', PartnerListVersion, prepare=True)
+
+PARTNER_LIST = Statement('partner_list', '''
+    SELECT
+        p.id, p.name, p.email, p.phone, p.traffic_source,
+        p.experience, p.is_approved, p.created_at,
+        COALESCE(s.total_leads, 0) AS leads_count,
+        COALESCE(s.total_commission, 0) AS total_commission
+    FROM {schema}.partners p
+    LEFT JOIN {schema}.partner_stats s ON s.partner_id = p.id
+    WHERE p.is_admin = FALSE
+    ORDER BY p.created_at DESC
+''', PartnerListItem, prepare=True)
+
+# Partners whose row or lead counters changed after a watermark (sync.py)
+PARTNER_CHANGES = Statement('partner_changes', '''
+    SELECT
+        p.id, p.name, p.email, p.phone, p.traffic_source,
+        p.experience, p.is_approved, p.created_at,
+        COALESCE(s.total_leads, 0) AS leads_count,
+        COALESCE(s.total_commission, 0) AS total_commission
+    FROM {schema}.partners p
+    LEFT JOIN {schema}.partner_stats s ON s.partner_id = p.id
+    WHERE p.is_admin = FALSE AND p.id IN (
+        SELECT id FROM {schema}.partners WHERE updated_at > %s
+        UNION
+        SELECT partner_id FROM {schema}.partner_stats WHERE updated_at > %s
+    )
+    ORDER BY p.created_at DESC
+''', PartnerListItem, prepare=True)
+
+PARTNER_TOMBSTONES = Statement('partner_tombstones', '''
+    SELECT partner_id AS id FROM {schema}.partner_tombstones WHERE deleted_at > %s ORDER BY partner_id
+''', Id, prepare=True)
+
+# The admin panel's first screen in one round trip: the admin check and every
+# block are CTEs of one statement, and the blocks are only computed for an
+# admin. Lead counts come from the partner_stats rollup. Recent leads are
+# bounded by partitions.recent_cutoff(), so only the recent partitions are
+# planned and opened. Block sizes are literals: with LIMIT parameters the
+# planner keeps choosing custom plans and replans on every call
+ADMIN_OVERVIEW = Statement('admin_overview', '''
+    WITH admin AS (
+        SELECT is_admin FROM {schema}.partners WHERE id = %s
+    ),
+    pending AS (
+        SELECT id, name, email, phone, traffic_source, experience, created_at
+        FROM {schema}.partners
+        WHERE is_approved = FALSE AND is_admin = FALSE AND (SELECT is_admin FROM admin)
+        ORDER BY created_at DESC
+        LIMIT 50
+    ),
+    recent_leads AS (
+        SELECT l.id, l.partner_id, p.name AS partner_name, l.client_name, l.client_phone,
+               l.client_email, l.status, l.commission_amount, l.created_at
+        FROM {schema}.leads l
+        JOIN {schema}.partners p ON p.id = l.partner_id
+        WHERE l.created_at >= %s AND (SELECT is_admin FROM admin)
+        ORDER BY l.created_at DESC, l.id DESC
+        LIMIT 20
+    ),
+    status_counts AS (
+        SELECT COALESCE(SUM(total_leads), 0) AS total, COALESCE(SUM(new_leads), 0) AS new,
+               COALESCE(SUM(in_review_leads), 0) AS in_review, COALESCE(SUM(approved_leads), 0) AS approved,
+               COALESCE(SUM(rejected_leads), 0) AS rejected, COALESCE(SUM(completed_leads), 0) AS completed
+        FROM {schema}.partner_stats
+        WHERE (SELECT is_admin FROM admin)
+    ),
+    top_partners AS (
+        SELECT p.id, p.name, p.email, s.total_leads, s.approved_leads, s.total_commission
+        FROM {schema}.partner_stats s
+        JOIN {schema}.partners p ON p.id = s.partner_id
+        WHERE p.is_admin = FALSE AND (SELECT is_admin FROM admin)
+        ORDER BY s.total_commission DESC, p.id
+        LIMIT 10
+    )
+    SELECT
+        (SELECT is_admin FROM admin) AS is_admin,
+        (SELECT COALESCE(json_agg(pending ORDER BY created_at DESC), '[]') FROM pending) AS pending,
+        (SELECT COUNT(*) FROM {schema}.partners
+         WHERE is_approved = FALSE AND is_admin = FALSE AND (SELECT is_admin FROM admin)) AS pending_count,
+        (SELECT COALESCE(json_agg(recent_leads ORDER BY created_at DESC, id DESC), '[]') FROM recent_leads)
+            AS recent_leads,
+        (SELECT row_to_json(status_counts) FROM status_counts) AS status_counts,
+        (SELECT COALESCE(json_agg(top_partners ORDER BY total_commission DESC, id), '[]') FROM top_partners)
+            AS top_partners
+''', AdminOverview, prepare=True)
+
+# partner_stats rollup (partner_stats.py)
+
+PARTNER_VERSION = Statement('partner_version', '''
+    SELECT version FROM {schema}.partner_stats WHERE partner_id = %s
+''', Version, prepare=True)
+
+PARTNER_STATISTICS = Statement('partner_statistics', '''
+    SELECT total_leads, new_leads, in_review_leads, approved_leads, rejected_leads, completed_leads, total_commission
+    FROM {schema}.partner_stats
+    WHERE partner_id = %s
+''', PartnerStatistics, prepare=True)
+
+
+# Incremental reads (sync.py): the read's transaction start, less the overlap, never before since
+SYNC_WATERMARK = Statement('sync_watermark', '''
+    SELECT GREATEST(LOCALTIMESTAMP - %s::float8 * INTERVAL '1 second', %s::timestamp) AS watermark
+''', Watermark, prepare=True)
+
+
+def execute(cur: Any, statement: Statement, args: Sequence[Any] = ()) -> None:
+    '''Run statement on cur, preparing it first if it is hot and not yet prepared on this connection.'''
+    prepared = getattr(cur.connection, 'prepared', None)
+    if not (statement.prepare and PREPARE and prepared is not None):
+        cur.execute(statement.sql, args)
+        return
+    if statement.name not in prepared:
+        cur.execute('PREPARE %s AS %s' % (statement.name, statement.prepared_sql))
+        prepared.add(statement.name)
+    if args:
+        cur.execute('EXECUTE %s (%s)' % (statement.name, ', '.join(['%s'] * len(args))), args)
+    else:
+        cur.execute('EXECUTE %s' % statement.name)
+
+
+def _record(statement: Statement, row: Any) -> Any:
+    # Tuple rows map by position, RealDictCursor rows by column name
+    if isinstance(row, dict):
+        return statement.record(**row)
+    return statement.record._make(row)
+
+
+def fetch_one(cur: Any, statement: Statement, args: Sequence[Any] = ()) -> Optional[Any]:
+    execute(cur, statement, args)
+    row = cur.fetchone()
+    return _record(statement, row) if row is not None else None
+
+
+def fetch_all(cur: Any, statement: Statement, args: Sequence[Any] = ()) -> List[Any]:
+    execute(cur, statement, args)
+    return [_record(statement, row) for row in cur.fetchall()]
@@ -1,112 +1,287 @@
 import json
-import os
-from typing import Dict, Any
-import psycopg2
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+import asyncdb
+import db
+import partner_stats
+import partitions
+import queries
+import sync
+import web
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    '''
-    Business: Get all leads for a partner
-    Args: event with httpMethod GET, queryStringParameters with partner_id
-    Returns: List of leads with statistics
-    '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Partner-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'GET':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    params = event.get('queryStringParameters') or {}
-    partner_id = params.get('partner_id')
-    
-    if not partner_id:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'partner_id is required'})
-        }
-    
-    database_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT 
-            id, client_name, client_phone, client_email, 
-            project_address, estimate_amount, status, 
-            commission_amount, notes, created_at, updated_at
-        FROM leads 
-        WHERE partner_id = %s 
-        ORDER BY created_at DESC
-    """, (partner_id,))
-    
-    rows = cur.fetchall()
-    
-    leads = []
-    for row in rows:
-        leads.append({
-            'id': row[0],
-            'client_name': row[1],
-            'client_phone': row[2],
-            'client_email': row[3],
-            'project_address': row[4],
-            'estimate_amount': float(row[5]) if row[5] else 0,
-            'status': row[6],
-            'commission_amount': float(row[7]) if row[7] else 0,
-            'notes': row[8],
-            'created_at': row[9].isoformat() if row[9] else None,
-            'updated_at': row[10].isoformat() if row[10] else None
-        })
-    
-    cur.execute("""
-        SELECT 
-            COUNT(*) as total_leads,
-            SUM(CASE WHEN status = 'approved' THEN 1 ELSE 0 END) as approved_leads,
-            SUM(CASE WHEN status = 'approved' THEN commission_amount ELSE 0 END) as total_commission
-        FROM leads 
-        WHERE partner_id = %s
-    """, (partner_id,))
-    
-    stats_row = cur.fetchone()
-    stats = {
-        'total_leads': stats_row[0] or 0,
-        'approved_leads': stats_row[1] or 0,
-        'total_commission': float(stats_row[2]) if stats_row[2] else 0
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# A since= read with more changes than this asks the client to reload instead
+MAX_CHANGES = 500
+RESET = {'success': True, 'reset': True}
+
+COLUMNS = ('id', 'client_name', 'client_phone', 'client_email', 'project_address', 'estimate_amount',
+           'status', 'commission_amount', 'notes', 'created_at', 'updated_at')
+
+ALLOW_HEADERS = 'Content-Type, X-Partner-Id, If-None-Match'
+
+# Serialized pages by ETag, per container
+RESPONSES = web.BodyCache(size=256, ttl=60.0)
+
+def encode_cursor(created_at: datetime, lead_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), lead_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, lead_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    return datetime.fromisoformat(created_at), int(lead_id)
+
+def parse_date(value: str, end_of_day: bool = False) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+class LeadQuery(NamedTuple):
+    partner_id: str
+    conditions: List[str]
+    args: List[Any]
+    limit: int
+    after: Optional[Tuple[datetime, int]]
+    since: Optional[datetime]
+    selected: Optional[List[str]]
+    date_from: Optional[datetime]
+    # Conditions and args of the leads the default date_from leaves out of the first page
+    older: Optional[Tuple[List[str], List[Any]]]
+
+def select_sql(conditions: List[str], order: str) -> str:
+    return """
+        SELECT
+            id, client_name, client_phone, client_email,
+            project_address, COALESCE(estimate_amount, 0), status,
+            COALESCE(commission_amount, 0), notes, created_at, updated_at
+        FROM t_p62408730_traffic_partnership.leads
+        WHERE """ + ' AND '.join(conditions) + """
+        ORDER BY """ + order + """
+        LIMIT %s
+    """
+
+def select_leads(cur: Any, conditions: list, args: list, order: str, limit: int) -> list:
+    cur.execute(select_sql(conditions, order), args + [limit])
+    return cur.fetchall()
+
+def page_result(request: web.Request, query: LeadQuery, rows: list, stats: Optional[Dict[str, Any]],
+                watermark: Optional[str], older: bool = False) -> Dict[str, Any]:
+    next_cursor = None
+    if len(rows) > query.limit:
+        rows = rows[:query.limit]
+        next_cursor = encode_cursor(rows[-1][9], rows[-1][0])
+    elif older:
+        # The recent window is exhausted; the next page starts below its bound
+        next_cursor = encode_cursor(query.date_from, 0)
+
+    leads = web.rows_payload(request, rows, COLUMNS, query.selected)
+
+    result = {
+        'success': True,
+        'leads': leads,
+        'next_cursor': next_cursor
     }
-    
-    cur.close()
-    conn.close()
-    
+    if stats is not None:
+        result['statistics'] = stats
+        # Later refreshes pass it back as since=
+        result['watermark'] = watermark
+    return result
+
+def changes_result(request: web.Request, query: LeadQuery, rows: list, stats: Dict[str, Any],
+                   watermark: str) -> Dict[str, Any]:
+    if len(rows) > MAX_CHANGES:
+        return RESET
+
     return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'success': True,
-            'leads': leads,
-            'statistics': stats
-        })
+        'success': True,
+        'leads': web.rows_payload(request, rows, COLUMNS, query.selected),
+        'statistics': stats,
+        'watermark': watermark
     }
+
+def fetch_page(request: web.Request, cur: Any, query: LeadQuery) -> Dict[str, Any]:
+    rows = select_leads(cur, query.conditions, query.args, 'created_at DESC, id DESC', query.limit + 1)
+
+    if query.after is not None:
+        return page_result(request, query, rows, None, None)
+    older = False
+    if query.older is not None and len(rows) <= query.limit:
+        older = bool(select_leads(cur, query.older[0], query.older[1], 'created_at DESC, id DESC', 1))
+    stats = partner_stats.fetch_statistics(cur, query.partner_id)
+    return page_result(request, query, rows, stats, sync.watermark(cur), older)
+
+def fetch_changes(request: web.Request, cur: Any, query: LeadQuery) -> Dict[str, Any]:
+    rows = select_leads(cur, query.conditions + ['updated_at > %s'], query.args + [query.since],
+                        'updated_at, id', MAX_CHANGES + 1)
+    if len(rows) > MAX_CHANGES:
+        return RESET
+
+    stats = partner_stats.fetch_statistics(cur, query.partner_id)
+    return changes_result(request, query, rows, stats, sync.watermark(cur, query.since))
+
+async def fetch_page_async(request: web.Request, conn: Any, query: LeadQuery) -> Dict[str, Any]:
+    page = (select_sql(query.conditions, 'created_at DESC, id DESC'), query.args + [query.limit + 1])
+    if query.after is not None:
+        rows, = await asyncdb.fetch(conn, [page])
+        return page_result(request, query, rows, None, None)
+
+    # One round trip for the page, the statistics and the watermark
+    watermark, rows, stats = await asyncdb.fetch(conn, [
+        sync.watermark_query(),
+        page,
+        (queries.PARTNER_STATISTICS, (query.partner_id,))
+    ])
+    older = False
+    if query.older is not None and len(rows) <= query.limit:
+        found, = await asyncdb.fetch(conn, [
+            (select_sql(query.older[0], 'created_at DESC, id DESC'), query.older[1] + [1])
+        ])
+        older = bool(found)
+    return page_result(request, query, rows, partner_stats.statistics(stats[0] if stats else None),
+                       watermark[0].watermark.isoformat(), older)
+
+async def fetch_changes_async(request: web.Request, conn: Any, query: LeadQuery) -> Dict[str, Any]:
+    watermark, rows, stats = await asyncdb.fetch(conn, [
+        sync.watermark_query(query.since),
+        (select_sql(query.conditions + ['updated_at > %s'], 'updated_at, id'),
+         query.args + [query.since, MAX_CHANGES + 1]),
+        (queries.PARTNER_STATISTICS, (query.partner_id,))
+    ])
+    return changes_result(request, query, rows, partner_stats.statistics(stats[0] if stats else None),
+                          watermark[0].watermark.isoformat())
+
+def parse_query(request: web.Request) -> LeadQuery:
+    params = request.query
+    partner_id = params.get('partner_id')
+
+    if not partner_id:
+        raise web.HttpError(400, 'partner_id is required')
+
+    try:
+        limit = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise web.HttpError(400, 'limit must be an integer')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    after: Optional[Tuple[datetime, int]] = None
+    if params.get('cursor'):
+        try:
+            after = decode_cursor(params['cursor'])
+        except (ValueError, TypeError):
+            raise web.HttpError(400, 'Invalid cursor')
+
+    try:
+        date_from = parse_date(params['date_from']) if params.get('date_from') else None
+        date_to = parse_date(params['date_to'], end_of_day=True) if params.get('date_to') else None
+    except ValueError:
+        raise web.HttpError(400, 'date_from/date_to must be ISO dates')
+
+    statuses = [s for s in (params.get('status') or '').split(',') if s]
+    selected = web.select_fields(request, COLUMNS)
+
+    # Changed leads are returned whatever their status, so that a client
+    # also sees the ones that left its filter
+    since = sync.parse_since(request)
+    if since is not None and (after or statuses):
+        raise web.HttpError(400, 'since cannot be combined with cursor or status')
+
+    # Without date_from the first page reads only the recent monthly partitions
+    # and, when older leads exist, hands out a cursor below the bound. Cursor
+    # pages and since= reads have no default lower bound: the dashboard's
+    # "Показать ещё" goes on into older leads and later sees their changes
+    default_from = date_from is None and after is None and since is None
+    if default_from:
+        date_from = partitions.recent_cutoff()
+
+    conditions = ['partner_id = %s']
+    args: list = [partner_id]
+    if statuses:
+        conditions.append('status = ANY(%s)')
+        args.append(statuses)
+    older = None
+    if default_from:
+        older = (conditions + ['created_at < %s'], args + [date_from])
+    if date_from:
+        conditions.append('created_at >= %s')
+        args.append(date_from)
+    if date_to:
+        conditions.append('created_at < %s')
+        args.append(date_to)
+        if older is not None:
+            older[0].append('created_at < %s')
+            older[1].append(date_to)
+    if after:
+        # The plain bound lets the planner skip the partitions newer than the cursor
+        conditions.append('created_at <= %s')
+        conditions.append('(created_at, id) < (%s, %s)')
+        args.append(after[0])
+        args.extend(after)
+
+    return LeadQuery(partner_id, conditions, args, limit, after, since, selected, date_from, older)
+
+def list_leads(request: web.Request) -> Dict[str, Any]:
+    query = parse_query(request)
+
+    with db.connection() as conn:
+        cur = conn.cursor()
+        # Every lead change bumps the version, so an unchanged version means an
+        # unchanged page: the poll costs this one primary-key lookup. Reading
+        # the version first keeps a body cached under it at least that new.
+        version = partner_stats.fetch_version(cur, query.partner_id)
+        result = web.conditional(
+            request,
+            web.etag(version, query.date_from, sorted(request.query.items())),
+            (lambda: fetch_changes(request, cur, query)) if query.since is not None
+            else (lambda: fetch_page(request, cur, query)),
+            RESPONSES
+        )
+        cur.close()
+
+    return result
+
+async def list_leads_async(request: web.Request) -> Dict[str, Any]:
+    query = parse_query(request)
+
+    async with asyncdb.connection() as conn:
+        # The version is still read first, on its own: a poll that ends in 304
+        # sends nothing else
+        row = await asyncdb.fetch_one(conn, queries.PARTNER_VERSION, (query.partner_id,))
+        result = await web.conditional_async(
+            request,
+            web.etag(row.version if row else 0, query.date_from, sorted(request.query.items())),
+            (lambda: fetch_changes_async(request, conn, query)) if query.since is not None
+            else (lambda: fetch_page_async(request, conn, query)),
+            RESPONSES
+        )
+
+    return result
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Get leads for a partner, one keyset page at a time
+    Args: event with httpMethod GET, queryStringParameters with partner_id and
+          optional limit, cursor, status (comma-separated), date_from, date_to;
+          date_from defaults to the start of the LEADS_RECENT_MONTHS window
+          on the first page, whose next_cursor then leads on to older leads;
+          cursor pages and since= have no default bound.
+          since=<watermark> returns only leads changed after it;
+          fields (comma-separated columns) and format=compact shape the leads
+    Returns: Page of leads with next_cursor; statistics and a watermark on the
+             first page. With since: the changed leads, statistics and a new
+             watermark, or reset when too much changed to send as a delta.
+             Carries an ETag; 304 when If-None-Match still matches
+    '''
+    if asyncdb.ENABLED:
+        return asyncdb.run(handle(event, context))
+    return web.dispatch(event, context, {'GET': list_leads}, allow_headers=ALLOW_HEADERS)
+
+async def handle(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    handler() on the asyncio path: the queries of a page go out in one
+    pipeline (asyncdb.py). handler() takes it with DB_ASYNC=1; a runtime
+    with async handlers can call it directly.
+    '''
+    return await web.dispatch_async(event, context, {'GET': list_leads_async}, allow_headers=ALLOW_HEADERS)
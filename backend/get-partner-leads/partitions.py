@@ -0,0 +1,108 @@
+'''
+Monthly range partitions of the leads table (V0011) and archival of closed leads.
+Read paths default to the RECENT_MONTHS most recent months; the cutoff falls
+on a month boundary, so the planner skips every older partition outright.
+ensure_partitions() and archive_closed_leads() are run on a schedule by
+scripts/maintain_leads.py.
+Vendored into every function that reads leads; keep the copies identical
+(scripts/check_shared.py).
+'''
+
+import os
+from datetime import date, datetime
+from typing import Any, Optional
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+RECENT_MONTHS = int(os.environ.get('LEADS_RECENT_MONTHS', '12'))
+ARCHIVE_AFTER_MONTHS = int(os.environ.get('LEADS_ARCHIVE_AFTER_MONTHS', '24'))
+MONTHS_AHEAD = 3
+
+# Lead statuses that no longer change and may leave the live table
+CLOSED_STATUSES = ('rejected', 'completed')
+
+ARCHIVE_BATCH_SIZE = 5000
+
+ARCHIVE_COLUMNS = (
+    'id', 'partner_id', 'client_name', 'client_phone', 'client_email', 'project_address', 'estimate_amount',
+    'status', 'commission_amount', 'notes', 'created_at', 'updated_at'
+)
+
+# One batch: move closed leads to the archive and bump the affected partners'
+# version, so that cached dashboard pages containing them are not served again
+ARCHIVE_SQL = '''
+    WITH batch AS (
+        SELECT id, created_at FROM {schema}.leads
+        WHERE status = ANY(%(statuses)s) AND created_at < %(cutoff)s
+        LIMIT %(limit)s
+    ),
+    moved AS (
+        DELETE FROM {schema}.leads l
+        USING batch
+        WHERE l.id = batch.id AND l.created_at = batch.created_at
+        RETURNING l.*
+    ),
+    archived AS (
+        INSERT INTO {schema}.leads_archive ({columns})
+        SELECT {columns} FROM moved
+        RETURNING partner_id
+    ),
+    touched AS (
+        UPDATE {schema}.partner_stats s SET version = s.version + 1
+        WHERE s.partner_id IN (SELECT partner_id FROM archived)
+    )
+    SELECT COUNT(*) FROM archived
+'''.format(schema=SCHEMA, columns=', '.join(ARCHIVE_COLUMNS))
+
+
+def months_ago(months: int, today: Optional[date] = None) -> datetime:
+    '''Start of the month that lies months - 1 months before the current one.'''
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - max(months - 1, 0)
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def recent_cutoff(today: Optional[date] = None) -> datetime:
+    '''Default lower bound of created_at for lead listings: RECENT_MONTHS months including this one.'''
+    return months_ago(RECENT_MONTHS, today)
+
+
+def ensure_partitions(conn: Any, months_ahead: int = MONTHS_AHEAD) -> int:
+    '''Create missing monthly partitions up to months_ahead; returns how many were created.'''
+    cur = conn.cursor()
+    cur.execute('SELECT {schema}.ensure_leads_partitions(%s)'.format(schema=SCHEMA), (months_ahead,))
+    created = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return created
+
+
+def archive_closed_leads(conn: Any, months: int = ARCHIVE_AFTER_MONTHS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                         dry_run: bool = False) -> int:
+    '''
+    Move closed leads created before the last `months` months to leads_archive,
+    committing every batch_size rows. Returns the number of leads moved (or
+    that would be moved, with dry_run).
+    '''
+    cutoff = months_ago(months)
+    cur = conn.cursor()
+    if dry_run:
+        cur.execute(
+            'SELECT COUNT(*) FROM {schema}.leads WHERE status = ANY(%s) AND created_at < %s'.format(schema=SCHEMA),
+            (list(CLOSED_STATUSES), cutoff)
+        )
+        total = cur.fetchone()[0]
+        conn.rollback()
+        cur.close()
+        return total
+
+    total = 0
+    while True:
+        cur.execute(ARCHIVE_SQL, {'statuses': list(CLOSED_STATUSES), 'cutoff': cutoff, 'limit': batch_size})
+        moved = cur.fetchone()[0]
+        conn.commit()
+        total += moved
+        if moved < batch_size:
+            break
+    cur.close()
+    return total
@@ -0,0 +1,43 @@
+'''
+Watermarks for the incremental (since=) mode of the polled lists.
+A watermark is a database timestamp; a client that sends it back as since=
+gets only the rows changed after it. updated_at is the start time of the
+writing transaction, so a row may commit with a time slightly before a
+watermark handed out meanwhile: watermarks therefore trail the database
+clock by SYNC_OVERLAP seconds, and rows changed within that window are sent
+again. Clients merge rows by id, so a repeat is harmless.
+Vendored into every function with a since= mode.
+'''
+
+import os
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+import queries
+import web
+
+OVERLAP = float(os.environ.get('SYNC_OVERLAP', '10'))
+
+
+def parse_since(request: web.Request) -> Optional[datetime]:
+    '''The since= watermark of request, or None for a full read.'''
+    value = request.query.get('since')
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise web.HttpError(400, 'since must be a watermark from an earlier response')
+
+
+def watermark(cur: Any, since: Optional[datetime] = None) -> str:
+    '''Watermark for rows read in cur's transaction; never earlier than since.'''
+    return queries.fetch_one(cur, *watermark_query(since)).watermark.isoformat()
+
+
+def watermark_query(since: Optional[datetime] = None) -> Tuple[queries.Statement, Tuple[float, Optional[datetime]]]:
+    '''
+    The watermark statement and its arguments, for a pipeline (asyncdb.fetch);
+    sent ahead of the reads it covers, whose transactions start after its own.
+    '''
+    return queries.SYNC_WATERMARK, (OVERLAP, since)
@@ -0,0 +1,192 @@
+'''
+Per-request tracing for the backend functions.
+web.dispatch() opens a trace for every invocation; db.py times borrowing a
+connection and every cursor execute(), web.dumps() times serialization. When
+the request ends, one JSON line is written to stdout with context.request_id,
+the phase breakdown (connect / query / serialize / app), each query's duration
+and row count, and the response size. Phase durations are also aggregated
+into in-process histograms; TRACE_HISTOGRAM_EVERY=N writes a dump of them
+every N requests. TRACE_LOG=0 turns the per-request line off.
+This file is vendored into every function directory; keep the copies identical
+(scripts/check_shared.py).
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ENABLED = os.environ.get('TRACE_LOG', '1').lower() not in ('0', 'false', 'no', 'off')
+MAX_QUERIES = int(os.environ.get('TRACE_MAX_QUERIES', '20'))
+HISTOGRAM_EVERY = int(os.environ.get('TRACE_HISTOGRAM_EVERY', '0'))
+
+# Upper bounds of the histogram buckets, milliseconds; the last bucket is open
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+PHASES = ('connect', 'query', 'serialize')
+
+STATEMENT_LENGTH = 120
+
+LABEL_CACHE_SIZE = 512
+
+
+class Trace:
+    __slots__ = ('request_id', 'function', 'method', 'started', 'phases', 'queries', 'query_count', 'rows', 'bytes')
+
+    def __init__(self, request_id: str, function: str, method: str):
+        self.request_id = request_id
+        self.function = function
+        self.method = method
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries: List[tuple] = []
+        self.query_count = 0
+        self.rows = 0
+        self.bytes = 0
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = ['le_%g' % bound for bound in BUCKETS_MS] + ['inf']
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'buckets': {label: n for label, n in zip(labels, self.counts) if n},
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+_histograms: Dict[str, Histogram] = {}
+_lock = threading.Lock()
+_finished = 0
+_labels: Dict[Any, str] = {}
+
+
+def statement_label(statement: Any) -> str:
+    '''Whitespace-collapsed, truncated SQL; pre-rendered VALUES lists are cut off.'''
+    label = _labels.get(statement)
+    if label is None:
+        text = statement
+        if isinstance(text, bytes):
+            text = text.split(b'VALUES')[0].decode('utf-8', 'replace')
+        label = ' '.join(str(text).split())[:STATEMENT_LENGTH]
+        if len(_labels) >= LABEL_CACHE_SIZE:
+            _labels.clear()
+        _labels[statement] = label
+    return label
+
+
+def start(context: Any, method: str) -> Any:
+    '''Open the trace of the current request; returns the token for finish().'''
+    trace = Trace(
+        getattr(context, 'request_id', None) or '',
+        getattr(context, 'function_name', None) or '',
+        method
+    )
+    return _current.set(trace)
+
+
+def add_phase(name: str, seconds: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.phases[name] = trace.phases.get(name, 0.0) + seconds
+
+
+def record_query(statement: Any, seconds: float, rows: int) -> None:
+    trace = _current.get()
+    if trace is None:
+        return
+    trace.phases['query'] += seconds
+    trace.query_count += 1
+    if rows > 0:
+        trace.rows += rows
+    if len(trace.queries) < MAX_QUERIES:
+        trace.queries.append((statement, seconds, rows))
+
+
+def finish(token: Any, status_code: int, size: int) -> None:
+    '''Close the trace opened by start(), log it and feed the histograms.'''
+    global _finished
+    trace = _current.get()
+    _current.reset(token)
+    if trace is None:
+        return
+    trace.bytes = size
+    total_ms = (time.perf_counter() - trace.started) * 1000
+    phases_ms = {name: seconds * 1000 for name, seconds in trace.phases.items()}
+    phases_ms['app'] = max(total_ms - sum(phases_ms.values()), 0.0)
+
+    prefix = '%s %s ' % (trace.function, trace.method)
+    with _lock:
+        _observe(prefix + 'total', total_ms)
+        for name, ms in phases_ms.items():
+            _observe(prefix + name, ms)
+        _finished += 1
+        dump_now = HISTOGRAM_EVERY > 0 and _finished % HISTOGRAM_EVERY == 0
+
+    if ENABLED:
+        _emit({
+            'event': 'request',
+            'request_id': trace.request_id,
+            'function': trace.function,
+            'method': trace.method,
+            'status': status_code,
+            'duration_ms': round(total_ms, 3),
+            'phases_ms': {name: round(ms, 3) for name, ms in phases_ms.items()},
+            'query_count': trace.query_count,
+            'rows': trace.rows,
+            'bytes': trace.bytes,
+            'queries': [
+                {'sql': statement_label(statement), 'ms': round(seconds * 1000, 3), 'rows': rows}
+                for statement, seconds, rows in trace.queries
+            ],
+        })
+    if dump_now:
+        dump()
+
+
+def _observe(key: str, ms: float) -> None:
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram()
+    histogram.observe(ms)
+
+
+def histograms() -> Dict[str, Dict[str, Any]]:
+    '''Aggregated phase durations of this container, keyed by "<function> <method> <phase>".'''
+    with _lock:
+        return {key: histogram.snapshot() for key, histogram in sorted(_histograms.items())}
+
+
+def dump() -> None:
+    _emit({'event': 'histograms', 'buckets_ms': list(BUCKETS_MS), 'histograms': histograms()})
+
+
+def _emit(record: Dict[str, Any]) -> None:
+    if orjson is not None:
+        line = orjson.dumps(record).decode('utf-8')
+    else:
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
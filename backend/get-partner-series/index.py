@@ -0,0 +1,109 @@
+from datetime import date, timedelta
+from typing import Dict, Any, List
+import db
+import partner_stats
+import web
+
+DEFAULT_DAYS = 30
+MAX_POINTS = 1000
+
+INTERVALS = ('day', 'week', 'month')
+
+# Serialized series by ETag, per container
+RESPONSES = web.BodyCache(size=256, ttl=60.0)
+
+def period_start(day: date, interval: str) -> date:
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_period(start: date, interval: str) -> date:
+    if interval == 'week':
+        return start + timedelta(days=7)
+    if interval == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+def periods(date_from: date, date_to: date, interval: str) -> List[date]:
+    '''Starts of the periods covering [date_from, date_to], as date_trunc() in SQL computes them.'''
+    result = []
+    start = period_start(date_from, interval)
+    while start <= date_to:
+        result.append(start)
+        start = next_period(start, interval)
+    return result
+
+def point(period: date, values: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'date': period.isoformat(),
+        'total_leads': int(values['total_leads']),
+        'approved_leads': int(values['approved_leads']),
+        'total_commission': float(values['total_commission'] or 0),
+        'by_status': {status: int(values['%s_leads' % status]) for status in partner_stats.STATUSES},
+    }
+
+def build_series(cur: Any, partner_id: str, date_from: date, date_to: date, interval: str,
+                 starts: List[date]) -> Dict[str, Any]:
+    rows = partner_stats.fetch_series(cur, partner_id, date_from, date_to + timedelta(days=1), interval)
+    by_period = {row['period']: row for row in rows}
+    zero = {column: 0 for column in partner_stats.COLUMNS}
+    return {
+        'success': True,
+        'interval': interval,
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        # Periods without leads are returned as zeros so that charts need no gap filling
+        'series': [point(start, by_period.get(start, zero)) for start in starts],
+    }
+
+def get_series(request: web.Request) -> Dict[str, Any]:
+    params = request.query
+    partner_id = params.get('partner_id')
+
+    if not partner_id:
+        raise web.HttpError(400, 'partner_id is required')
+
+    interval = params.get('interval') or 'day'
+    if interval not in INTERVALS:
+        raise web.HttpError(400, 'interval must be one of: %s' % ', '.join(INTERVALS))
+
+    try:
+        date_to = date.fromisoformat(params['date_to']) if params.get('date_to') else date.today()
+        date_from = (date.fromisoformat(params['date_from']) if params.get('date_from')
+                     else date_to - timedelta(days=DEFAULT_DAYS - 1))
+    except ValueError:
+        raise web.HttpError(400, 'date_from/date_to must be ISO dates')
+    if date_from > date_to:
+        raise web.HttpError(400, 'date_from must not be after date_to')
+
+    starts = periods(date_from, date_to, interval)
+    if len(starts) > MAX_POINTS:
+        raise web.HttpError(400, 'Range too long: at most %d points per request' % MAX_POINTS)
+
+    with db.connection() as conn:
+        cur = conn.cursor()
+        # The partner's version changes with every lead change and so with every daily row
+        version = partner_stats.fetch_version(cur, partner_id)
+        result = web.conditional(
+            request,
+            web.etag(version, partner_id, interval, date_from, date_to),
+            lambda: build_series(cur, partner_id, date_from, date_to, interval, starts),
+            RESPONSES
+        )
+        cur.close()
+
+    return result
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Get a partner's lead counts and commission per day, week or month for charts
+    Args: event with httpMethod GET, queryStringParameters with partner_id and
+          optional date_from, date_to (ISO dates, inclusive; default the last
+          30 days) and interval (day, week or month)
+    Returns: One point per period, including periods without leads.
+             Carries an ETag; 304 when If-None-Match still matches
+    '''
+    return web.dispatch(event, context, {'GET': get_series},
+                        allow_headers='Content-Type, X-Partner-Id, If-None-Match')
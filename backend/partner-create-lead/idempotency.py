@@ -0,0 +1,79 @@
+'''
+Idempotency-Key support for lead creation.
+The key is claimed in the same transaction as the lead insert and the final
+response is stored with it, so a retried request replays the original
+response instead of writing a second lead.
+'''
+
+import hashlib
+import os
+import random
+from typing import Any, Optional, Tuple
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+
+PURGE_PROBABILITY = 0.01
+
+
+def fingerprint(body: str) -> str:
+    return hashlib.sha256((body or '').encode('utf-8')).hexdigest()
+
+
+def claim(cur: Any, partner_id: int, key: str, request_hash: str) -> Optional[Tuple[int, str, str]]:
+    '''
+    Reserve key for this request.
+    Returns None when the caller owns the key, otherwise the stored
+    (status_code, response_body, request_hash) to replay. An expired key is
+    taken over. A concurrent request with the same key blocks on the unique
+    index until the first one commits or rolls back.
+    '''
+    cur.execute(
+        '''
+        INSERT INTO {schema}.idempotency_keys (partner_id, idempotency_key, request_hash, expires_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+        ON CONFLICT (partner_id, idempotency_key) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash,
+                status_code = NULL,
+                response_body = NULL,
+                created_at = CURRENT_TIMESTAMP,
+                expires_at = EXCLUDED.expires_at
+            WHERE idempotency_keys.expires_at <= CURRENT_TIMESTAMP
+        RETURNING 1
+        '''.format(schema=SCHEMA),
+        (partner_id, key, request_hash, TTL_HOURS)
+    )
+    if cur.fetchone():
+        if random.random() < PURGE_PROBABILITY:
+            purge_expired(cur)
+        return None
+
+    cur.execute(
+        'SELECT status_code, response_body, request_hash FROM {schema}.idempotency_keys '
+        'WHERE partner_id = %s AND idempotency_key = %s'.format(schema=SCHEMA),
+        (partner_id, key)
+    )
+    return cur.fetchone()
+
+
+def store(cur: Any, partner_id: int, key: str, status_code: int, body: str) -> None:
+    cur.execute(
+        'UPDATE {schema}.idempotency_keys SET status_code = %s, response_body = %s '
+        'WHERE partner_id = %s AND idempotency_key = %s'.format(schema=SCHEMA),
+        (status_code, body, partner_id, key)
+    )
+
+
+def purge_expired(cur: Any, limit: int = 500) -> None:
+    cur.execute(
+        '''
+        DELETE FROM {schema}.idempotency_keys
+        WHERE ctid IN (
+            SELECT ctid FROM {schema}.idempotency_keys
+            WHERE expires_at < CURRENT_TIMESTAMP
+            LIMIT %s
+        )
+        '''.format(schema=SCHEMA),
+        (limit,)
+    )
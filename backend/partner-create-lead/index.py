@@ -1,119 +1,257 @@
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
+import db
+import partner_stats
+import idempotency
+import auth
+import web
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+MAX_BATCH_SIZE = int(os.environ.get('MAX_LEAD_BATCH_SIZE', '500'))
+
+DEDUP_WINDOW_MINUTES = int(os.environ.get('LEAD_DEDUP_WINDOW_MINUTES', '0'))
+
+DEDUP_LOCK_CLASS = 1001
+
+FIELD_LIMITS = {'name': 255, 'phone': 50, 'email': 255}
+
+# Width of leads.client_phone_normalized
+PHONE_DIGITS_LIMIT = 32
+
+def normalize_phone(phone: str) -> str:
+    digits = ''.join(ch for ch in phone if ch.isdigit())
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits
+
+def validate_lead(data: Any) -> Tuple[Optional[Dict[str, str]], Optional[str]]:
+    if not isinstance(data, dict):
+        return None, 'Lead must be an object'
+    lead = {
+        'name': str(data.get('name') or '').strip(),
+        'phone': str(data.get('phone') or '').strip(),
+        'email': str(data.get('email') or '').strip(),
+        'notes': str(data.get('notes') or ''),
+    }
+    if not lead['name'] or not lead['phone']:
+        return None, 'Missing required fields: name, phone'
+    lead['phone_normalized'] = normalize_phone(lead['phone'])
+    for field, limit in FIELD_LIMITS.items():
+        if len(lead[field]) > limit:
+            return None, 'Field %s is longer than %d characters' % (field, limit)
+    if len(lead['phone_normalized']) > PHONE_DIGITS_LIMIT:
+        return None, 'Field phone has more than %d digits' % PHONE_DIGITS_LIMIT
+    return lead, None
+
+def parse_batch(request: web.Request) -> Optional[List[Any]]:
+    '''Returns the list of leads for a batch request, or None for a single-lead body.'''
+    if request.header('content-type').lower().startswith('application/x-ndjson'):
+        return [json.loads(line) for line in request.body.splitlines() if line.strip()]
+    data = request.json()
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and isinstance(data.get('leads'), list):
+        return data['leads']
+    return None
+
+def insert_leads(cur: Any, partner_id: int, leads: List[Dict[str, str]]) -> List[Tuple[int, datetime]]:
+    # Imported here so that preflight and validation errors do not load psycopg2
+    from psycopg2.extras import execute_values
+    return execute_values(
+        cur,
+        """
+        INSERT INTO t_p62408730_traffic_partnership.leads (
+            partner_id, client_name, client_phone, client_phone_normalized,
+            client_email, notes, status
+        )
+        VALUES %s
+        RETURNING id, created_at
+        """,
+        [
+            (partner_id, l['name'], l['phone'], l['phone_normalized'], l['email'], l['notes'])
+            for l in leads
+        ],
+        template="(%s, %s, %s, %s, %s, %s, 'new')",
+        page_size=max(len(leads), 1),
+        fetch=True
+    )
+
+def find_duplicates(cur: Any, partner_id: int, phones: List[str]) -> Dict[str, int]:
     '''
-    Business: Create new lead for authenticated partner
-    Args: event with httpMethod, body (name, phone, email, education_level, notes)
-          context with request_id
-    Returns: HTTP response with created lead
+    Leads of this partner with the same normalized phone created within the
+    dedup window, served by idx_leads_partner_phone. The advisory lock
+    serializes concurrent inserts of one partner until commit.
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    body_str = event.get('body', '{}')
-    body_data = json.loads(body_str) if body_str else {}
-    headers = event.get('headers', {})
-    partner_email = headers.get('x-user-id') or headers.get('X-User-Id', '')
-    
-    if not partner_email:
-        return {
-            'statusCode': 403,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Authentication required'})
-        }
-    
-    name = body_data.get('name', '')
-    phone = body_data.get('phone', '')
-    email = body_data.get('email', '')
-    education_level = body_data.get('education_level', '')
-    notes = body_data.get('notes', '')
-    
-    if not name or not phone:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Missing required fields: name, phone'})
-        }
-    
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
-    
-    cur.execute(
-        "SELECT id FROM partners WHERE email = %s AND is_approved = TRUE",
-        (partner_email,)
-    )
-    partner_row = cur.fetchone()
-    
-    if not partner_row:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 403,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Partner not found or not approved'})
-        }
-    
-    partner_id = partner_row[0]
-    
+    if DEDUP_WINDOW_MINUTES <= 0 or not phones:
+        return {}
+    cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (DEDUP_LOCK_CLASS, partner_id))
     cur.execute(
         """
-        INSERT INTO leads (partner_id, name, phone, email, education_level, notes, status)
-        VALUES (%s, %s, %s, %s, %s, %s, 'new')
-        RETURNING id, created_at
+        SELECT client_phone_normalized, MAX(id)
+        FROM t_p62408730_traffic_partnership.leads
+        WHERE partner_id = %s
+          AND client_phone_normalized = ANY(%s)
+          AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 minute'
+        GROUP BY client_phone_normalized
         """,
-        (partner_id, name, phone, email, education_level, notes)
+        (partner_id, list(set(phones)), DEDUP_WINDOW_MINUTES)
     )
-    
-    lead_row = cur.fetchone()
-    lead_id = lead_row[0]
-    created_at = lead_row[1].isoformat()
-    
-    conn.commit()
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 201,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'success': True,
-            'lead': {
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+def create_leads(request: web.Request) -> Dict[str, Any]:
+    body_str = request.body
+    token = auth.token_from_event(request.event)
+    idempotency_key = request.header('idempotency-key').strip()
+
+    if not token:
+        return web.json_response(403, {'error': 'Authentication required'})
+
+    if len(idempotency_key) > 255:
+        return web.json_response(400, {'error': 'Idempotency-Key is longer than 255 characters'})
+
+    try:
+        batch = parse_batch(request)
+    except ValueError:
+        raise web.HttpError(400, 'Invalid JSON body')
+
+    if batch is None:
+        lead, error = validate_lead(request.json())
+        if error:
+            return web.json_response(400, {'error': error})
+        items = [lead]
+        results: List[Dict[str, Any]] = [{}]
+    else:
+        if not batch or len(batch) > MAX_BATCH_SIZE:
+            return web.json_response(400, {'error': 'Batch must contain 1 to %d leads' % MAX_BATCH_SIZE})
+        items = []
+        results = []
+        for index, item in enumerate(batch):
+            lead, error = validate_lead(item)
+            items.append(lead)
+            results.append({'index': index, 'success': False, 'error': error} if error else {})
+        if not any(items):
+            return batch_response(results)
+
+    # A cached session skips the partner lookup round trip entirely
+    identity = auth.authenticate(token)
+    if not identity:
+        return web.json_response(401, {'error': 'Session expired or invalid'})
+
+    partner_id = identity.partner_id
+
+    with db.connection() as conn:
+        cur = conn.cursor()
+
+        if idempotency_key:
+            request_hash = idempotency.fingerprint(body_str)
+            stored = idempotency.claim(cur, partner_id, idempotency_key, request_hash)
+            if stored:
+                cur.close()
+                conn.rollback()
+                status_code, stored_body, stored_hash = stored
+                if stored_hash != request_hash:
+                    return web.json_response(422, {'error': 'Idempotency-Key was already used with a different request'})
+                return web.response(status_code, stored_body, {
+                    'Content-Type': 'application/json',
+                    'Idempotent-Replayed': 'true'
+                })
+
+        if batch is None:
+            response = create_single(cur, partner_id, items[0])
+        else:
+            response = create_batch(cur, partner_id, items, results)
+
+        if idempotency_key:
+            idempotency.store(cur, partner_id, idempotency_key, response['statusCode'], response['body'])
+
+        conn.commit()
+        cur.close()
+
+    return response
+
+def create_single(cur: Any, partner_id: int, lead: Dict[str, str]) -> Dict[str, Any]:
+    duplicates = find_duplicates(cur, partner_id, [lead['phone_normalized']])
+    if lead['phone_normalized'] in duplicates:
+        return web.json_response(409, {
+            'error': 'Duplicate lead',
+            'lead_id': duplicates[lead['phone_normalized']]
+        })
+
+    lead_id, created_at = insert_leads(cur, partner_id, [lead])[0]
+    partner_stats.apply_lead_change(cur, partner_id, created_at, None, None, 'new', None)
+
+    return web.json_response(201, {
+        'success': True,
+        'lead': {
+            'id': lead_id,
+            'name': lead['name'],
+            'phone': lead['phone'],
+            'email': lead['email'],
+            'notes': lead['notes'],
+            'status': 'new',
+            'created_at': created_at.isoformat()
+        }
+    })
+
+def create_batch(cur: Any, partner_id: int, items: List[Optional[Dict[str, str]]],
+                 results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    '''
+    Insert the valid rows of a batch with one multi-row INSERT ... RETURNING.
+    Invalid and duplicate rows are reported per index and do not fail the batch.
+    '''
+    duplicates = find_duplicates(cur, partner_id, [lead['phone_normalized'] for lead in items if lead])
+
+    valid: List[Dict[str, str]] = []
+    valid_indexes: List[int] = []
+    seen = set()
+    for index, lead in enumerate(items):
+        if not lead:
+            continue
+        phone = lead['phone_normalized']
+        if phone in duplicates:
+            results[index] = {'index': index, 'success': False, 'error': 'Duplicate lead', 'lead_id': duplicates[phone]}
+        elif DEDUP_WINDOW_MINUTES > 0 and phone in seen:
+            results[index] = {'index': index, 'success': False, 'error': 'Duplicate lead in batch'}
+        else:
+            seen.add(phone)
+            valid.append(lead)
+            valid_indexes.append(index)
+
+    if valid:
+        created = insert_leads(cur, partner_id, valid)
+        # Rows of one INSERT share the transaction timestamp
+        partner_stats.apply_new_leads(cur, partner_id, len(created), created[0][1])
+        for index, (lead_id, created_at) in zip(valid_indexes, created):
+            results[index] = {
+                'index': index,
+                'success': True,
                 'id': lead_id,
-                'name': name,
-                'phone': phone,
-                'email': email,
-                'education_level': education_level,
-                'notes': notes,
-                'status': 'new',
-                'created_at': created_at
+                'created_at': created_at.isoformat()
             }
-        })
-    }
\ No newline at end of file
+
+    return batch_response(results)
+
+def batch_response(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    created = sum(1 for result in results if result.get('success'))
+    return web.json_response(201 if created else 400, {
+        'success': created > 0,
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    })
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Create new leads for authenticated partner, one or a batch per request
+    Args: event with httpMethod, X-Auth-Token session header,
+          body (name, phone, email, notes),
+          or a JSON array / {"leads": [...]} / NDJSON body of such objects;
+          optional Idempotency-Key header
+          context with request_id
+    Returns: HTTP response with created lead, or per-row results for a batch
+    '''
+    return web.dispatch(event, context, {'POST': create_leads},
+                        allow_headers='Content-Type, X-Auth-Token, Idempotency-Key')
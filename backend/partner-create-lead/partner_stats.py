@@ -0,0 +1,293 @@
+'''
+Maintained per-partner lead statistics (partner_stats rollup).
+Writers apply deltas in the same transaction as the lead change; readers get
+totals with a primary-key lookup instead of aggregating the leads table.
+Every lead change also bumps the partner's version counter, which pollers use
+as an ETag to skip rereading unchanged leads. Archived leads (leads_archive)
+still count.
+The same deltas go to lead_daily_stats, keyed by partner and the day the
+lead was created, for per-day charts; summed over all days it equals
+partner_stats.
+Vendored into every function that reads or writes the rollup.
+'''
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import queries
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+STATUSES = ('new', 'in_review', 'approved', 'rejected', 'completed')
+
+COUNT_COLUMNS = ['%s_leads' % status for status in STATUSES]
+
+COLUMNS = ['total_leads'] + COUNT_COLUMNS + ['total_commission']
+
+# One rollup row: partner_id, the COLUMNS deltas, then version and updated_at
+ROW_TEMPLATE = '(%s, {placeholders}, 1, CURRENT_TIMESTAMP)'.format(placeholders=', '.join(['%s'] * len(COLUMNS)))
+
+UPSERT_MANY_SQL = '''
+    INSERT INTO {schema}.partner_stats AS s (partner_id, {columns}, version, updated_at)
+    VALUES %s
+    ON CONFLICT (partner_id) DO UPDATE SET
+        {increments},
+        version = s.version + 1,
+        updated_at = CURRENT_TIMESTAMP
+'''.format(
+    schema=SCHEMA,
+    columns=', '.join(COLUMNS),
+    increments=',\n        '.join('%s = s.%s + EXCLUDED.%s' % (c, c, c) for c in COLUMNS),
+)
+
+UPSERT_SQL = UPSERT_MANY_SQL.replace('VALUES %s', 'VALUES ' + ROW_TEMPLATE)
+
+# One daily row: partner_id, the lead's created_at (cast to its day), then the COLUMNS deltas
+DAILY_ROW_TEMPLATE = '(%s, %s::date, {placeholders})'.format(placeholders=', '.join(['%s'] * len(COLUMNS)))
+
+DAILY_UPSERT_MANY_SQL = '''
+    INSERT INTO {schema}.lead_daily_stats AS d (partner_id, day, {columns})
+    VALUES %s
+    ON CONFLICT (partner_id, day) DO UPDATE SET
+        {increments}
+'''.format(
+    schema=SCHEMA,
+    columns=', '.join(COLUMNS),
+    increments=',\n        '.join('%s = d.%s + EXCLUDED.%s' % (c, c, c) for c in COLUMNS),
+)
+
+DAILY_UPSERT_SQL = DAILY_UPSERT_MANY_SQL.replace('VALUES %s', 'VALUES ' + DAILY_ROW_TEMPLATE)
+
+# COLUMNS computed from leads, in order
+AGGREGATES = '''
+        COUNT(*) AS total_leads,
+        {status_counts},
+        COALESCE(SUM(CASE WHEN status = 'approved' THEN commission_amount ELSE 0 END), 0) AS total_commission
+'''.format(
+    status_counts=',\n        '.join(
+        "COUNT(*) FILTER (WHERE status = '%s') AS %s_leads" % (status, status) for status in STATUSES
+    ),
+)
+
+RECOMPUTE_SQL = '''
+    SELECT
+        partner_id,{aggregates}
+    FROM (
+        SELECT partner_id, status, commission_amount FROM {schema}.leads
+        UNION ALL
+        SELECT partner_id, status, commission_amount FROM {schema}.leads_archive
+    ) all_leads
+    GROUP BY partner_id
+'''.format(schema=SCHEMA, aggregates=AGGREGATES)
+
+DAILY_RECOMPUTE_SQL = '''
+    INSERT INTO {schema}.lead_daily_stats (partner_id, day, {columns})
+    SELECT
+        partner_id, created_at::date,{aggregates}
+    FROM (
+        SELECT partner_id, status, commission_amount, created_at FROM {schema}.leads
+        WHERE created_at >= %(start)s AND created_at < %(end)s
+        UNION ALL
+        SELECT partner_id, status, commission_amount, created_at FROM {schema}.leads_archive
+        WHERE created_at >= %(start)s AND created_at < %(end)s
+    ) all_leads
+    GROUP BY partner_id, created_at::date
+'''.format(schema=SCHEMA, columns=', '.join(COLUMNS), aggregates=AGGREGATES)
+
+
+def _commission(status: Optional[str], amount: Any) -> Decimal:
+    if status != 'approved' or amount is None:
+        return Decimal('0')
+    return Decimal(str(amount))
+
+
+def _day(created_at: Any) -> date:
+    return created_at.date() if isinstance(created_at, datetime) else created_at
+
+
+def _lead_deltas(old_status: Optional[str], old_commission: Any, new_status: str, new_commission: Any) -> Dict[str, Any]:
+    deltas: Dict[str, Any] = {column: 0 for column in COLUMNS}
+    if old_status is None:
+        deltas['total_leads'] = 1
+    if old_status in STATUSES:
+        deltas['%s_leads' % old_status] -= 1
+    if new_status in STATUSES:
+        deltas['%s_leads' % new_status] += 1
+    deltas['total_commission'] = _commission(new_status, new_commission) - _commission(old_status, old_commission)
+    return deltas
+
+
+def apply_lead_change(
+    cur: Any,
+    partner_id: int,
+    created_at: Any,
+    old_status: Optional[str],
+    old_commission: Any,
+    new_status: str,
+    new_commission: Any,
+) -> None:
+    '''
+    Apply the delta of one lead change to the rollup and to the daily row of
+    the lead's created_at. old_status is None for a newly created lead. A
+    change without a delta still bumps the version: other lead fields may
+    have changed.
+    '''
+    deltas = _lead_deltas(old_status, old_commission, new_status, new_commission)
+    values = [deltas[column] for column in COLUMNS]
+    cur.execute(UPSERT_SQL, [partner_id] + values)
+    if any(values):
+        cur.execute(DAILY_UPSERT_SQL, [partner_id, created_at] + values)
+
+
+def apply_lead_changes(cur: Any, changes: List[Tuple[int, Any, Optional[str], Any, str, Any]]) -> None:
+    '''
+    apply_lead_change() for a batch of (partner_id, created_at, old_status,
+    old_commission, new_status, new_commission): deltas are summed per
+    partner and per partner and day, and written with one multi-row upsert
+    each, in key order to keep lock order stable.
+    '''
+    totals: Dict[int, Dict[str, Any]] = {}
+    daily: Dict[Tuple[int, date], Dict[str, Any]] = {}
+    for partner_id, created_at, old_status, old_commission, new_status, new_commission in changes:
+        deltas = _lead_deltas(old_status, old_commission, new_status, new_commission)
+        total = totals.setdefault(partner_id, {column: 0 for column in COLUMNS})
+        day = daily.setdefault((partner_id, _day(created_at)), {column: 0 for column in COLUMNS})
+        for column in COLUMNS:
+            total[column] += deltas[column]
+            day[column] += deltas[column]
+    if not totals:
+        return
+    from psycopg2.extras import execute_values
+    execute_values(
+        cur,
+        UPSERT_MANY_SQL,
+        [[partner_id] + [totals[partner_id][column] for column in COLUMNS] for partner_id in sorted(totals)],
+        template=ROW_TEMPLATE,
+        page_size=len(totals)
+    )
+    days = [list(key) + [daily[key][column] for column in COLUMNS]
+            for key in sorted(daily) if any(daily[key].values())]
+    if days:
+        execute_values(cur, DAILY_UPSERT_MANY_SQL, days, template=DAILY_ROW_TEMPLATE, page_size=len(days))
+
+
+def apply_new_leads(cur: Any, partner_id: int, count: int, created_at: Any, status: str = 'new') -> None:
+    '''Apply a batch of count leads created at created_at with the same status.'''
+    if count <= 0:
+        return
+    deltas: Dict[str, Any] = {column: 0 for column in COLUMNS}
+    deltas['total_leads'] = count
+    if status in STATUSES:
+        deltas['%s_leads' % status] = count
+    values = [deltas[column] for column in COLUMNS]
+    cur.execute(UPSERT_SQL, [partner_id] + values)
+    cur.execute(DAILY_UPSERT_SQL, [partner_id, created_at] + values)
+
+
+def fetch_version(cur: Any, partner_id: Any) -> int:
+    '''Change counter of the partner's leads; 0 before the first lead.'''
+    row = queries.fetch_one(cur, queries.PARTNER_VERSION, (partner_id,))
+    return row.version if row else 0
+
+
+def fetch_series(cur: Any, partner_id: Any, start: date, end: date, interval: str = 'day') -> List[Dict[str, Any]]:
+    '''
+    Daily rows of [start, end) summed per interval ('day', 'week' or
+    'month'), one row per period that has leads; one range scan of the
+    primary key.
+    '''
+    cur.execute(
+        '''
+        SELECT date_trunc(%s, day::timestamp)::date AS period, {sums}
+        FROM {schema}.lead_daily_stats
+        WHERE partner_id = %s AND day >= %s AND day < %s
+        GROUP BY 1
+        ORDER BY 1
+        '''.format(schema=SCHEMA, sums=', '.join('SUM(%s) AS %s' % (c, c) for c in COLUMNS)),
+        (interval, partner_id, start, end)
+    )
+    return [dict(zip(['period'] + COLUMNS, row)) for row in cur.fetchall()]
+
+
+def fetch_statistics(cur: Any, partner_id: Any) -> Dict[str, Any]:
+    return statistics(queries.fetch_one(cur, queries.PARTNER_STATISTICS, (partner_id,)))
+
+
+def statistics(row: Optional[Any]) -> Dict[str, Any]:
+    '''The statistics payload of a PARTNER_STATISTICS record (None before the first lead).'''
+    values = row._asdict() if row else {column: 0 for column in COLUMNS}
+    return {
+        'total_leads': values['total_leads'],
+        'approved_leads': values['approved_leads'],
+        'total_commission': float(values['total_commission'] or 0),
+        'by_status': {status: values['%s_leads' % status] for status in STATUSES},
+    }
+
+
+def reconcile(conn: Any, fix: bool = False) -> List[Dict[str, Any]]:
+    '''
+    Compare the rollup with a full recompute from leads.
+    Returns the mismatching partners; with fix=True rewrites their rows.
+    The rows written are absolute values, so with fix=True writers are held
+    off by a table lock from before the recompute until the commit: a lead
+    change committed in between would otherwise be overwritten. A writer
+    that has changed leads but not yet the rollup waits and applies its delta
+    on top of the rewritten row.
+    '''
+    cur = conn.cursor()
+    if fix:
+        cur.execute('LOCK TABLE %s.partner_stats IN SHARE ROW EXCLUSIVE MODE' % SCHEMA)
+    cur.execute(RECOMPUTE_SQL)
+    expected = {row[0]: dict(zip(COLUMNS, row[1:])) for row in cur.fetchall()}
+
+    cur.execute('SELECT partner_id, %s FROM %s.partner_stats' % (', '.join(COLUMNS), SCHEMA))
+    actual = {row[0]: dict(zip(COLUMNS, row[1:])) for row in cur.fetchall()}
+
+    zero = {column: 0 for column in COLUMNS}
+    mismatches = []
+    for partner_id in sorted(set(expected) | set(actual)):
+        want = expected.get(partner_id, zero)
+        have = actual.get(partner_id, zero)
+        if any(want[column] != have[column] for column in COLUMNS):
+            mismatches.append({'partner_id': partner_id, 'expected': want, 'actual': have})
+
+    if fix and mismatches:
+        for mismatch in mismatches:
+            want = mismatch['expected']
+            cur.execute(
+                '''
+                INSERT INTO {schema}.partner_stats AS s (partner_id, {columns}, version, updated_at)
+                VALUES (%s, {placeholders}, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (partner_id) DO UPDATE SET
+                    {assignments}, version = s.version + 1, updated_at = CURRENT_TIMESTAMP
+                '''.format(
+                    schema=SCHEMA,
+                    columns=', '.join(COLUMNS),
+                    placeholders=', '.join(['%s'] * len(COLUMNS)),
+                    assignments=', '.join('%s = EXCLUDED.%s' % (c, c) for c in COLUMNS),
+                ),
+                [mismatch['partner_id']] + [want[column] for column in COLUMNS]
+            )
+    if fix:
+        conn.commit()
+
+    cur.close()
+    return mismatches
+
+
+def rebuild_daily(conn: Any, start: date, end: date) -> int:
+    '''
+    Recompute the lead_daily_stats rows of days in [start, end) from leads
+    and leads_archive in one transaction; returns the rows written.
+    Writers are held off by the table lock for its duration, so no delta
+    committed meanwhile is lost or counted twice.
+    '''
+    cur = conn.cursor()
+    cur.execute('LOCK TABLE %s.lead_daily_stats IN SHARE ROW EXCLUSIVE MODE' % SCHEMA)
+    cur.execute('DELETE FROM %s.lead_daily_stats WHERE day >= %%s AND day < %%s' % SCHEMA, (start, end))
+    cur.execute(DAILY_RECOMPUTE_SQL, {'start': start, 'end': end})
+    written = cur.rowcount
+    conn.commit()
+    cur.close()
+    return written
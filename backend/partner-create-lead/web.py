@@ -0,0 +1,433 @@
+'''
+Routing and response helpers shared by the backend functions.
+dispatch() answers CORS preflight and unsupported methods itself and turns
+HttpError into a JSON error response, so those paths never reach the
+database. Every invocation is traced (tracing.py). All JSON goes through dumps(), which serializes Decimal and
+datetime values directly (orjson when installed, stdlib json otherwise).
+conditional() serves polled GETs by version: 304 for a matching If-None-Match,
+otherwise a body from the in-process BodyCache or freshly serialized.
+dispatch_async() and conditional_async() take coroutines instead, for the
+asyncio path of a handler (asyncdb.py).
+Bodies of COMPRESS_MIN_BYTES and more go out brotli- or gzip-encoded (as
+isBase64Encoded) when the client accepts it; brotli only when installed.
+List endpoints shape their rows with fields= (projection) and
+format=compact (column names once, then an array of values per row).
+'''
+
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import tracing
+
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+# Browsers store the body but revalidate it with If-None-Match on every poll
+VALIDATOR_HEADERS = {'Cache-Control': 'private, no-cache', 'Access-Control-Expose-Headers': 'ETag'}
+
+# Smaller bodies are sent as they are: the saving does not pay for compression and base64
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+# Quality 4 is smaller than gzip level 6 in about two thirds of its time (benchmarks/payload_encoding.py)
+BROTLI_QUALITY = 4
+
+COMPACT = 'compact'
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
+
+
+def dumps(payload: Any) -> str:
+    started = time.perf_counter()
+    if orjson is not None:
+        text = orjson.dumps(payload, default=_default).decode('utf-8')
+    else:
+        text = json.dumps(payload, default=_default, ensure_ascii=False)
+    tracing.add_phase('serialize', time.perf_counter() - started)
+    return text
+
+
+def accepted_encoding(header: str) -> Optional[str]:
+    '''br or gzip, whichever an Accept-Encoding header allows (br first), or None.'''
+    weights: Dict[str, float] = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if weights.get(encoding, weights.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: str, encoding: str) -> str:
+    '''body compressed with encoding, in base64 for an isBase64Encoded response.'''
+    started = time.perf_counter()
+    data = body.encode('utf-8')
+    if encoding == 'br':
+        packed = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(data, GZIP_LEVEL, mtime=0)
+    text = base64.b64encode(packed).decode('ascii')
+    tracing.add_phase('compress', time.perf_counter() - started)
+    return text
+
+
+class HttpError(Exception):
+    def __init__(self, status_code: int, message: str, headers: Optional[Dict[str, str]] = None, **extra: Any):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.headers = headers
+        self.extra = extra
+
+
+class Request:
+    __slots__ = ('event', 'context', 'method', 'headers', 'query', 'body', '_json')
+
+    def __init__(self, event: Dict[str, Any], context: Any):
+        self.event = event
+        self.context = context
+        self.method = event.get('httpMethod', 'GET')
+        self.headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        self.query = event.get('queryStringParameters') or {}
+        body = event.get('body') or ''
+        if body and event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+        self.body = body
+        self._json = None
+
+    def header(self, name: str, default: str = '') -> str:
+        return self.headers.get(name.lower(), default) or default
+
+    def client_ip(self) -> str:
+        '''
+        Caller address as seen by the gateway; the first X-Forwarded-For hop
+        is only a fallback, since the client controls that header.
+        '''
+        identity = (self.event.get('requestContext') or {}).get('identity') or {}
+        address = identity.get('sourceIp') or self.header('X-Forwarded-For').split(',')[0]
+        return address.strip()
+
+    def accepted_encoding(self) -> Optional[str]:
+        return accepted_encoding(self.header('Accept-Encoding'))
+
+    def json(self) -> Any:
+        '''Parsed JSON body ({} when empty); invalid JSON is a 400.'''
+        if self._json is None:
+            try:
+                self._json = json.loads(self.body) if self.body else {}
+            except ValueError:
+                raise HttpError(400, 'Invalid JSON body')
+        return self._json
+
+    def matches_etag(self, tag: str) -> bool:
+        '''True when If-None-Match names tag (weak comparison, as for GET).'''
+        header = self.header('If-None-Match').strip()
+        if not header:
+            return False
+        if header == '*':
+            return True
+        return any(candidate.strip().replace('W/', '', 1) == tag for candidate in header.split(','))
+
+
+class BodyCache:
+    '''
+    Serialized bodies keyed by ETag, kept for ttl seconds and at most size
+    entries (least recently used are dropped). An ETag names one version of
+    the data, so an entry never goes stale; the ttl only bounds memory held
+    for versions nobody polls any more.
+    '''
+
+    def __init__(self, size: int = 128, ttl: float = 60.0):
+        self.size = size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tag: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(tag)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[tag]
+                return None
+            self._entries.move_to_end(tag)
+            return entry[1]
+
+    def put(self, tag: str, body: str) -> None:
+        with self._lock:
+            self._entries[tag] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(tag)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+def etag(version: Any, *parts: Any) -> str:
+    '''Strong ETag from the data version and whatever else shapes the body (query parameters).'''
+    import hashlib
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=8).hexdigest()
+    return '"%s-%s"' % (version, digest)
+
+
+def response(status_code: int, body: str = '', headers: Optional[Dict[str, str]] = None,
+             is_base64: bool = False) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': dict(CORS_HEADERS, **(headers or {})),
+        'isBase64Encoded': is_base64,
+        'body': body
+    }
+
+
+def json_response(status_code: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': dict(JSON_HEADERS, **headers) if headers else dict(JSON_HEADERS),
+        'isBase64Encoded': False,
+        'body': dumps(payload)
+    }
+
+
+def conditional(request: Request, tag: str, build: Callable[[], Any],
+                cache: Optional[BodyCache] = None) -> Dict[str, Any]:
+    '''
+    Respond to a GET whose payload is fully determined by tag: 304 when the
+    client already holds it, else the cached body, else build() serialized
+    (and cached). build() only runs on a miss. Compressed bodies are cached
+    per encoding as well, so a hit costs neither serializing nor compressing.
+    '''
+    result, body = _cached(request, tag, cache)
+    if result is not None:
+        return result
+    if body is None:
+        body = _store(tag, build(), cache)
+    return _body_response(request, tag, body, cache)
+
+
+async def conditional_async(request: Request, tag: str, build: Callable[[], Awaitable[Any]],
+                            cache: Optional[BodyCache] = None) -> Dict[str, Any]:
+    '''conditional() for a coroutine build(), awaited only on a miss.'''
+    result, body = _cached(request, tag, cache)
+    if result is not None:
+        return result
+    if body is None:
+        body = _store(tag, await build(), cache)
+    return _body_response(request, tag, body, cache)
+
+
+def _validator_headers(tag: str) -> Dict[str, str]:
+    return dict(VALIDATOR_HEADERS, ETag=tag, Vary='Accept-Encoding')
+
+
+def _cached(request: Request, tag: str, cache: Optional[BodyCache]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    '''(response, None) for a 304 or a cached encoded body, else (None, the cached body or None).'''
+    headers = _validator_headers(tag)
+    if request.matches_etag(tag):
+        return response(304, '', headers), None
+    if cache is None:
+        return None, None
+    encoding = request.accepted_encoding()
+    if encoding:
+        encoded = cache.get('%s;%s' % (tag, encoding))
+        if encoded is not None:
+            return _encoded_response(encoded, encoding, headers), None
+    return None, cache.get(tag)
+
+
+def _store(tag: str, payload: Any, cache: Optional[BodyCache]) -> str:
+    body = dumps(payload)
+    if cache is not None:
+        cache.put(tag, body)
+    return body
+
+
+def _body_response(request: Request, tag: str, body: str, cache: Optional[BodyCache]) -> Dict[str, Any]:
+    headers = _validator_headers(tag)
+    encoding = request.accepted_encoding()
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        encoded = compress(body, encoding)
+        if cache is not None:
+            cache.put('%s;%s' % (tag, encoding), encoded)
+        return _encoded_response(encoded, encoding, headers)
+    return {
+        'statusCode': 200,
+        'headers': dict(JSON_HEADERS, **headers),
+        'isBase64Encoded': False,
+        'body': body
+    }
+
+
+def _encoded_response(encoded: str, encoding: str, headers: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': dict(JSON_HEADERS, **headers, **{'Content-Encoding': encoding}),
+        'isBase64Encoded': True,
+        'body': encoded
+    }
+
+
+def compress_response(accept_encoding: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    '''result with its body compressed when it is large and accept_encoding allows it.'''
+    body = result.get('body')
+    if result.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return result
+    headers = result.get('headers') or {}
+    if 'Content-Encoding' in headers:
+        return result
+    headers = dict(headers, Vary='Accept-Encoding')
+    encoding = accepted_encoding(accept_encoding)
+    if encoding is None:
+        return dict(result, headers=headers)
+    headers['Content-Encoding'] = encoding
+    return dict(result, headers=headers, isBase64Encoded=True, body=compress(body, encoding))
+
+
+def select_fields(request: Request, columns: Sequence[str]) -> Optional[List[str]]:
+    '''
+    Columns named by fields= (comma-separated) in the order given, or None
+    when it is absent; names outside columns are a 400.
+    '''
+    value = request.query.get('fields')
+    if value is None:
+        return None
+    names = list(OrderedDict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in columns]
+    if unknown or not names:
+        raise HttpError(400, 'Unknown or empty fields', fields=unknown, allowed=list(columns))
+    return names
+
+
+def is_compact(request: Request) -> bool:
+    return request.query.get('format') == COMPACT
+
+
+def rows_payload(request: Request, rows: Sequence[Any], columns: Sequence[str],
+                 selected: Optional[Sequence[str]] = None) -> Any:
+    '''
+    rows as a list endpoint returns them: objects, or with format=compact
+    {"columns": [...], "rows": [[...], ...]}; selected (from select_fields)
+    narrows both to those columns. Rows are mappings, or tuples in the order
+    of columns, which compact output passes through without a per-row copy.
+    '''
+    names = list(selected or columns)
+    if rows and not isinstance(rows[0], Mapping):
+        if names != list(columns):
+            positions = [list(columns).index(name) for name in names]
+            rows = [[row[i] for i in positions] for row in rows]
+        if is_compact(request):
+            return {'columns': names, 'rows': rows}
+        return [dict(zip(names, row)) for row in rows]
+    if is_compact(request):
+        return {'columns': names, 'rows': [[row[name] for name in names] for row in rows]}
+    if selected is None:
+        return list(rows)
+    return [{name: row[name] for name in names} for row in rows]
+
+
+def error(status_code: int, message: str, headers: Optional[Dict[str, str]] = None,
+          **extra: Any) -> Dict[str, Any]:
+    payload = {'error': message}
+    payload.update(extra)
+    return json_response(status_code, payload, headers)
+
+
+def dispatch(event: Dict[str, Any], context: Any, routes: Dict[str, Callable[[Request], Dict[str, Any]]],
+             allow_headers: str = 'Content-Type') -> Dict[str, Any]:
+    method = event.get('httpMethod', 'GET')
+    token = tracing.start(context, method)
+    result = None
+    try:
+        result = _preflight(method, routes, allow_headers)
+        if result is None:
+            try:
+                result = routes[method](Request(event, context))
+            except HttpError as exc:
+                result = error(exc.status_code, exc.message, exc.headers, **exc.extra)
+        result = compress_response(_accept_encoding(event), result)
+        return result
+    finally:
+        _finish(token, result)
+
+
+async def dispatch_async(event: Dict[str, Any], context: Any,
+                         routes: Dict[str, Callable[[Request], Awaitable[Dict[str, Any]]]],
+                         allow_headers: str = 'Content-Type') -> Dict[str, Any]:
+    '''dispatch() for coroutine routes.'''
+    method = event.get('httpMethod', 'GET')
+    token = tracing.start(context, method)
+    result = None
+    try:
+        result = _preflight(method, routes, allow_headers)
+        if result is None:
+            try:
+                result = await routes[method](Request(event, context))
+            except HttpError as exc:
+                result = error(exc.status_code, exc.message, exc.headers, **exc.extra)
+        result = compress_response(_accept_encoding(event), result)
+        return result
+    finally:
+        _finish(token, result)
+
+
+def _accept_encoding(event: Dict[str, Any]) -> str:
+    return next((v for k, v in (event.get('headers') or {}).items() if k.lower() == 'accept-encoding'), '') or ''
+
+
+def _finish(token: Any, result: Optional[Dict[str, Any]]) -> None:
+    if result is None:
+        tracing.finish(token, 502, 0)
+    else:
+        tracing.finish(token, result['statusCode'], len(result.get('body') or ''))
+
+
+def _preflight(method: str, routes: Dict[str, Any], allow_headers: str) -> Optional[Dict[str, Any]]:
+    '''The response to CORS preflight or an unrouted method; None when a route handles it.'''
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': ', '.join(list(routes) + ['OPTIONS']),
+                'Access-Control-Allow-Headers': allow_headers,
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    if method not in routes:
+        return error(405, 'Method not allowed')
+    return None
@@ -0,0 +1,126 @@
+'''
+Morning queue in admin-manage: one call per item versus one batch call.
+
+    DATABASE_URL=... python benchmarks/admin_batch.py
+    DATABASE_URL=... python benchmarks/admin_batch.py --items 300 --workers 4
+
+Registers --items pending partners directly in the database, then approves
+half of them with one POST per partner and the other half with a single
+batch POST; the same for lead status updates (one PUT per lead versus one
+batch PUT over --items leads). Handlers are called in-process; the benchmark
+partners and their leads are deleted at the end. Approvals are dominated by
+password hashing, so they also depend on HASH_WORKERS (--workers) and the
+cores available.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, List
+
+from common import Context, load_function
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+
+def call(module: Any, method: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    response = module.handler({'httpMethod': method, 'body': json.dumps(body)}, Context())
+    assert response['statusCode'] == 200, response
+    return json.loads(response['body'])
+
+
+def create_partners(module: Any, count: int, run_id: str) -> List[int]:
+    with module.db.connection() as conn:
+        cur = conn.cursor()
+        ids = []
+        for index in range(count):
+            cur.execute(
+                'INSERT INTO {schema}.partners (name, email, phone) VALUES (%s, %s, %s) RETURNING id'.format(
+                    schema=SCHEMA),
+                ('Batch bench %d' % index, 'batch-%s-%d@example.com' % (run_id, index), '+79990000000')
+            )
+            ids.append(cur.fetchone()[0])
+        conn.commit()
+    return ids
+
+
+def create_leads(module: Any, partner_id: int, count: int) -> List[int]:
+    with module.db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            INSERT INTO {schema}.leads (partner_id, client_name, client_phone, status)
+            SELECT %s, 'Batch client ' || n, '+7916' || lpad(n::text, 7, '0'), 'new'
+            FROM generate_series(1, %s) AS n
+            RETURNING id, created_at
+        '''.format(schema=SCHEMA), (partner_id, count))
+        rows = cur.fetchall()
+        ids = [row[0] for row in rows]
+        module.partner_stats.apply_new_leads(cur, partner_id, count, rows[0][1])
+        conn.commit()
+    return ids
+
+
+def cleanup(module: Any, run_id: str) -> None:
+    with module.db.connection() as conn:
+        cur = conn.cursor()
+        pattern = 'batch-%s-%%' % run_id
+        cur.execute('''
+            DELETE FROM {schema}.leads
+            WHERE partner_id IN (SELECT id FROM {schema}.partners WHERE email LIKE %s)
+        '''.format(schema=SCHEMA), (pattern,))
+        cur.execute('DELETE FROM {schema}.partners WHERE email LIKE %s'.format(schema=SCHEMA), (pattern,))
+        conn.commit()
+
+
+def timed(label: str, count: int, function: Any) -> float:
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    print('%-28s %6d items %9.1f ms %9.2f ms/item' % (label, count, elapsed * 1000, elapsed * 1000 / count))
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200, help='partners to approve and leads to update')
+    parser.add_argument('--workers', type=int, help='HASH_WORKERS for the batch approval')
+    args = parser.parse_args()
+
+    os.environ.setdefault('PGOPTIONS', '-c search_path=%s,public' % SCHEMA)
+    os.environ.setdefault('TRACE_LOG', '0')
+    if args.workers:
+        os.environ['HASH_WORKERS'] = str(args.workers)
+    module = load_function('admin-manage')
+    print('hash workers: %d' % module.hashers.HASH_WORKERS)
+
+    run_id = uuid.uuid4().hex[:8]
+    try:
+        partners = create_partners(module, args.items, run_id)
+        half = len(partners) // 2
+        single, batched = partners[:half], partners[half:]
+        timed('approve, one call each', len(single), lambda: [
+            call(module, 'POST', {'action': 'approve', 'partner_id': partner_id, 'password': 'secret-%d' % partner_id})
+            for partner_id in single
+        ])
+        timed('approve, one batch', len(batched), lambda: call(module, 'POST', {
+            'action': 'approve',
+            'partners': [{'partner_id': partner_id, 'password': 'secret-%d' % partner_id} for partner_id in batched],
+        }))
+
+        leads = create_leads(module, partners[0], args.items)
+        timed('lead status, one call each', len(leads), lambda: [
+            call(module, 'PUT', {'lead_id': lead_id, 'status': 'in_review'}) for lead_id in leads
+        ])
+        timed('lead status, one batch', len(leads), lambda: call(module, 'PUT', {
+            'leads': [{'lead_id': lead_id, 'status': 'approved', 'commission_amount': 1500} for lead_id in leads],
+        }))
+    finally:
+        cleanup(module, run_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+'''
+Admin overview in one statement (admin-get-partners view=overview) versus
+the call sequence the admin panel makes today.
+
+    DATABASE_URL=... python benchmarks/admin_overview.py
+    DATABASE_URL=... python benchmarks/admin_overview.py --calls 200 --cold
+
+The sequence is admin-get-partners (is_admin check, list version, partner
+list), admin-manage action=partners and admin-manage action=leads limited by
+date_from to about one page of the most recent leads. Handlers are called
+in-process, each function with its own connection pool, as on the platform.
+With --cold every call first drops its function's pooled connections, so
+each function pays the connection handshake again, as a cold container
+does. Reports median and p95 latency per request of each variant, and the
+database statements it sends. The handlers run next to the database here, so
+the numbers leave out the network: on the platform every call and every
+statement adds one more round trip (and with --cold one more handshake).
+'''
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from common import Context, load_function, percentile
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+
+class StatementCounter:
+    '''Counts the statements db.py reports to tracing, across functions.'''
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def install(self, module: Any) -> None:
+        tracing = module.db.tracing
+        record_query = tracing.record_query
+
+        def counted(statement: Any, seconds: float, rows: int) -> None:
+            self.count += 1
+            record_query(statement, seconds, rows)
+
+        tracing.record_query = counted
+
+
+def call(module: Any, query: Dict[str, str], cold: bool) -> None:
+    if cold and module.db._pool is not None:
+        module.db._pool.closeall()
+        module.db._pool = None
+    response = module.handler({'httpMethod': 'GET', 'queryStringParameters': query}, Context())
+    assert response['statusCode'] == 200, response
+
+
+def measure(run: Callable[[], None], calls: int) -> List[float]:
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100, help='requests per variant')
+    parser.add_argument('--page', type=int, default=20, help='recent leads the sequence reads')
+    parser.add_argument('--cold', action='store_true', help='reconnect on every call')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TRACE_LOG', '0')
+    partners = load_function('admin-get-partners')
+    manage = load_function('admin-manage')
+    counter = StatementCounter()
+    counter.install(partners)
+    counter.install(manage)
+
+    with partners.db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT id FROM {schema}.partners WHERE is_admin ORDER BY id LIMIT 1'.format(schema=SCHEMA))
+        admin = cur.fetchone()
+        if not admin:
+            raise SystemExit('no admin partner; run benchmarks/load_test.py once to create one')
+        cur.execute(
+            'SELECT created_at FROM {schema}.leads ORDER BY created_at DESC OFFSET %s LIMIT 1'.format(schema=SCHEMA),
+            (args.page - 1,)
+        )
+        page_start = cur.fetchone()
+        cur.close()
+    admin_id = str(admin[0])
+    date_from = page_start[0].isoformat() if page_start else '1970-01-01'
+
+    def sequence() -> None:
+        call(partners, {'admin_id': admin_id}, args.cold)
+        call(manage, {'action': 'partners'}, args.cold)
+        call(manage, {'action': 'leads', 'date_from': date_from}, args.cold)
+
+    def overview() -> None:
+        call(partners, {'admin_id': admin_id, 'view': 'overview'}, args.cold)
+
+    variants = {'sequence (3 calls)': sequence, 'overview (1 call)': overview}
+    for run in variants.values():
+        run()
+
+    print('%s connections, %d requests per variant' % ('cold' if args.cold else 'warm', args.calls))
+    print('%-20s %10s %10s %12s' % ('variant', 'p50 ms', 'p95 ms', 'statements'))
+    for name, run in variants.items():
+        counter.count = 0
+        timings = measure(run, args.calls)
+        print('%-20s %10.1f %10.1f %12.1f' % (
+            name, statistics.median(timings), percentile(timings, 95), counter.count / args.calls))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
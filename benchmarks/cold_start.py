@@ -0,0 +1,137 @@
+'''
+Cold-start cost of each backend function: module import time, the first
+CORS preflight and the first request that is rejected before touching the
+database, each measured in a fresh interpreter.
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --function auth-login --runs 10 --top 8
+    python benchmarks/cold_start.py --json > cold_start.json
+
+Every run starts a new `python -X importtime` process, so the numbers are
+what a new container pays. The per-function breakdown lists the heaviest
+top-level imports made while loading index.py (cumulative microseconds from
+-X importtime); medians over --runs processes are reported. Store the --json
+output to compare against later runs and spot cold-start regressions.
+'''
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BENCHMARKS = Path(__file__).resolve().parent
+
+BEGIN = '-- cold_start: load begin --'
+END = '-- cold_start: load end --'
+
+# A request per function that is answered without a database connection
+FIRST_REQUESTS: Dict[str, Dict[str, Any]] = {
+    'admin-get-partners': {'httpMethod': 'GET', 'queryStringParameters': {}},
+    'admin-login': {'httpMethod': 'POST', 'body': '{}'},
+    'admin-manage': {'httpMethod': 'POST', 'body': '{"action": "approve"}'},
+    'auth-login': {'httpMethod': 'POST', 'body': '{"email": "not-an-email", "password": "x"}'},
+    'get-partner-leads': {'httpMethod': 'GET', 'queryStringParameters': {}},
+    'partner-create-lead': {'httpMethod': 'POST', 'body': '{}'},
+    'register-partner': {'httpMethod': 'POST', 'body': '{}'},
+}
+
+PROBE = '''
+import json, sys, time
+sys.path.insert(0, %(benchmarks)r)
+from common import load_function, Context
+sys.stderr.write(%(begin)r + '\\n')
+started = time.perf_counter()
+module = load_function(%(name)r)
+import_ms = (time.perf_counter() - started) * 1000
+sys.stderr.write(%(end)r + '\\n')
+timings = {'import_ms': import_ms}
+for label, event in (('preflight', {'httpMethod': 'OPTIONS'}), ('first_request', %(event)r)):
+    started = time.perf_counter()
+    response = module.handler(dict(event, headers={}), Context())
+    timings[label + '_ms'] = (time.perf_counter() - started) * 1000
+    timings[label + '_status'] = response['statusCode']
+timings['modules'] = len(sys.modules)
+print(json.dumps(timings))
+'''
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    '''Cumulative microseconds of the top-level imports between the load markers.'''
+    lines = stderr.splitlines()
+    try:
+        window = lines[lines.index(BEGIN) + 1:lines.index(END)]
+    except ValueError:
+        return {}
+    entries: List[Tuple[int, str, int]] = []
+    for line in window:
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        indent = len(name) - len(name.lstrip(' '))
+        entries.append((indent, name.strip(), int(cumulative)))
+    if not entries:
+        return {}
+    top = min(indent for indent, _, _ in entries)
+    return {name: cumulative for indent, name, cumulative in entries if indent == top}
+
+
+def run_once(name: str) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    script = PROBE % {
+        'benchmarks': str(BENCHMARKS), 'begin': BEGIN, 'end': END,
+        'name': name, 'event': FIRST_REQUESTS[name],
+    }
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError('%s failed:\n%s' % (name, proc.stderr[-2000:]))
+    return json.loads(proc.stdout.strip().splitlines()[-1]), parse_importtime(proc.stderr)
+
+
+def measure(name: str, runs: int) -> Dict[str, Any]:
+    samples = [run_once(name) for _ in range(runs)]
+    result: Dict[str, Any] = {'function': name}
+    for key in ('import_ms', 'preflight_ms', 'first_request_ms'):
+        result[key] = statistics.median(timings[key] for timings, _ in samples)
+    result['first_request_status'] = samples[-1][0]['first_request_status']
+    result['modules'] = samples[-1][0]['modules']
+    modules = set().union(*(imports for _, imports in samples))
+    result['imports_us'] = {
+        module: int(statistics.median(imports.get(module, 0) for _, imports in samples))
+        for module in modules
+    }
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--function', action='append', choices=sorted(FIRST_REQUESTS),
+                        help='function to measure (repeatable, default: all)')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per function')
+    parser.add_argument('--top', type=int, default=5, help='heaviest imports to list per function')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = [measure(name, args.runs) for name in (args.function or sorted(FIRST_REQUESTS))]
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+
+    print('%-20s %10s %13s %16s %8s' % ('function', 'import ms', 'preflight ms', 'first req ms', 'modules'))
+    for result in results:
+        print('%-20s %10.1f %13.2f %12.2f %3d %8d' % (
+            result['function'], result['import_ms'], result['preflight_ms'],
+            result['first_request_ms'], result['first_request_status'], result['modules']))
+    for result in results:
+        heaviest = sorted(result['imports_us'].items(), key=lambda item: -item[1])[:args.top]
+        print('\n%s heaviest imports at load:' % result['function'])
+        for module, micros in heaviest:
+            print('  %-28s %8.1f ms' % (module, micros / 1000.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
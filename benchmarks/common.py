@@ -0,0 +1,48 @@
+'''
+Helpers shared by the benchmarks: loading a backend function's handler the
+way the platform does (its directory first on sys.path) and percentile math.
+'''
+
+import importlib.util
+import sys
+from pathlib import Path
+from typing import Any, Callable, List
+
+BACKEND = Path(__file__).resolve().parent.parent / 'backend'
+
+
+def load_function(name: str) -> Any:
+    '''
+    Import backend/<name>/index.py as an isolated module.
+    Vendored helpers (db.py, ...) share module names across functions, so any
+    copy imported for another function is evicted from sys.modules first.
+    '''
+    function_dir = BACKEND / name
+    for module_name, module in list(sys.modules.items()):
+        module_file = getattr(module, '__file__', None) or ''
+        if module_file.startswith(str(BACKEND)) and not module_file.startswith(str(function_dir) + '/'):
+            del sys.modules[module_name]
+    sys.path[:] = [p for p in sys.path if not p.startswith(str(BACKEND))]
+    sys.path.insert(0, str(function_dir))
+    spec = importlib.util.spec_from_file_location('function_%s' % name.replace('-', '_'), function_dir / 'index.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_handler(name: str) -> Callable[[dict, Any], dict]:
+    return load_function(name).handler
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+class Context:
+    def __init__(self, request_id: str = 'bench'):
+        self.request_id = request_id
+        self.function_name = 'bench'
@@ -0,0 +1,108 @@
+'''
+TCP proxy in front of PostgreSQL that delays traffic by a fixed round-trip
+time, to see locally what each query round trip costs once the database is
+on another host, as on the platform.
+
+    python benchmarks/db_latency.py --target /tmp/pg/.s.PGSQL.5432 --port 6543 --rtt-ms 1
+    RATELIMIT=0 DATABASE_URL=postgresql://postgres@127.0.0.1:6543/traffic python scripts/dev_server.py
+
+--target is the server's address, host:port or the path of its unix
+socket. Every chunk read on either side is forwarded --rtt-ms / 2 later,
+in order, so a request and its response pay --rtt-ms together; bytes
+already in flight are not held back by later ones. Threads and
+time.sleep() keep the delay accurate well below a millisecond.
+'''
+
+import argparse
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Any, Tuple
+
+
+def forward(source: socket.socket, target: socket.socket, delay: float) -> None:
+    '''Copy source to target, each chunk delay seconds after it arrived, until source closes.'''
+    pending: 'queue.Queue[Tuple[float, bytes]]' = queue.Queue()
+
+    def send() -> None:
+        try:
+            while True:
+                due, data = pending.get()
+                if not data:
+                    break
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                target.sendall(data)
+            target.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    while True:
+        try:
+            data = source.recv(65536)
+        except OSError:
+            data = b''
+        pending.put((time.monotonic() + delay, data))
+        if not data:
+            break
+    sender.join()
+
+
+def connect(target: str) -> socket.socket:
+    if target.startswith('/'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(target)
+        return sock
+    host, _, port = target.rpartition(':')
+    sock = socket.create_connection((host, int(port)))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def make_handler(target: str, delay: float) -> Any:
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self) -> None:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                server = connect(target)
+            except OSError:
+                return
+            upstream = threading.Thread(target=forward, args=(self.request, server, delay), daemon=True)
+            upstream.start()
+            forward(server, self.request, delay)
+            upstream.join()
+            server.close()
+
+    return Handler
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', required=True, help='PostgreSQL address: host:port or unix socket path')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=6543, help='port to listen on')
+    parser.add_argument('--rtt-ms', type=float, default=1.0, help='added round-trip time, milliseconds')
+    args = parser.parse_args()
+
+    server = Server((args.host, args.port), make_handler(args.target, args.rtt_ms / 2000.0))
+    print('proxying %s:%d -> %s with %.2f ms round trip' % (args.host, args.port, args.target, args.rtt_ms), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+'''
+Memory benchmark for the streaming lead export (backend/admin-manage/export.py).
+
+Exports N leads to /dev/null and samples resident memory as rows flow through
+the encoder; RSS should stay flat instead of growing with the row count.
+
+    python benchmarks/export_rss.py --rows 1000000 --format csv --gzip
+    DATABASE_URL=... python benchmarks/export_rss.py --rows 1000000 --database
+
+--database seeds the leads inside a transaction with generate_series, exports
+them through a real named cursor and rolls everything back. Without it rows
+come from an in-process generator shaped like the leads query, which isolates
+the encoder's own memory behaviour.
+'''
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin-manage'))
+
+import export  # noqa: E402
+
+LEAD_COLUMNS = [
+    'id', 'partner_id', 'partner_name', 'partner_email', 'client_name', 'client_phone',
+    'client_email', 'project_address', 'estimate_amount', 'status', 'commission_amount',
+    'notes', 'created_at', 'updated_at',
+]
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+
+
+class SyntheticCursor:
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.produced = 0
+        self.description = [(name,) for name in LEAD_COLUMNS]
+        self.itersize = export.BATCH_SIZE
+
+    def execute(self, sql):
+        pass
+
+    def fetchmany(self, size):
+        start = self.produced
+        end = min(self.rows, start + size)
+        self.produced = end
+        base = datetime(2024, 1, 1)
+        return [
+            (i, i % 500, 'Партнёр %d' % (i % 500), 'partner%d@example.com' % (i % 500),
+             'Клиент %d' % i, '+7999%07d' % i, 'client%d@example.com' % i, 'ул. Ленина, %d' % i,
+             Decimal('150000.00'), 'new', Decimal('7500.00'), 'примечание',
+             base + timedelta(seconds=i), base + timedelta(seconds=i))
+            for i in range(start, end)
+        ]
+
+    def close(self):
+        pass
+
+
+class SyntheticConnection:
+    def __init__(self, rows: int):
+        self.rows = rows
+
+    def cursor(self, name=None):
+        return SyntheticCursor(self.rows)
+
+
+def seed(conn, rows: int) -> None:
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO t_p62408730_traffic_partnership.partners (name, email, phone)
+        VALUES ('bench', 'export-bench@example.invalid', '0000000000')
+        RETURNING id
+    ''')
+    partner_id = cur.fetchone()[0]
+    cur.execute('''
+        INSERT INTO t_p62408730_traffic_partnership.leads
+            (partner_id, client_name, client_phone, client_email, project_address,
+             estimate_amount, status, commission_amount, notes, created_at)
+        SELECT %s, 'Клиент ' || g, '+7999' || lpad(g::text, 7, '0'), 'client' || g || '@example.com',
+               'ул. Ленина, ' || g, 150000, 'new', 7500, 'примечание',
+               TIMESTAMP '2024-01-01' + g * INTERVAL '1 second'
+        FROM generate_series(1, %s) g
+    ''', (partner_id, rows))
+    cur.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--database', action='store_true', help='seed and export through DATABASE_URL')
+    args = parser.parse_args()
+
+    if args.database:
+        import psycopg2
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        seed(conn, args.rows)
+    else:
+        conn = SyntheticConnection(args.rows)
+
+    checkpoints = sorted({max(1, args.rows * k // 10) for k in range(1, 11)})
+    samples = []
+    baseline = rss_mb()
+    original_iter = export.iter_batches
+
+    def sampled_iter(conn, sql, batch_size=export.BATCH_SIZE):
+        seen = 0
+        next_checkpoint = 0
+        for columns, rows in original_iter(conn, sql, batch_size):
+            yield columns, rows
+            seen += len(rows)
+            while next_checkpoint < len(checkpoints) and seen >= checkpoints[next_checkpoint]:
+                samples.append((checkpoints[next_checkpoint], rss_mb()))
+                next_checkpoint += 1
+
+    export.iter_batches = sampled_iter
+    started = time.perf_counter()
+    with open(os.devnull, 'wb') as sink:
+        count = export.export(conn, 'leads', args.format, sink, compress=args.gzip)
+    elapsed = time.perf_counter() - started
+
+    if args.database:
+        conn.rollback()
+        conn.close()
+
+    print('format=%s gzip=%s rows=%d time=%.2fs rate=%.0f rows/s baseline_rss=%.1fMB' % (
+        args.format, args.gzip, count, elapsed, count / elapsed if elapsed else 0, baseline))
+    print('%12s %10s' % ('rows', 'rss_mb'))
+    for rows, rss in samples:
+        print('%12d %10.1f' % (rows, rss))
+    if samples:
+        growth = samples[-1][1] - samples[0][1]
+        print('rss growth from first to last checkpoint: %.1fMB' % growth)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+'''
+Throughput of partner-create-lead: N single-lead POSTs vs. batched POSTs.
+
+    DATABASE_URL=... python benchmarks/lead_ingest.py --leads 2000 --batch-size 500
+
+Creates a throwaway approved partner, calls the handler in-process (so the
+numbers reflect handler + database work, without HTTP), and deletes the
+partner, its leads and its partner_stats row afterwards.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+import psycopg2
+
+from common import Context, load_function
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+
+def lead(i: int) -> dict:
+    return {
+        'name': 'Клиент %d' % i,
+        'phone': '+7999%07d' % i,
+        'email': 'client%d@example.com' % i,
+        'education_level': '10-11 класс',
+        'notes': 'benchmark',
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    email = 'ingest-bench-%s@example.invalid' % uuid.uuid4().hex[:8]
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(
+        'INSERT INTO %s.partners (name, email, phone, is_approved) VALUES (%%s, %%s, %%s, TRUE) RETURNING id' % SCHEMA,
+        ('ingest bench', email, '0000000000')
+    )
+    partner_id = cur.fetchone()[0]
+    module = load_function('partner-create-lead')
+    token = module.auth.create_session(cur, partner_id)
+    conn.commit()
+
+    handler = module.handler
+    headers = {'x-auth-token': token, 'content-type': 'application/json'}
+
+    try:
+        started = time.perf_counter()
+        for i in range(args.leads):
+            response = handler({'httpMethod': 'POST', 'headers': headers, 'body': json.dumps(lead(i))}, Context())
+            assert response['statusCode'] == 201, response
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for offset in range(0, args.leads, args.batch_size):
+            items = [lead(i) for i in range(offset, min(args.leads, offset + args.batch_size))]
+            response = handler({'httpMethod': 'POST', 'headers': headers, 'body': json.dumps(items)}, Context())
+            assert response['statusCode'] == 201, response
+        batched = time.perf_counter() - started
+    finally:
+        cur.execute('DELETE FROM %s.leads WHERE partner_id = %%s' % SCHEMA, (partner_id,))
+        cur.execute('DELETE FROM %s.partners WHERE id = %%s' % SCHEMA, (partner_id,))
+        conn.commit()
+        conn.close()
+
+    print('%-22s %10s %12s' % ('mode', 'seconds', 'leads/sec'))
+    print('%-22s %10.2f %12.0f' % ('single POST', single, args.leads / single))
+    print('%-22s %10.2f %12.0f' % ('batch of %d' % args.batch_size, batched, args.leads / batched))
+    print('speedup: %.1fx' % (single / batched))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+'''
+Replay a realistic request mix against the local dev server and report
+latency percentiles and throughput per endpoint.
+
+    RATELIMIT=0 DATABASE_URL=... python scripts/dev_server.py --migrate &
+    DATABASE_URL=... python benchmarks/load_test.py --duration 30 --concurrency 8
+    python benchmarks/load_test.py --mix login=1,create_lead=3,dashboard=5,admin_list=1 --json
+
+Setup registers --partners partners through register-partner, approves them
+through admin-manage, promotes the first one to admin (the one direct SQL
+statement, hence DATABASE_URL) and logs them in. The timed phase then runs
+--concurrency client threads, each picking scenarios by --mix weight:
+
+    login        POST auth-login
+    create_lead  POST partner-create-lead (session token)
+    dashboard    GET  get-partner-leads, first page with statistics
+    admin_list   GET  admin-get-partners
+
+Like a browser, each client thread revalidates the two polled GETs with the
+ETag it last received (If-None-Match), so unchanged pages come back as 304;
+--no-conditional sends plain GETs instead. All clients log in and register
+from one address, so the server runs with rate limiting off (RATELIMIT=0).
+
+Next to the database every query round trip is almost free; to compare the
+synchronous and the asyncio path (DB_ASYNC=1 on the server) as on the
+platform, put benchmarks/db_latency.py between the server and PostgreSQL.
+'''
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from common import percentile
+
+PASSWORD = 'load-test-password'
+
+SCENARIOS = ('login', 'create_lead', 'dashboard', 'admin_list')
+
+DEFAULT_MIX = 'login=1,create_lead=3,dashboard=5,admin_list=1'
+
+
+class Client:
+    '''One keep-alive connection to the dev server per thread, with its own ETag store.'''
+
+    def __init__(self, base_url: str, conditional: bool = True):
+        self.conditional = conditional
+        self.etags: Dict[str, str] = {}
+        url = urlsplit(base_url)
+        self.host = url.hostname or '127.0.0.1'
+        self.port = url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def request(self, method: str, function: str, query: Optional[Dict[str, Any]] = None,
+                body: Any = None, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any]:
+        path = '%s/%s' % (self.prefix, function)
+        if query:
+            path += '?' + urlencode(query)
+        payload = json.dumps(body) if body is not None else None
+        all_headers = {'Content-Type': 'application/json'}
+        all_headers.update(headers or {})
+        revalidate = self.conditional and method == 'GET'
+        if revalidate and path in self.etags:
+            all_headers['If-None-Match'] = self.etags[path]
+        try:
+            self.conn.request(method, path, body=payload, headers=all_headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, ConnectionError):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            raise
+        if revalidate and response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+
+class Partner:
+    def __init__(self, partner_id: int, email: str, token: str):
+        self.partner_id = partner_id
+        self.email = email
+        self.token = token
+
+
+def seed(client: Client, count: int, dsn: str) -> Tuple[List[Partner], int]:
+    run = uuid.uuid4().hex[:8]
+    partners = []
+    for index in range(count):
+        email = 'load-%s-%d@example.com' % (run, index)
+        status, body = client.request('POST', 'register-partner', body={
+            'name': 'Load Test %d' % index,
+            'email': email,
+            'phone': '+7999%07d' % random.randrange(10 ** 7),
+            'traffic_source': 'load test',
+        })
+        if status != 201:
+            raise RuntimeError('register-partner returned %s: %s' % (status, body))
+        partner_id = body['partner_id']
+        status, body = client.request('POST', 'admin-manage', body={
+            'action': 'approve', 'partner_id': partner_id, 'password': PASSWORD
+        })
+        if status != 200:
+            raise RuntimeError('admin-manage approve returned %s: %s' % (status, body))
+        partners.append(Partner(partner_id, email, ''))
+
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            'UPDATE t_p62408730_traffic_partnership.partners SET is_admin = TRUE WHERE id = %s',
+            (partners[0].partner_id,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    for partner in partners:
+        status, body = client.request('POST', 'auth-login', body={'email': partner.email, 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError('auth-login returned %s: %s' % (status, body))
+        partner.token = body['session_token']
+    return partners[1:] or partners, partners[0].partner_id
+
+
+def scenario_calls(partners: List[Partner], admin_id: int) -> Dict[str, Callable[[Client], int]]:
+    def login(client: Client) -> int:
+        partner = random.choice(partners)
+        return client.request('POST', 'auth-login', body={'email': partner.email, 'password': PASSWORD})[0]
+
+    def create_lead(client: Client) -> int:
+        partner = random.choice(partners)
+        return client.request('POST', 'partner-create-lead', headers={'X-Auth-Token': partner.token}, body={
+            'name': 'Client %d' % random.randrange(10 ** 6),
+            'phone': '+7916%07d' % random.randrange(10 ** 7),
+            'email': 'client@example.com',
+        })[0]
+
+    def dashboard(client: Client) -> int:
+        partner = random.choice(partners)
+        return client.request('GET', 'get-partner-leads', query={'partner_id': partner.partner_id})[0]
+
+    def admin_list(client: Client) -> int:
+        return client.request('GET', 'admin-get-partners', query={'admin_id': admin_id})[0]
+
+    return {'login': login, 'create_lead': create_lead, 'dashboard': dashboard, 'admin_list': admin_list}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError('unknown scenario %r (choose from %s)' % (name, ', '.join(SCENARIOS)))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(base_url: str, calls: Dict[str, Callable[[Client], int]], mix: Dict[str, float],
+        concurrency: int, duration: float, conditional: bool = True) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker() -> None:
+        client = Client(base_url, conditional)
+        local: List[Tuple[str, float, bool]] = []
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = calls[name](client)
+                ok = 200 <= status < 300 or status == 304
+            except (OSError, http.client.HTTPException):
+                ok = False
+            local.append((name, time.perf_counter() - started, ok))
+        with lock:
+            for name, elapsed, ok in local:
+                latencies[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> List[Dict[str, Any]]:
+    rows = []
+    everything: List[float] = []
+    for name in SCENARIOS:
+        samples = latencies.get(name)
+        if not samples:
+            continue
+        everything.extend(samples)
+        rows.append(row(name, samples, errors.get(name, 0), elapsed))
+    rows.append(row('total', everything, sum(errors.values()), elapsed))
+    return rows
+
+
+def row(name: str, samples: List[float], error_count: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        'endpoint': name,
+        'requests': len(samples),
+        'errors': error_count,
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='dev server base URL')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of timed load')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--partners', type=int, default=5, help='partners to register for the run')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help='scenario weights, default %s' % DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, help='random seed for a repeatable request sequence')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--no-conditional', dest='conditional', action='store_false',
+                        help='do not revalidate GETs with If-None-Match')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    partners, admin_id = seed(Client(args.url), max(args.partners, 2), os.environ['DATABASE_URL'])
+    calls = scenario_calls(partners, admin_id)
+    latencies, errors, elapsed = run(args.url, calls, args.mix, args.concurrency, args.duration, args.conditional)
+    rows = summarize(latencies, errors, elapsed)
+
+    if args.json:
+        print(json.dumps({'concurrency': args.concurrency, 'duration': elapsed, 'endpoints': rows}, indent=2))
+        return 0
+
+    print('%d threads, %.1fs' % (args.concurrency, elapsed))
+    print('%-12s %9s %7s %9s %9s %9s %9s' % ('endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for result in rows:
+        print('%-12s %9d %7d %9.1f %9.1f %9.1f %9.1f' % (
+            result['endpoint'], result['requests'], result['errors'], result['rps'],
+            result['p50_ms'], result['p95_ms'], result['p99_ms']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+'''
+Login throughput per core for each password hashing scheme and cost.
+
+    python benchmarks/password_hashing.py
+    python benchmarks/password_hashing.py --pbkdf2 100000 300000 --bcrypt 10 12 --seconds 3
+
+Each row runs verify_password() in a single thread for --seconds, which is
+the CPU a login spends per request; logins/sec is therefore per core.
+bcrypt rows are skipped when the bcrypt package is not installed.
+'''
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'auth-login'))
+
+import hashers  # noqa: E402
+
+PASSWORD = 'correct horse battery'
+
+
+def measure(hasher, seconds: float):
+    encoded = hasher.encode(PASSWORD)
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        assert hashers.verify_password(PASSWORD, encoded)
+        count += 1
+    elapsed = time.perf_counter() - started
+    return count / elapsed, elapsed / count * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pbkdf2', type=int, nargs='*', default=[100000, 200000, 600000])
+    parser.add_argument('--bcrypt', type=int, nargs='*', default=[10, 12])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    rows = [('pbkdf2_sha256', 'iterations=%d' % n, hashers.PBKDF2Hasher(n)) for n in args.pbkdf2]
+    try:
+        import bcrypt  # noqa: F401
+        rows += [('bcrypt', 'rounds=%d' % n, hashers.BcryptHasher(n)) for n in args.bcrypt]
+    except ImportError:
+        print('bcrypt not installed, skipping bcrypt rows', file=sys.stderr)
+
+    print('%-15s %-18s %14s %12s' % ('scheme', 'cost', 'logins/s/core', 'ms/login'))
+    for scheme, cost, hasher in rows:
+        rate, ms = measure(hasher, args.seconds)
+        print('%-15s %-18s %14.1f %12.1f' % (scheme, cost, rate, ms))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+'''
+Payload size and encoding time of a large lead list in each response shape
+and content encoding of web.py.
+
+    python benchmarks/payload_encoding.py
+    python benchmarks/payload_encoding.py --rows 10000 100000 --fields id,status,commission_amount,created_at
+
+Rows come from an in-process generator shaped like the admin-manage leads
+list (tuples, as the list reads them). For every row count the list is
+shaped as objects, as format=compact and as compact with --fields, then
+serialized with web.dumps() and compressed with gzip and brotli. Reports
+body bytes and the median time of shaping plus serializing, and of each
+compression, over --repeat runs.
+'''
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Tuple
+
+from common import load_function
+
+STATUSES = ('new', 'in_review', 'approved', 'rejected', 'completed')
+
+
+def make_rows(count: int, columns: List[str]) -> List[Tuple[Any, ...]]:
+    rng = random.Random(42)
+    started = datetime(2026, 1, 1)
+    rows = []
+    for i in range(count):
+        created = started + timedelta(seconds=i * 37)
+        status = rng.choice(STATUSES)
+        values = {
+            'id': 1000000 + i,
+            'partner_id': rng.randint(1, 500),
+            'client_name': 'Клиент %d' % rng.randint(1, 10 ** 6),
+            'client_phone': '+7916%07d' % rng.randint(0, 10 ** 7 - 1),
+            'client_email': 'client%d@example.com' % rng.randint(1, 10 ** 6),
+            'project_address': 'г. Москва, ул. Тверская, д. %d' % rng.randint(1, 200),
+            'estimate_amount': Decimal(rng.randint(10000, 5000000)) / 100,
+            'status': status,
+            'commission_amount': Decimal(rng.randint(1000, 500000)) / 100 if status == 'approved' else None,
+            'notes': rng.choice(('', 'Перезвонить вечером', None)),
+            'created_at': created,
+            'updated_at': created,
+            'client_phone_normalized': '7916%07d' % rng.randint(0, 10 ** 7 - 1),
+            'partner_name': 'Партнёр %d' % rng.randint(1, 500),
+            'partner_email': 'partner%d@example.com' % rng.randint(1, 500),
+        }
+        rows.append(tuple(values[column] for column in columns))
+    return rows
+
+
+def median_ms(repeat: int, run: Callable[[], Any]) -> Tuple[float, Any]:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='row counts to measure')
+    parser.add_argument('--fields', default='id,status,commission_amount,created_at',
+                        help='projection for the compact+fields shape')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement (median is reported)')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TRACE_LOG', '0')
+    module = load_function('admin-manage')
+    web = module.web
+    if web.brotli is None:
+        print('brotli is not installed; the br column is skipped')
+    columns = list(module.LIST_FIELDS['leads'])
+
+    shapes: Dict[str, Dict[str, str]] = {
+        'objects': {},
+        'compact': {'format': 'compact'},
+        'compact+fields': {'format': 'compact', 'fields': args.fields},
+    }
+
+    print('%8s %-15s %12s %9s %12s %9s %12s %9s' % (
+        'rows', 'shape', 'json bytes', 'json ms', 'gzip bytes', 'gzip ms', 'br bytes', 'br ms'))
+    for count in args.rows:
+        rows = make_rows(count, columns)
+        for shape, query in shapes.items():
+            request = web.Request({'httpMethod': 'GET', 'queryStringParameters': query}, None)
+            selected = web.select_fields(request, columns)
+
+            def serialize() -> str:
+                return web.dumps({'leads': web.rows_payload(request, rows, columns, selected)})
+
+            json_ms, body = median_ms(args.repeat, serialize)
+            gzip_ms, gzipped = median_ms(args.repeat, lambda: web.compress(body, 'gzip'))
+            line = '%8d %-15s %12d %9.1f %12d %9.1f' % (
+                count, shape, len(body.encode('utf-8')), json_ms, len(gzipped) * 3 // 4, gzip_ms)
+            if web.brotli is not None:
+                br_ms, brotlied = median_ms(args.repeat, lambda: web.compress(body, 'br'))
+                line += ' %12d %9.1f' % (len(brotlied) * 3 // 4, br_ms)
+            print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+'''
+Hot lookups of queries.py executed as prepared statements versus parsed and
+planned on every call.
+
+    DATABASE_URL=... python benchmarks/prepared_statements.py
+    DATABASE_URL=... python benchmarks/prepared_statements.py --calls 5000
+
+Runs each prepared lookup of the catalog --calls times on one pooled
+connection, alternating call by call between EXECUTE of the prepared
+statement and the plain statement text, with arguments taken from existing
+rows. Reports the median client-side latency per call of each mode; the gap
+is the parse and plan work the server no longer repeats.
+'''
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Sequence
+
+from common import load_function
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+
+def sample_args(cur: Any) -> Dict[str, Sequence[Any]]:
+    cur.execute('SELECT id, email FROM {schema}.partners ORDER BY id LIMIT 1'.format(schema=SCHEMA))
+    partner = cur.fetchone()
+    if not partner:
+        raise SystemExit('no partners; run benchmarks/load_test.py once to seed some')
+    cur.execute('SELECT token_hash FROM {schema}.sessions LIMIT 1'.format(schema=SCHEMA))
+    session = cur.fetchone()
+    cur.execute('SELECT email FROM {schema}.admins LIMIT 1'.format(schema=SCHEMA))
+    admin = cur.fetchone()
+    since = datetime.now() - timedelta(days=1)
+    return {
+        'partner_login': (partner[1],),
+        'admin_login': (admin[0] if admin else 'nobody@example.invalid',),
+        'session_identity': (session[0] if session else 'missing',),
+        'partner_is_admin': (partner[0],),
+        'partner_list_version': (),
+        'partner_list': (),
+        'partner_changes': (since, since),
+        'partner_tombstones': (since,),
+        'partner_version': (partner[0],),
+        'partner_statistics': (partner[0],),
+        'admin_overview': (partner[0], datetime.now() - timedelta(days=30)),
+        'sync_watermark': (10, since),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000, help='calls per statement and mode')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TRACE_LOG', '0')
+    module = load_function('admin-get-partners')
+    queries = module.queries
+    statements = [value for value in vars(queries).values()
+                  if isinstance(value, queries.Statement) and value.prepare and value.record]
+
+    print('%-22s %12s %12s %8s' % ('statement', 'plain us', 'prepared us', 'saved'))
+    with module.db.connection() as conn:
+        cur = conn.cursor()
+        arguments = sample_args(cur)
+        for statement in statements:
+            timings: Dict[bool, List[float]] = {False: [], True: []}
+            for call in range(args.calls * 2):
+                prepared = call % 2 == 1
+                queries.PREPARE = prepared
+                started = time.perf_counter()
+                queries.fetch_all(cur, statement, arguments[statement.name])
+                timings[prepared].append(time.perf_counter() - started)
+            conn.rollback()
+            plain = statistics.median(timings[False]) * 1e6
+            fast = statistics.median(timings[True]) * 1e6
+            print('%-22s %12.1f %12.1f %7.0f%%' % (statement.name, plain, fast, (1 - fast / plain) * 100))
+        cur.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+'''
+Check that a partner dashboard polling with since= picks up the commissions
+that scripts/recompute_commissions.py writes, while the job runs and after.
+
+    DATABASE_URL=... python benchmarks/recompute_sync.py
+    DATABASE_URL=... python benchmarks/recompute_sync.py --overlap 1 --batch-size 1000
+
+Picks the partner with the most approved leads on its dashboard, up to
+MAX_CHANGES so that a delta never asks for a reload, reads the dashboard
+(get-partner-leads, in-process) once in full, then runs the job with a rules
+file that moves every approved commission between 5 and 6 percent, so each
+run changes them all. Meanwhile and once after the job, the dashboard is
+polled with the last watermark every --interval seconds and the leads are
+merged by id, as the frontend does; the admin partner list
+(admin-get-partners) is polled the same way for the partner's
+total_commission, which changes with partner_stats. Finally the merged values
+are compared with the database: a stale value means a row committed outside
+the watermark's SYNC_OVERLAP (--overlap) and the client never saw it.
+Exits with status 1 then. The commissions stay changed; this writes to the
+database, so run it against a local copy.
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict
+
+from common import Context, load_function
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+SCRIPT = Path(__file__).resolve().parent.parent / 'scripts' / 'recompute_commissions.py'
+
+
+def poll(module: Any, query: Dict[str, str]) -> Dict[str, Any]:
+    response = module.handler({'httpMethod': 'GET', 'queryStringParameters': query}, Context())
+    assert response['statusCode'] == 200, response
+    return json.loads(response['body'])
+
+
+def same(sent: Any, stored: Any) -> bool:
+    # The dashboard sends a NULL amount as 0
+    return Decimal(str(sent)) == (stored or 0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--overlap', type=float, default=10.0, help='SYNC_OVERLAP of the handlers, seconds')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between polls')
+    parser.add_argument('--batch-size', type=int, default=5000, help='passed on to the job')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TRACE_LOG', '0')
+    os.environ['SYNC_OVERLAP'] = str(args.overlap)
+    leads = load_function('get-partner-leads')
+    partners = load_function('admin-get-partners')
+
+    with leads.db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT id FROM {schema}.partners WHERE is_admin ORDER BY id LIMIT 1'.format(schema=SCHEMA))
+        admin = cur.fetchone()
+        if not admin:
+            raise SystemExit('no admin partner; run benchmarks/load_test.py once to create one')
+        # All of its changes must fit into one since= response, or the client is told to reload
+        cur.execute('''
+            SELECT partner_id, COUNT(*) FROM {schema}.leads
+            WHERE status = 'approved' AND estimate_amount IS NOT NULL AND created_at >= %s
+            GROUP BY partner_id HAVING COUNT(*) <= %s ORDER BY COUNT(*) DESC LIMIT 1
+        '''.format(schema=SCHEMA), (leads.partitions.recent_cutoff(), leads.MAX_CHANGES))
+        top = cur.fetchone()
+        if not top:
+            raise SystemExit('no partner with approved leads with an estimate on the dashboard')
+        # 6 percent when the leads are at 5 now, else 5
+        cur.execute('''
+            SELECT bool_and(commission_amount = round(estimate_amount * 0.05, 2)) FROM {schema}.leads
+            WHERE partner_id = %s AND status = 'approved' AND estimate_amount IS NOT NULL
+        '''.format(schema=SCHEMA), (top[0],))
+        percent = 6 if cur.fetchone()[0] else 5
+        cur.close()
+    partner_id = str(top[0])
+
+    query = {'partner_id': partner_id, 'limit': str(leads.MAX_PAGE_SIZE)}
+    page = poll(leads, query)
+    seen = {lead['id']: lead['commission_amount'] for lead in page['leads']}
+    watermark = page['watermark']
+    admin_query = {'admin_id': str(admin[0])}
+    listing = poll(partners, admin_query)
+    total = next(p['total_commission'] for p in listing['partners'] if p['id'] == top[0])
+    admin_watermark = listing['watermark']
+    print('partner %s: %d approved leads on the dashboard, %d on the first page; rules at %d%%' % (
+        partner_id, top[1], len(seen), percent))
+
+    polls = changed = 0
+
+    def refresh() -> None:
+        nonlocal watermark, admin_watermark, total, polls, changed
+        delta = poll(leads, dict(query, since=watermark))
+        polls += 1
+        if delta.get('reset'):
+            raise SystemExit('the dashboard asked for a full reload; raise MAX_CHANGES or poll more often')
+        for lead in delta['leads']:
+            if lead['id'] in seen:
+                changed += seen[lead['id']] != lead['commission_amount']
+                seen[lead['id']] = lead['commission_amount']
+        watermark = delta['watermark']
+        delta = poll(partners, dict(admin_query, since=admin_watermark))
+        for partner in delta['partners']:
+            if partner['id'] == top[0]:
+                total = partner['total_commission']
+        admin_watermark = delta['watermark']
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as rules:
+        json.dump({'statuses': ['approved'], 'percent': percent}, rules)
+        rules.flush()
+        started = time.perf_counter()
+        job = subprocess.Popen(
+            [sys.executable, str(SCRIPT), '--rules', rules.name, '--batch-size', str(args.batch_size)]
+        )
+        while job.poll() is None:
+            refresh()
+            time.sleep(args.interval)
+        if job.returncode:
+            raise SystemExit('recompute_commissions.py failed with status %d' % job.returncode)
+    refresh()
+    print('job ran %.1f s; %d polls, %d commission changes received' % (
+        time.perf_counter() - started, polls, changed))
+
+    with leads.db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            'SELECT id, commission_amount FROM {schema}.leads WHERE id = ANY(%s)'.format(schema=SCHEMA),
+            (list(seen),)
+        )
+        stale = sum(1 for lead_id, commission in cur.fetchall() if not same(seen[lead_id], commission))
+        cur.execute(
+            'SELECT total_commission FROM {schema}.partner_stats WHERE partner_id = %s'.format(schema=SCHEMA),
+            (top[0],)
+        )
+        stored = cur.fetchone()[0]
+        cur.close()
+    total_stale = not same(total, stored)
+    print('%d of %d leads stale on the dashboard; admin list total_commission %s (%s, database %s)' % (
+        stale, len(seen), 'stale' if total_stale else 'current', total, stored))
+    return 1 if stale or total_stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+'''
+Check that reconcile_partner_stats.py --fix loses no lead change committed
+while it runs.
+
+    DATABASE_URL=... python benchmarks/reconcile_race.py
+    DATABASE_URL=... python benchmarks/reconcile_race.py --rounds 10
+
+Picks one lead and, in a background thread, keeps raising its commission by
+1 through the admin-manage PUT handler, so every committed change moves its
+partner's total_commission. Meanwhile each round knocks the partner's
+partner_stats row off by one lead and runs partner_stats.reconcile(fix=True),
+which recomputes from leads and rewrites that row with absolute values. A
+change that commits between the recompute and the rewrite and is then
+overwritten leaves the rollup behind the leads; the final reconcile without
+--fix finds it. Exits with status 1 then. The lead gets its status and
+commission back at the end; this writes to the database, so run it against a
+local copy.
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from decimal import Decimal
+
+import psycopg2
+
+from common import Context, load_function
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5, help='reconcile --fix runs during the writes')
+    args = parser.parse_args()
+
+    os.environ.setdefault('TRACE_LOG', '0')
+    manage = load_function('admin-manage')
+    partner_stats = manage.partner_stats
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM {schema}.partners WHERE is_admin ORDER BY id LIMIT 1'.format(schema=SCHEMA))
+    admin = cur.fetchone()
+    if not admin:
+        raise SystemExit('no admin partner; run benchmarks/load_test.py once to create one')
+    cur.execute('SELECT id, partner_id, status, commission_amount FROM {schema}.leads ORDER BY id LIMIT 1'.format(
+        schema=SCHEMA))
+    lead = cur.fetchone()
+    if not lead:
+        raise SystemExit('no leads')
+    conn.commit()
+    lead_id, partner_id, status, commission = lead
+
+    def put(body: dict) -> None:
+        response = manage.handler(
+            {'httpMethod': 'PUT', 'headers': {'X-Admin-Id': str(admin[0])}, 'body': json.dumps(body)},
+            Context()
+        )
+        assert response['statusCode'] == 200, response
+
+    stop = threading.Event()
+    writes = 0
+
+    def write() -> None:
+        nonlocal writes
+        amount = Decimal('1000.00')
+        while not stop.is_set():
+            amount += 1
+            put({'lead_id': lead_id, 'status': 'approved', 'commission_amount': str(amount)})
+            writes += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    started = time.perf_counter()
+    fixed = 0
+    try:
+        for _ in range(args.rounds):
+            cur.execute(
+                'UPDATE {schema}.partner_stats SET total_leads = total_leads + 1 WHERE partner_id = %s'.format(
+                    schema=SCHEMA),
+                (partner_id,)
+            )
+            conn.commit()
+            fixed += sum(1 for m in partner_stats.reconcile(conn, fix=True) if m['partner_id'] == partner_id)
+    finally:
+        stop.set()
+        writer.join()
+        put({'lead_id': lead_id, 'status': status,
+             'commission_amount': str(commission) if commission is not None else None})
+    print('%d rounds in %.1f s, partner %s rewritten %d times; %d commission changes of lead %s meanwhile' % (
+        args.rounds, time.perf_counter() - started, partner_id, fixed, writes, lead_id))
+
+    mismatches = partner_stats.reconcile(conn)
+    conn.rollback()
+    cur.close()
+    conn.close()
+    for mismatch in mismatches:
+        print('partner %s: total_commission %s in partner_stats, %s in leads' % (
+            mismatch['partner_id'], mismatch['actual']['total_commission'], mismatch['expected']['total_commission']))
+    print('%d partners out of line after the run' % len(mismatches))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+'''
+Latency of admin-manage search (action=leads&q=...) over a large leads table.
+
+    DATABASE_URL=... python benchmarks/search_leads.py --rows 1000000
+    DATABASE_URL=... python benchmarks/search_leads.py --rows 1000000 --repeat 50 --explain
+
+Tops the leads table up to --rows with synthetic leads (realistic Russian
+full names and mobile numbers, COPY-loaded for one benchmark partner), runs
+ANALYZE, then calls the admin-manage handler in-process for a fixed set of
+substring, typo and phone queries and reports p50/p95 per query. --explain
+prints each query's plan to confirm the trigram indexes are used.
+The synthetic rows are left in place for later runs; --drop removes them.
+'''
+
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from common import Context, load_function, percentile
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+BENCH_EMAIL = 'search-bench@example.com'
+
+# Synthetic leads are spread over two years so that recency order has no large ties
+SPREAD_SECONDS = 2 * 365 * 24 * 3600
+
+FIRST_NAMES = [
+    'Александр', 'Алексей', 'Андрей', 'Анна', 'Дарья', 'Дмитрий', 'Екатерина', 'Елена', 'Иван', 'Ирина',
+    'Кирилл', 'Максим', 'Мария', 'Михаил', 'Наталья', 'Никита', 'Ольга', 'Павел', 'Сергей', 'Светлана',
+    'Татьяна', 'Юлия', 'Артём', 'Виктория', 'Владимир', 'Полина', 'Роман', 'Софья', 'Егор', 'Ксения',
+]
+SURNAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков',
+    'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров', 'Павлов', 'Козлов',
+    'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров', 'Никитин', 'Захаров', 'Зайцев', 'Соловьёв',
+    'Борисов', 'Яковлев', 'Григорьев', 'Романов', 'Воробьёв', 'Сергеев', 'Кузьмин', 'Фролов', 'Александров',
+    'Дмитриев', 'Королёв', 'Гусев', 'Киселёв', 'Ильин', 'Максимов', 'Поляков', 'Сорокин', 'Виноградов',
+    'Ковалёв', 'Белов', 'Медведев', 'Антонов', 'Тарасов', 'Жуков', 'Баранов', 'Филиппов', 'Комаров',
+    'Давыдов', 'Беляев', 'Герасимов', 'Богданов', 'Осипов', 'Сидоров',
+]
+FEMININE = {'Анна', 'Дарья', 'Екатерина', 'Елена', 'Ирина', 'Мария', 'Наталья', 'Ольга', 'Светлана',
+            'Татьяна', 'Юлия', 'Виктория', 'Полина', 'Софья', 'Ксения'}
+
+QUERIES = [
+    ('leads', 'surname', 'Виноградов'),
+    ('leads', 'substring', 'ноград'),
+    ('leads', 'typo', 'Винаградов'),
+    ('leads', 'full name', 'Полина Медведева'),
+    ('leads', 'phone part', '916 123 4'),
+    ('leads', 'leading 8', '8 916 123'),
+    ('leads', 'no match', 'Шварценеггер'),
+    ('partners', 'email part', 'example.com'),
+]
+
+
+def client_name(rng: random.Random) -> str:
+    first = rng.choice(FIRST_NAMES)
+    surname = rng.choice(SURNAMES)
+    if first in FEMININE:
+        surname += 'а'
+    return '%s %s' % (first, surname)
+
+
+def populate(conn: Any, rows: int) -> int:
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) FROM {schema}.leads'.format(schema=SCHEMA))
+    missing = rows - cur.fetchone()[0]
+    if missing <= 0:
+        return 0
+    cur.execute('''
+        INSERT INTO {schema}.partners (name, email, phone, is_approved)
+        VALUES ('Search Benchmark', %s, '+79990000000', TRUE)
+        ON CONFLICT (email) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id
+    '''.format(schema=SCHEMA), (BENCH_EMAIL,))
+    partner_id = cur.fetchone()[0]
+    rng = random.Random(42)
+    now = datetime.datetime.now()
+    chunk = 100000
+    for start in range(0, missing, chunk):
+        buf = io.StringIO()
+        for _ in range(min(chunk, missing - start)):
+            phone = '79%09d' % rng.randrange(10 ** 9)
+            created = now - datetime.timedelta(seconds=rng.randrange(SPREAD_SECONDS))
+            buf.write('%d\t%s\t+%s\t%s\tnew\t%s\n' % (partner_id, client_name(rng), phone, phone, created.isoformat()))
+        buf.seek(0)
+        cur.copy_expert(
+            'COPY {schema}.leads (partner_id, client_name, client_phone, client_phone_normalized, status, created_at) '
+            'FROM STDIN'.format(schema=SCHEMA),
+            buf
+        )
+        conn.commit()
+        print('loaded %d/%d' % (start + min(chunk, missing - start), missing), file=sys.stderr)
+    cur.execute('ANALYZE {schema}.leads'.format(schema=SCHEMA))
+    conn.commit()
+    return missing
+
+
+def drop(conn: Any) -> None:
+    cur = conn.cursor()
+    cur.execute('''
+        DELETE FROM {schema}.leads
+        WHERE partner_id = (SELECT id FROM {schema}.partners WHERE email = %s)
+    '''.format(schema=SCHEMA), (BENCH_EMAIL,))
+    cur.execute('DELETE FROM {schema}.partners WHERE email = %s'.format(schema=SCHEMA), (BENCH_EMAIL,))
+    conn.commit()
+
+
+def explain(search: Any, conn: Any, entity: str, q: str) -> str:
+    exact_sql, fuzzy_sql, params = search.build_queries(entity, q)
+    params.update(limit=21, offset=0, candidates=search.FUZZY_CANDIDATES)
+    cur = conn.cursor()
+    cur.execute('SET pg_trgm.word_similarity_threshold = %s', (search.WORD_SIMILARITY_THRESHOLD,))
+    lines = []
+    for tier, sql in (('exact', exact_sql), ('fuzzy', fuzzy_sql)):
+        cur.execute('EXPLAIN (ANALYZE, COSTS OFF) ' + sql, params)
+        lines.append('  %s tier:' % tier)
+        lines.extend('    ' + row[0] for row in cur.fetchall())
+    conn.rollback()
+    return '\n'.join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='leads the table should hold')
+    parser.add_argument('--repeat', type=int, default=30, help='timed calls per query')
+    parser.add_argument('--explain', action='store_true', help='print EXPLAIN ANALYZE for each query')
+    parser.add_argument('--drop', action='store_true', help='delete the synthetic leads and exit')
+    args = parser.parse_args()
+
+    import psycopg2
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute('SET search_path TO %s, public' % SCHEMA)
+    conn.commit()
+    if args.drop:
+        drop(conn)
+        return 0
+    populate(conn, args.rows)
+
+    os.environ.setdefault('PGOPTIONS', '-c search_path=%s,public' % SCHEMA)
+    os.environ.setdefault('TRACE_LOG', '0')
+    module = load_function('admin-manage')
+    import search  # admin-manage/search.py, importable once the function is loaded
+
+    print('%-9s %-11s %-20s %6s %9s %9s' % ('entity', 'query', 'q', 'rows', 'p50 ms', 'p95 ms'))
+    for entity, label, q in QUERIES:
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'action': entity, 'q': q, 'limit': '20'}}
+        samples: List[float] = []
+        response: Dict[str, Any] = {}
+        for index in range(args.repeat + 3):
+            started = time.perf_counter()
+            response = module.handler(dict(event), Context())
+            elapsed = time.perf_counter() - started
+            assert response['statusCode'] == 200, response
+            if index >= 3:
+                samples.append(elapsed)
+        found = len(json.loads(response['body'])[entity])
+        print('%-9s %-11s %-20s %6d %9.1f %9.1f' % (
+            entity, label, q, found, percentile(samples, 50) * 1000, percentile(samples, 95) * 1000))
+        if args.explain:
+            print(explain(search, conn, entity, q))
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
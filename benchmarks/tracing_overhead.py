@@ -0,0 +1,120 @@
+'''
+Cost of the request instrumentation (tracing.py plus the traced connection
+and cursors in db.py) on a real handler.
+
+    DATABASE_URL=... python benchmarks/tracing_overhead.py
+    DATABASE_URL=... python benchmarks/tracing_overhead.py --function admin-get-partners --requests 500
+
+Calls the handler in-process for the partner with the most leads (or the
+first admin for admin-get-partners), alternating request by request between
+instrumentation on and instrumentation replaced by no-ops on plain psycopg2
+connections. Trace lines are written to os.devnull, so formatting and writing
+them is included. Reports the median per-request latency of each mode and the
+overhead; against a local database over a unix socket the denominator is far
+smaller than on the platform, so the absolute figure is the one to track.
+'''
+
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from common import Context, load_function
+
+NOOPS = {
+    'start': lambda context, method: None,
+    'finish': lambda token, status_code, size: None,
+    'add_phase': lambda name, seconds: None,
+    'record_query': lambda statement, seconds, rows: None,
+}
+
+
+def pick_event(module: Any, function: str) -> Dict[str, Any]:
+    with module.db.connection() as conn:
+        cur = conn.cursor()
+        if function == 'admin-get-partners':
+            cur.execute('SELECT id FROM t_p62408730_traffic_partnership.partners WHERE is_admin = TRUE LIMIT 1')
+            row = cur.fetchone()
+            if not row:
+                raise SystemExit('no admin partner; run benchmarks/load_test.py once to seed one')
+            return {'httpMethod': 'GET', 'queryStringParameters': {'admin_id': str(row[0])}}
+        cur.execute('''
+            SELECT partner_id FROM t_p62408730_traffic_partnership.leads
+            GROUP BY partner_id ORDER BY COUNT(*) DESC LIMIT 1
+        ''')
+        row = cur.fetchone()
+        if not row:
+            raise SystemExit('no leads; run benchmarks/load_test.py once to create some')
+        return {'httpMethod': 'GET', 'queryStringParameters': {'partner_id': str(row[0])}}
+
+
+def build_modes(module: Any) -> Dict[bool, Dict[str, Any]]:
+    '''
+    Per mode, the tracing functions and a pool of its own: connections get
+    their class at connect time, so the uninstrumented pool connects with the
+    plain psycopg2 connection class.
+    '''
+    import psycopg2.extensions
+    db, tracing = module.db, module.web.tracing
+    modes = {}
+    for enabled in (True, False):
+        db._traced_connection = None if enabled else psycopg2.extensions.connection
+        pool = db.ConnectionPool(os.environ['DATABASE_URL'])
+        pool.putconn(pool.getconn())
+        functions = {name: getattr(tracing, name) if enabled else noop for name, noop in NOOPS.items()}
+        modes[enabled] = {'pool': pool, 'functions': functions}
+    db._traced_connection = None
+    return modes
+
+
+def activate(module: Any, mode: Dict[str, Any]) -> None:
+    module.db._pool = mode['pool']
+    for name, function in mode['functions'].items():
+        setattr(module.web.tracing, name, function)
+
+
+def timed_request(handler: Any, event: Dict[str, Any]) -> float:
+    started = time.perf_counter()
+    response = handler(dict(event), Context())
+    elapsed = time.perf_counter() - started
+    assert response['statusCode'] == 200, response
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--function', default='get-partner-leads', choices=('get-partner-leads', 'admin-get-partners'))
+    parser.add_argument('--requests', type=int, default=2000, help='timed requests per mode')
+    parser.add_argument('--warmup', type=int, default=100)
+    args = parser.parse_args()
+
+    os.environ.setdefault('PGOPTIONS', '-c search_path=t_p62408730_traffic_partnership,public')
+    module = load_function(args.function)
+    event = pick_event(module, args.function)
+    modes = build_modes(module)
+
+    samples: Dict[bool, List[float]] = {False: [], True: []}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for index in range(args.warmup + args.requests):
+            # Alternate every request so that drift affects both modes alike
+            for enabled in (False, True):
+                activate(module, modes[enabled])
+                elapsed = timed_request(module.handler, event)
+                if index >= args.warmup:
+                    samples[enabled].append(elapsed)
+
+    off = statistics.median(samples[False]) * 1000
+    on = statistics.median(samples[True]) * 1000
+    print('%s, %d requests per mode' % (args.function, len(samples[True])))
+    print('%-16s %10s' % ('mode', 'p50 ms'))
+    print('%-16s %10.3f' % ('uninstrumented', off))
+    print('%-16s %10.3f' % ('instrumented', on))
+    print('overhead %+.1f us per request (%+.1f%%)' % ((on - off) * 1000, (on - off) / off * 100))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
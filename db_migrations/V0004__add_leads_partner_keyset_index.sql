@@ -0,0 +1,4 @@
+-- Keyset pagination of a partner's leads: WHERE partner_id = ? AND (created_at, id) < (?, ?)
+-- ORDER BY created_at DESC, id DESC LIMIT ? is served by one index range scan
+CREATE INDEX IF NOT EXISTS idx_leads_partner_created_id
+    ON t_p62408730_traffic_partnership.leads(partner_id, created_at DESC, id DESC);
@@ -0,0 +1,30 @@
+-- Поддерживаемая сводка по лидам партнёра: обновляется при создании лида и смене его статуса
+CREATE TABLE IF NOT EXISTS t_p62408730_traffic_partnership.partner_stats (
+    partner_id INTEGER PRIMARY KEY REFERENCES t_p62408730_traffic_partnership.partners(id) ON DELETE CASCADE,
+    total_leads INTEGER NOT NULL DEFAULT 0,
+    new_leads INTEGER NOT NULL DEFAULT 0,
+    in_review_leads INTEGER NOT NULL DEFAULT 0,
+    approved_leads INTEGER NOT NULL DEFAULT 0,
+    rejected_leads INTEGER NOT NULL DEFAULT 0,
+    completed_leads INTEGER NOT NULL DEFAULT 0,
+    total_commission DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Заполняем сводку из существующих лидов
+INSERT INTO t_p62408730_traffic_partnership.partner_stats (
+    partner_id, total_leads, new_leads, in_review_leads, approved_leads,
+    rejected_leads, completed_leads, total_commission
+)
+SELECT
+    partner_id,
+    COUNT(*),
+    COUNT(*) FILTER (WHERE status = 'new'),
+    COUNT(*) FILTER (WHERE status = 'in_review'),
+    COUNT(*) FILTER (WHERE status = 'approved'),
+    COUNT(*) FILTER (WHERE status = 'rejected'),
+    COUNT(*) FILTER (WHERE status = 'completed'),
+    COALESCE(SUM(CASE WHEN status = 'approved' THEN commission_amount ELSE 0 END), 0)
+FROM t_p62408730_traffic_partnership.leads
+GROUP BY partner_id
+ON CONFLICT (partner_id) DO NOTHING;
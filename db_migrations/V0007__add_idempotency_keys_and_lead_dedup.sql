@@ -0,0 +1,32 @@
+-- Ключи идемпотентности: повтор запроса с тем же Idempotency-Key возвращает сохранённый ответ
+CREATE TABLE IF NOT EXISTS t_p62408730_traffic_partnership.idempotency_keys (
+    partner_id INTEGER NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code INTEGER,
+    response_body TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (partner_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at
+    ON t_p62408730_traffic_partnership.idempotency_keys(expires_at);
+
+-- Нормализованный телефон клиента для поиска дублей лидов партнёра
+ALTER TABLE t_p62408730_traffic_partnership.leads ADD COLUMN IF NOT EXISTS client_phone_normalized VARCHAR(32);
+
+UPDATE t_p62408730_traffic_partnership.leads
+SET client_phone_normalized = CASE
+    WHEN length(d) = 11 AND left(d, 1) = '8' THEN '7' || substr(d, 2)
+    WHEN length(d) = 10 THEN '7' || d
+    ELSE d
+END
+FROM (
+    SELECT id AS lead_id, regexp_replace(client_phone, '[^0-9]', '', 'g') AS d
+    FROM t_p62408730_traffic_partnership.leads
+) normalized
+WHERE id = normalized.lead_id AND client_phone_normalized IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_leads_partner_phone
+    ON t_p62408730_traffic_partnership.leads(partner_id, client_phone_normalized, created_at DESC);
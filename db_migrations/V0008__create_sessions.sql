@@ -0,0 +1,10 @@
+-- Сессии партнёров: храним только SHA-256 токена
+CREATE TABLE IF NOT EXISTS t_p62408730_traffic_partnership.sessions (
+    token_hash CHAR(64) PRIMARY KEY,
+    partner_id INTEGER NOT NULL REFERENCES t_p62408730_traffic_partnership.partners(id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_partner_id ON t_p62408730_traffic_partnership.sessions(partner_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON t_p62408730_traffic_partnership.sessions(expires_at);
@@ -0,0 +1,16 @@
+-- Поиск в админке по подстроке и с опечатками: ILIKE '%...%' и word_similarity (<%)
+-- обслуживаются GIN-индексами pg_trgm вместо полного просмотра таблиц
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_partners_name_trgm
+    ON t_p62408730_traffic_partnership.partners USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_partners_email_trgm
+    ON t_p62408730_traffic_partnership.partners USING gin (email gin_trgm_ops);
+-- Телефон партнёра хранится как ввели, ищем по цифрам
+CREATE INDEX IF NOT EXISTS idx_partners_phone_digits_trgm
+    ON t_p62408730_traffic_partnership.partners USING gin ((regexp_replace(phone, '[^0-9]', '', 'g')) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_leads_client_name_trgm
+    ON t_p62408730_traffic_partnership.leads USING gin (client_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_leads_client_phone_trgm
+    ON t_p62408730_traffic_partnership.leads USING gin (client_phone_normalized gin_trgm_ops);
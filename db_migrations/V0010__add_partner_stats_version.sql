@@ -0,0 +1,3 @@
+-- Счётчик изменений лидов партнёра: увеличивается при каждом создании или изменении лида
+-- и служит версией (ETag) для опроса дашборда без повторного чтения лидов
+ALTER TABLE t_p62408730_traffic_partnership.partner_stats ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
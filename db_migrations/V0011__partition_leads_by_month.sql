@@ -0,0 +1,115 @@
+-- Лиды секционируются по месяцу created_at: запросы за последние месяцы читают только свои секции,
+-- а индексы каждой секции остаются небольшими
+UPDATE t_p62408730_traffic_partnership.leads
+SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP)
+WHERE created_at IS NULL;
+
+CREATE TABLE t_p62408730_traffic_partnership.leads_partitioned (
+    LIKE t_p62408730_traffic_partnership.leads INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (created_at);
+
+ALTER TABLE t_p62408730_traffic_partnership.leads_partitioned ALTER COLUMN created_at SET NOT NULL;
+
+-- Ключ секционирования обязан входить в первичный ключ
+ALTER TABLE t_p62408730_traffic_partnership.leads_partitioned
+    ADD CONSTRAINT leads_partitioned_pkey PRIMARY KEY (id, created_at);
+
+ALTER TABLE t_p62408730_traffic_partnership.leads_partitioned
+    ADD CONSTRAINT leads_partitioned_partner_id_fkey
+    FOREIGN KEY (partner_id) REFERENCES t_p62408730_traffic_partnership.partners(id);
+
+-- Страховочная секция для строк вне созданных месяцев; ensure_leads_partitions переносит их в месячные
+CREATE TABLE t_p62408730_traffic_partnership.leads_default
+    PARTITION OF t_p62408730_traffic_partnership.leads_partitioned DEFAULT;
+
+-- Старая таблица уступает имя новой; последовательность id переходит к новой, иначе удалится вместе со старой
+ALTER SEQUENCE t_p62408730_traffic_partnership.leads_id_seq OWNED BY NONE;
+ALTER TABLE t_p62408730_traffic_partnership.leads RENAME TO leads_unpartitioned;
+ALTER TABLE t_p62408730_traffic_partnership.leads_partitioned RENAME TO leads;
+ALTER TABLE t_p62408730_traffic_partnership.leads_unpartitioned RENAME CONSTRAINT leads_pkey TO leads_unpartitioned_pkey;
+ALTER TABLE t_p62408730_traffic_partnership.leads RENAME CONSTRAINT leads_partitioned_pkey TO leads_pkey;
+ALTER TABLE t_p62408730_traffic_partnership.leads
+    RENAME CONSTRAINT leads_partitioned_partner_id_fkey TO leads_partner_id_fkey;
+
+-- Создаёт месячные секции от from_month (или самого раннего месяца в leads_default, или текущего)
+-- до months_ahead вперёд. Вызывается из scripts/maintain_leads.py по расписанию; возвращает число созданных секций
+CREATE OR REPLACE FUNCTION t_p62408730_traffic_partnership.ensure_leads_partitions(
+    months_ahead INTEGER DEFAULT 3,
+    from_month DATE DEFAULT NULL
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    schema_name CONSTANT TEXT := 't_p62408730_traffic_partnership';
+    first_month DATE;
+    month_start DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    EXECUTE format('SELECT min(created_at)::date FROM %I.leads_default', schema_name) INTO first_month;
+    first_month := date_trunc('month', LEAST(first_month, from_month, CURRENT_DATE))::date;
+
+    FOR month_start IN
+        SELECT generate_series(first_month, date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead), '1 month')::date
+    LOOP
+        partition_name := 'leads_' || to_char(month_start, 'YYYY_MM');
+        CONTINUE WHEN to_regclass(format('%I.%I', schema_name, partition_name)) IS NOT NULL;
+
+        -- Строки месяца, уже попавшие в DEFAULT, переносятся до присоединения секции
+        EXECUTE format('CREATE TABLE %I.%I (LIKE %I.leads INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                       schema_name, partition_name, schema_name);
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I.leads_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+            'INSERT INTO %I.%I SELECT * FROM moved',
+            schema_name, month_start, month_start + INTERVAL '1 month', schema_name, partition_name);
+        EXECUTE format('ALTER TABLE %I.leads ATTACH PARTITION %I.%I FOR VALUES FROM (%L) TO (%L)',
+                       schema_name, schema_name, partition_name, month_start, month_start + INTERVAL '1 month');
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Секции создаются до переноса истории, чтобы строки сразу ложились в свой месяц
+SELECT t_p62408730_traffic_partnership.ensure_leads_partitions(
+    3, (SELECT min(created_at)::date FROM t_p62408730_traffic_partnership.leads_unpartitioned)
+);
+
+INSERT INTO t_p62408730_traffic_partnership.leads
+SELECT * FROM t_p62408730_traffic_partnership.leads_unpartitioned;
+
+DROP TABLE t_p62408730_traffic_partnership.leads_unpartitioned;
+ALTER SEQUENCE t_p62408730_traffic_partnership.leads_id_seq OWNED BY t_p62408730_traffic_partnership.leads.id;
+
+-- Индексы создаются на родительской таблице и наследуются каждой секцией.
+-- Отдельный индекс по partner_id не нужен: его покрывает idx_leads_partner_created_id
+CREATE INDEX IF NOT EXISTS idx_leads_partner_created_id
+    ON t_p62408730_traffic_partnership.leads(partner_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_leads_status ON t_p62408730_traffic_partnership.leads(status);
+CREATE INDEX IF NOT EXISTS idx_leads_created_at ON t_p62408730_traffic_partnership.leads(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_leads_partner_phone
+    ON t_p62408730_traffic_partnership.leads(partner_id, client_phone_normalized, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_leads_client_name_trgm
+    ON t_p62408730_traffic_partnership.leads USING gin (client_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_leads_client_phone_trgm
+    ON t_p62408730_traffic_partnership.leads USING gin (client_phone_normalized gin_trgm_ops);
+
+-- Архив закрытых лидов старше горизонта хранения: без поисковых индексов, плотная упаковка страниц
+CREATE TABLE IF NOT EXISTS t_p62408730_traffic_partnership.leads_archive (
+    id INTEGER NOT NULL,
+    partner_id INTEGER NOT NULL,
+    client_name VARCHAR(255) NOT NULL,
+    client_phone VARCHAR(50) NOT NULL,
+    client_email VARCHAR(255),
+    project_address TEXT,
+    estimate_amount DECIMAL(12, 2),
+    status VARCHAR(50),
+    commission_amount DECIMAL(12, 2),
+    notes TEXT,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+) WITH (fillfactor = 100);
+
+CREATE INDEX IF NOT EXISTS idx_leads_archive_partner_created
+    ON t_p62408730_traffic_partnership.leads_archive(partner_id, created_at DESC);
@@ -0,0 +1,15 @@
+-- Дневная сводка по лидам партнёра: строка на партнёра и день создания лида с теми же счётчиками, что в partner_stats.
+-- Обновляется вместе с partner_stats при создании лида и смене статуса; историю заполняет scripts/backfill_daily_stats.py
+CREATE TABLE IF NOT EXISTS t_p62408730_traffic_partnership.lead_daily_stats (
+    partner_id INTEGER NOT NULL REFERENCES t_p62408730_traffic_partnership.partners(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    total_leads INTEGER NOT NULL DEFAULT 0,
+    new_leads INTEGER NOT NULL DEFAULT 0,
+    in_review_leads INTEGER NOT NULL DEFAULT 0,
+    approved_leads INTEGER NOT NULL DEFAULT 0,
+    rejected_leads INTEGER NOT NULL DEFAULT 0,
+    completed_leads INTEGER NOT NULL DEFAULT 0,
+    total_commission DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    -- Ряд за любой период читается одним проходом по первичному ключу
+    PRIMARY KEY (partner_id, day)
+);
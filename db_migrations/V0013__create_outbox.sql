@@ -0,0 +1,21 @@
+-- Исходящие события (transactional outbox): пишутся в той же транзакции, что и изменение,
+-- и доставляются получателю отдельным воркером scripts/outbox_worker.py
+CREATE TABLE IF NOT EXISTS t_p62408730_traffic_partnership.outbox (
+    id BIGSERIAL PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    -- Без внешнего ключа: события переживают удаление партнёра
+    partner_id INTEGER NOT NULL,
+    payload JSONB NOT NULL,
+    -- pending -> delivered, либо dead после исчерпания попыток
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    delivered_at TIMESTAMP,
+    last_error TEXT
+);
+
+-- Очередь воркера: только недоставленные события в порядке готовности к отправке
+CREATE INDEX IF NOT EXISTS idx_outbox_pending
+    ON t_p62408730_traffic_partnership.outbox(available_at, id)
+    WHERE status = 'pending';
@@ -0,0 +1,11 @@
+-- Общие корзины токенов ограничения частоты входа и регистрации (backend/*/ratelimit.py).
+-- UNLOGGED: без записи в WAL; после сбоя сервера таблица очищается, и корзины просто начинаются заново
+CREATE UNLOGGED TABLE IF NOT EXISTS t_p62408730_traffic_partnership.rate_limits (
+    -- Область, вид ключа и хеш IP-адреса или email
+    key VARCHAR(100) PRIMARY KEY,
+    capacity DOUBLE PRECISION NOT NULL,
+    -- Токенов в секунду
+    rate DOUBLE PRECISION NOT NULL,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
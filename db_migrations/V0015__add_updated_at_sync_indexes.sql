@@ -0,0 +1,29 @@
+-- Инкрементальная синхронизация (параметр since): клиенты получают только строки,
+-- изменённые после водяной отметки, поэтому время изменения индексируется
+
+-- Лиды: updated_at меняется при каждом изменении статуса или комиссии
+CREATE INDEX IF NOT EXISTS idx_leads_partner_updated
+    ON t_p62408730_traffic_partnership.leads(partner_id, updated_at);
+
+-- Партнёры: время последнего изменения записи (одобрение); для существующих строк - время регистрации
+ALTER TABLE t_p62408730_traffic_partnership.partners
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+UPDATE t_p62408730_traffic_partnership.partners
+SET updated_at = COALESCE(created_at, updated_at);
+
+CREATE INDEX IF NOT EXISTS idx_partners_updated_at
+    ON t_p62408730_traffic_partnership.partners(updated_at);
+
+-- Счётчики лидов в списке партнёров меняются вместе с partner_stats
+CREATE INDEX IF NOT EXISTS idx_partner_stats_updated_at
+    ON t_p62408730_traffic_partnership.partner_stats(updated_at);
+
+-- Надгробия отклонённых (удалённых) партнёров: по ним клиент убирает партнёра из своего списка
+CREATE TABLE IF NOT EXISTS t_p62408730_traffic_partnership.partner_tombstones (
+    partner_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_partner_tombstones_deleted_at
+    ON t_p62408730_traffic_partnership.partner_tombstones(deleted_at);
@@ -0,0 +1,88 @@
+'''
+Apply db_migrations/V*.sql to a local Postgres in version order.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/traffic python scripts/apply_migrations.py [--list]
+
+Creates the t_p62408730_traffic_partnership schema, runs every migration not
+yet recorded in its schema_migrations table inside one transaction each, with
+search_path set to the schema (the early migrations use unqualified names).
+Meant for local development and benchmarks; deployed databases are migrated
+by the platform.
+'''
+
+import argparse
+import os
+import re
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import psycopg2
+
+SCHEMA = 't_p62408730_traffic_partnership'
+
+MIGRATIONS = Path(__file__).resolve().parent.parent / 'db_migrations'
+
+FILENAME = re.compile(r'^V(\d+)__(.+)\.sql$')
+
+
+def discover() -> List[Tuple[int, str, Path]]:
+    found = []
+    for path in MIGRATIONS.iterdir():
+        match = FILENAME.match(path.name)
+        if match:
+            found.append((int(match.group(1)), match.group(2), path))
+    return sorted(found)
+
+
+def applied_versions(cur) -> set:
+    cur.execute('CREATE SCHEMA IF NOT EXISTS %s' % SCHEMA)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS {schema}.schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    '''.format(schema=SCHEMA))
+    cur.execute('SELECT version FROM {schema}.schema_migrations'.format(schema=SCHEMA))
+    return {row[0] for row in cur.fetchall()}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', action='store_true', help='only show which migrations are pending')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        cur = conn.cursor()
+        done = applied_versions(cur)
+        conn.commit()
+
+        pending = [m for m in discover() if m[0] not in done]
+        for version, name, path in pending:
+            if args.list:
+                print('pending V%04d %s' % (version, name))
+                continue
+            cur.execute('SET LOCAL search_path TO %s, public' % SCHEMA)
+            cur.execute(path.read_text(encoding='utf-8'))
+            cur.execute(
+                'INSERT INTO {schema}.schema_migrations (version, name) VALUES (%s, %s)'.format(schema=SCHEMA),
+                (version, name)
+            )
+            conn.commit()
+            print('applied V%04d %s' % (version, name))
+        if not pending:
+            print('database is up to date')
+    except psycopg2.Error as exc:
+        conn.rollback()
+        print('migration failed: %s' % exc, file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+'''
+Build the lead_daily_stats rollup from lead history, one range of days per
+transaction.
+
+Usage:
+    DATABASE_URL=... python scripts/backfill_daily_stats.py
+    DATABASE_URL=... python scripts/backfill_daily_stats.py --from 2024-01-01 --to 2024-12-31 --batch-days 7
+
+Without --from starts at the earliest lead (live or archived); --to defaults
+to today. Each batch replaces the daily rows of its days, so rerunning is
+safe and also repairs drift. Lead writers wait while a batch holds the table
+lock; a smaller --batch-days keeps those waits short.
+'''
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin-manage'))
+
+import psycopg2  # noqa: E402
+import partner_stats  # noqa: E402
+
+
+def first_day(conn) -> date:
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT LEAST(
+            (SELECT MIN(created_at) FROM {schema}.leads),
+            (SELECT MIN(created_at) FROM {schema}.leads_archive)
+        )::date
+    '''.format(schema=partner_stats.SCHEMA))
+    day = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    return day or date.today()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='first day (ISO date)')
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, default=date.today(),
+                        help='last day, inclusive (ISO date)')
+    parser.add_argument('--batch-days', type=int, default=31, help='days rebuilt per transaction')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        start = args.date_from or first_day(conn)
+        end = args.date_to + timedelta(days=1)
+        started = time.perf_counter()
+        total = 0
+        while start < end:
+            batch_end = min(start + timedelta(days=args.batch_days), end)
+            batch_started = time.perf_counter()
+            written = partner_stats.rebuild_daily(conn, start, batch_end)
+            total += written
+            print('%s .. %s: %d rows in %.0f ms' % (
+                start, batch_end - timedelta(days=1), written, (time.perf_counter() - batch_started) * 1000))
+            start = batch_end
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print('rebuilt %d daily rows in %.1f s' % (total, elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+'''
+Every backend function is deployed from its own directory, so shared helper
+modules (db.py, ...) are vendored into each function that uses them.
+This script verifies that all copies of a module are identical and, with
+--sync, propagates one function's copy to the others.
+
+Usage:
+    python scripts/check_shared.py
+    python scripts/check_shared.py --sync auth-login
+'''
+
+import argparse
+import hashlib
+import shutil
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / 'backend'
+
+
+def collect():
+    copies = defaultdict(list)
+    for path in sorted(BACKEND.glob('*/*.py')):
+        if path.name == 'index.py':
+            continue
+        copies[path.name].append(path)
+    return copies
+
+
+def digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync', metavar='FUNCTION', help='copy shared modules from this function to the others')
+    args = parser.parse_args()
+
+    copies = collect()
+
+    if args.sync:
+        source_dir = BACKEND / args.sync
+        for name, paths in copies.items():
+            source = source_dir / name
+            if not source.exists():
+                continue
+            for path in paths:
+                if path != source and digest(path) != digest(source):
+                    shutil.copyfile(source, path)
+                    print('synced %s' % path.relative_to(BACKEND.parent))
+        return 0
+
+    drift = 0
+    for name, paths in sorted(copies.items()):
+        digests = {digest(p) for p in paths}
+        if len(digests) > 1:
+            drift += 1
+            print('%s differs between: %s' % (name, ', '.join(p.parent.name for p in paths)))
+    if drift:
+        return 1
+    print('%d shared modules in sync' % len(copies))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+'''
+Run every backend function locally behind one HTTP server.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/traffic python scripts/dev_server.py [--port 8000] [--migrate]
+    curl -X POST localhost:8000/auth-login -d '{"email": "...", "password": "..."}'
+
+Each backend/<name>/index.py runs in its own worker process (like its own
+container: separate connection pool, caches and vendored modules) and is
+reached at /<name>. Requests are converted to the event/context shape the
+platform passes to handler(event, context), and the returned dict is turned
+back into an HTTP response. Unless PGOPTIONS is already set, the workers get
+search_path set to the application schema, as on the platform.
+'''
+
+import argparse
+import base64
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+SCHEMA = 't_p62408730_traffic_partnership'
+
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host', 'server', 'date'}
+
+
+class Context:
+    '''The attributes of the platform context object that handlers read.'''
+
+    def __init__(self, function_name: str, request_id: str, timeout: float):
+        self.request_id = request_id
+        self.function_name = function_name
+        self.function_version = 'local'
+        self.memory_limit_in_mb = 128
+        self.token = None
+        self._deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def build_event(method: str, target: str, headers: Dict[str, str], body: bytes, client_ip: str,
+                request_id: str) -> Dict[str, Any]:
+    url = urlsplit(target)
+    multi_query = parse_qs(url.query, keep_blank_values=True)
+    try:
+        text, is_base64 = body.decode('utf-8'), False
+    except UnicodeDecodeError:
+        text, is_base64 = base64.b64encode(body).decode('ascii'), True
+    return {
+        'httpMethod': method,
+        'url': target,
+        'path': url.path,
+        'headers': headers,
+        'multiValueHeaders': {k: [v] for k, v in headers.items()},
+        'queryStringParameters': {k: v[-1] for k, v in multi_query.items()},
+        'multiValueQueryStringParameters': multi_query,
+        'requestContext': {
+            'requestId': request_id,
+            'httpMethod': method,
+            'identity': {'sourceIp': client_ip, 'userAgent': headers.get('User-Agent', '')},
+            'requestTimeEpoch': int(time.time() * 1000),
+        },
+        'body': text,
+        'isBase64Encoded': is_base64,
+    }
+
+
+def load_handler(name: str) -> Any:
+    function_dir = BACKEND / name
+    sys.path.insert(0, str(function_dir))
+    spec = importlib.util.spec_from_file_location('index', function_dir / 'index.py')
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['index'] = module
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self) -> None:
+        super().setup()
+        # Headers and body are written separately; without this Nagle's
+        # algorithm adds ~40 ms per keep-alive request
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def serve_function(name: str, timeout: float) -> None:
+    '''Worker process: one function, threaded, on an ephemeral port printed to stdout.'''
+    handler = load_handler(name)
+
+    class FunctionRequestHandler(RequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _invoke(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            request_id = self.headers.get('X-Request-Id') or str(uuid.uuid4())
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+            client_ip = self.headers.get('X-Forwarded-For') or self.client_address[0]
+            event = build_event(self.command, self.path, headers, body, client_ip, request_id)
+            try:
+                result = handler(event, Context(name, request_id, timeout))
+                status = int(result.get('statusCode', 200))
+                out_headers = dict(result.get('headers') or {})
+                payload = result.get('body') or ''
+                if result.get('isBase64Encoded'):
+                    data = base64.b64decode(payload)
+                else:
+                    data = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+            except Exception:
+                traceback.print_exc()
+                status, out_headers = 502, {'Content-Type': 'application/json'}
+                data = json.dumps({'errorMessage': 'Function failed', 'errorType': 'UnhandledError'}).encode('utf-8')
+            self.send_response(status)
+            for key, value in out_headers.items():
+                if key.lower() not in HOP_HEADERS:
+                    self.send_header(key, str(value))
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_OPTIONS = _invoke
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FunctionRequestHandler)
+    server.daemon_threads = True
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+class Gateway:
+    '''Routes /<function>/... to the worker of that function over keep-alive connections.'''
+
+    def __init__(self, ports: Dict[str, int]):
+        self.ports = ports
+        self._local = threading.local()
+
+    def connection(self, name: str) -> http.client.HTTPConnection:
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if name not in connections:
+            connections[name] = http.client.HTTPConnection('127.0.0.1', self.ports[name], timeout=60)
+        return connections[name]
+
+    def forward(self, name: str, method: str, target: str, headers: Dict[str, str],
+                body: bytes) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        for attempt in (1, 2):
+            conn = self.connection(name)
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.getheaders(), response.read()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                self._local.connections.pop(name, None)
+                if attempt == 2:
+                    raise
+        raise AssertionError('unreachable')
+
+
+def relay_output(stream: Any) -> None:
+    for line in stream:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def start_workers(names: List[str], timeout: float) -> Tuple[Dict[str, int], List[subprocess.Popen]]:
+    env = dict(os.environ)
+    env.setdefault('PGOPTIONS', '-c search_path=%s,public' % SCHEMA)
+    ports: Dict[str, int] = {}
+    procs = []
+    for name in names:
+        proc = subprocess.Popen(
+            [sys.executable, __file__, '--worker', name, '--timeout', str(timeout)],
+            stdout=subprocess.PIPE, env=env, text=True
+        )
+        line = proc.stdout.readline()
+        if not line.strip().isdigit():
+            raise RuntimeError('worker for %s failed to start' % name)
+        ports[name] = int(line)
+        procs.append(proc)
+        # Everything else the function prints (trace lines) is its log output
+        threading.Thread(target=relay_output, args=(proc.stdout,), daemon=True).start()
+    return ports, procs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--function', action='append', help='serve only this function (repeatable)')
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations before starting')
+    parser.add_argument('--timeout', type=float, default=30.0, help='function timeout reported by the context')
+    parser.add_argument('--quiet', action='store_true', help='do not log every request (for load tests)')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        serve_function(args.worker, args.timeout)
+        return 0
+
+    if args.migrate:
+        result = subprocess.run([sys.executable, str(ROOT / 'scripts' / 'apply_migrations.py')])
+        if result.returncode != 0:
+            return result.returncode
+
+    names = args.function or sorted(p.name for p in BACKEND.iterdir() if (p / 'index.py').exists())
+    ports, procs = start_workers(names, args.timeout)
+    gateway = Gateway(ports)
+    quiet = args.quiet
+
+    class GatewayRequestHandler(RequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            if not quiet:
+                sys.stderr.write('%s %s\n' % (self.log_date_time_string(), format % args))
+
+        def _route(self) -> None:
+            url = urlsplit(self.path)
+            name, _, rest = url.path.lstrip('/').partition('/')
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if name not in ports:
+                data = json.dumps({'error': 'Unknown function', 'functions': sorted(ports)}).encode('utf-8')
+                status, headers = 404, [('Content-Type', 'application/json')]
+            else:
+                target = '/' + rest + ('?' + url.query if url.query else '')
+                headers_in = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+                headers_in.setdefault('X-Forwarded-For', self.client_address[0])
+                status, headers, data = gateway.forward(name, self.command, target, headers_in, body)
+            self.send_response(status)
+            for key, value in headers:
+                if key.lower() not in HOP_HEADERS:
+                    self.send_header(key, value)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_OPTIONS = _route
+
+    server = ThreadingHTTPServer((args.host, args.port), GatewayRequestHandler)
+    server.daemon_threads = True
+    for name in names:
+        print('http://%s:%d/%s' % (args.host, args.port, name))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for proc in procs:
+            proc.terminate()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+'''
+Export leads or partners as CSV/NDJSON with constant memory.
+Same encoder as the admin-manage export mode, but written straight to a file
+or stdout instead of a buffered function response.
+
+Usage:
+    DATABASE_URL=... python scripts/export_admin_data.py leads --format csv --gzip -o leads.csv.gz
+'''
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin-manage'))
+
+import psycopg2  # noqa: E402
+import export  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('entity', choices=sorted(export.QUERIES))
+    parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=export.BATCH_SIZE)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        count = export.export(conn, args.entity, args.format, out, compress=args.gzip, batch_size=args.batch_size)
+    finally:
+        conn.rollback()
+        conn.close()
+        if args.output:
+            out.close()
+    print('exported %d %s' % (count, args.entity), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
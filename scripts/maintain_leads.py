@@ -0,0 +1,53 @@
+'''
+Daily maintenance of the partitioned leads table: create the monthly
+partitions ahead of time and move old closed leads to leads_archive.
+
+Usage:
+    DATABASE_URL=... python scripts/maintain_leads.py [--dry-run]
+
+Meant to run once a day from cron; both steps are idempotent.
+'''
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin-manage'))
+
+import psycopg2  # noqa: E402
+import partitions  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months-ahead', type=int, default=partitions.MONTHS_AHEAD,
+                        help='create partitions up to this many months ahead')
+    parser.add_argument('--archive-after', type=int, default=partitions.ARCHIVE_AFTER_MONTHS,
+                        help='archive closed leads older than this many months')
+    parser.add_argument('--batch-size', type=int, default=partitions.ARCHIVE_BATCH_SIZE,
+                        help='leads moved per transaction')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be archived')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        if not args.dry_run:
+            created = partitions.ensure_partitions(conn, args.months_ahead)
+            print('created %d partitions' % created)
+        archived = partitions.archive_closed_leads(
+            conn, months=args.archive_after, batch_size=args.batch_size, dry_run=args.dry_run
+        )
+    finally:
+        conn.close()
+
+    cutoff = partitions.months_ago(args.archive_after).date()
+    if args.dry_run:
+        print('%d closed leads created before %s would be archived' % (archived, cutoff))
+    else:
+        print('archived %d closed leads created before %s' % (archived, cutoff))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
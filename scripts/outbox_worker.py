@@ -0,0 +1,109 @@
+'''
+Deliver outbox events (lead status changes, partner approvals) to a sink.
+
+Usage:
+    DATABASE_URL=... python scripts/outbox_worker.py --webhook https://example.com/hooks/traffic
+    DATABASE_URL=... python scripts/outbox_worker.py --file /tmp/outbox.ndjson --fail-rate 0.2 --once
+
+The webhook sink POSTs each event as JSON with an X-Event-Id header; any
+non-2xx answer or network error is a failed delivery and is retried with
+exponential backoff. The file sink appends events as NDJSON and stands in
+for the recipient locally; --fail-rate makes it fail a share of deliveries
+to exercise retries. Several workers may run at once: claimed events are
+locked and skipped by the others.
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin-manage'))
+
+import psycopg2  # noqa: E402
+import outbox  # noqa: E402
+
+PURGE_INTERVAL = 3600.0
+
+
+class WebhookSink:
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(event, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'X-Event-Id': str(event['id'])},
+            method='POST'
+        )
+        # urlopen raises HTTPError for 4xx/5xx
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class FileSink:
+    def __init__(self, path: str, fail_rate: float = 0.0):
+        self.path = path
+        self.fail_rate = fail_rate
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        if random.random() < self.fail_rate:
+            raise RuntimeError('simulated delivery failure')
+        with open(self.path, 'a', encoding='utf-8') as sink:
+            sink.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--webhook', default=os.environ.get('OUTBOX_WEBHOOK_URL'), help='recipient URL')
+    target.add_argument('--file', help='append events to this NDJSON file instead')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of file deliveries to fail')
+    parser.add_argument('--batch-size', type=int, default=100, help='events claimed per transaction')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds to wait when the queue is empty')
+    parser.add_argument('--keep-days', type=int, default=7, help='days to keep delivered events')
+    parser.add_argument('--once', action='store_true', help='exit once no event is due')
+    args = parser.parse_args()
+
+    if args.file:
+        sink = FileSink(args.file, args.fail_rate)
+    elif args.webhook:
+        sink = WebhookSink(args.webhook)
+    else:
+        parser.error('a sink is required: --webhook (or OUTBOX_WEBHOOK_URL) or --file')
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    totals = {'delivered': 0, 'retried': 0, 'dead': 0}
+    purged_at = 0.0
+    try:
+        while True:
+            if time.monotonic() - purged_at > PURGE_INTERVAL:
+                outbox.purge_delivered(conn, args.keep_days)
+                purged_at = time.monotonic()
+            counts = outbox.drain_batch(conn, sink, args.batch_size)
+            for key in totals:
+                totals[key] += counts[key]
+            if counts['claimed']:
+                print('claimed %(claimed)d: delivered %(delivered)d, retried %(retried)d, dead %(dead)d' % counts)
+            if counts['claimed'] < args.batch_size:
+                if args.once:
+                    break
+                time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+    print('delivered %(delivered)d, retried %(retried)d, dead %(dead)d' % totals)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
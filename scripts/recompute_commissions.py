@@ -0,0 +1,335 @@
+'''
+Recompute lead commissions from rules after the rules change.
+
+Usage:
+    DATABASE_URL=... python scripts/recompute_commissions.py --rules rules.json --dry-run
+    DATABASE_URL=... python scripts/recompute_commissions.py --rules rules.json [--chunk-size 50000] [--batch-size 5000]
+
+The rules file sets the commission as a percentage of estimate_amount:
+
+    {
+        "statuses": ["approved"],
+        "percent": 5,
+        "traffic_sources": {"Яндекс.Директ": 7, "Telegram": 6},
+        "tiers": [[0, 0], [20, 0.5], [100, 1.5]]
+    }
+
+percent is the rate for partners whose traffic_source is not listed in
+traffic_sources. tiers are [approved leads, extra percent] pairs: a partner
+with at least that many approved leads (partner_stats, archive included)
+gets the extra points on top of the source rate. Only live leads in one of
+statuses with an estimate are recomputed; the rest keep their commission.
+Rates are limited to MAX_PERCENT, and a commission that does not fit
+commission_amount (DECIMAL(12, 2)) stops the run in the read phase, before
+any batch is written.
+
+Leads are streamed from a server-side cursor in chunks and each chunk is
+computed with NumPy in integer kopecks, rounded half away from zero as
+numeric rounding is.
+Changed commissions are COPYed into a temporary staging table, numbered in
+batches of --batch-size, and the read phase commits. Each batch is then
+written by one UPDATE, which also feeds partner_stats and lead_daily_stats,
+in a transaction of its own: updated_at is the transaction's start time, and
+since= clients (sync.py) only see rows that commit within SYNC_OVERLAP of
+it, so no transaction may run longer than that. The update is most of the
+run time (each changed row is a new row version in every leads index); a
+batch of 5000 commits in about 0.3 s. A lead whose status, estimate or
+commission changed since it was read is left alone and counted as skipped.
+A run that stops halfway keeps the batches already committed; run it again
+to finish, the leads already done no longer change. --dry-run only reads: it
+prints the first --show changes and the totals without writing anything.
+'''
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin-manage'))
+
+import psycopg2  # noqa: E402
+import partner_stats  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    raise SystemExit('numpy is required: pip install numpy')
+
+SCHEMA = partner_stats.SCHEMA
+
+# Stands for a NULL commission in the int64 kopeck arrays
+NULL_KOPECKS = -2 ** 63
+
+# leads.commission_amount is DECIMAL(12, 2): at most 9999999999.99
+MAX_KOPECKS = 10 ** 12 - 1
+
+# Rates above this many percent could overflow kopecks * hundredths in int64;
+# estimate_amount has the same precision as commission_amount
+MAX_PERCENT = 10000
+
+PARTNERS_SQL = '''
+    SELECT p.id, p.traffic_source, COALESCE(s.approved_leads, 0)
+    FROM {schema}.partners p
+    LEFT JOIN {schema}.partner_stats s ON s.partner_id = p.id
+    ORDER BY p.id
+'''.format(schema=SCHEMA)
+
+LEADS_SQL = '''
+    SELECT id, partner_id, (estimate_amount * 100)::bigint,
+           COALESCE((commission_amount * 100)::bigint, %s),
+           (EXTRACT(EPOCH FROM created_at) * 1000000)::bigint
+    FROM {schema}.leads
+    WHERE status = ANY(%s) AND estimate_amount IS NOT NULL
+'''.format(schema=SCHEMA)
+
+STAGING_SQL = '''
+    CREATE TEMPORARY TABLE commission_recompute (
+        id INTEGER PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL,
+        batch INTEGER NOT NULL,
+        estimate BIGINT NOT NULL,
+        old_commission BIGINT,
+        new_commission BIGINT NOT NULL
+    )
+'''
+
+COPY_SQL = 'COPY commission_recompute (id, created_at, batch, estimate, old_commission, new_commission) FROM STDIN'
+
+BATCHES_SQL = '''
+    SELECT batch, MIN(created_at), MAX(created_at) FROM commission_recompute GROUP BY batch ORDER BY batch
+'''
+
+# Writes the staged commissions of one batch and returns the changes summed
+# per partner, day and status for the rollups. The batch's created_at range
+# limits the update to the partitions it touches
+UPDATE_SQL = '''
+    WITH updated AS (
+        UPDATE {schema}.leads l
+        SET commission_amount = s.new_commission::numeric / 100, updated_at = CURRENT_TIMESTAMP
+        FROM commission_recompute s
+        WHERE s.batch = %s
+          AND l.created_at BETWEEN %s AND %s
+          AND l.id = s.id
+          AND l.created_at = s.created_at
+          AND l.status = ANY(%s)
+          AND (l.estimate_amount * 100)::bigint = s.estimate
+          AND (l.commission_amount * 100)::bigint IS NOT DISTINCT FROM s.old_commission
+        RETURNING l.partner_id, l.created_at, l.status, s.old_commission, s.new_commission
+    )
+    SELECT partner_id, created_at::date, status,
+           SUM(COALESCE(old_commission, 0)), SUM(new_commission), COUNT(*)
+    FROM updated
+    GROUP BY partner_id, created_at::date, status
+'''.format(schema=SCHEMA)
+
+
+class Rules(NamedTuple):
+    statuses: List[str]
+    # Rates in hundredths of a percent
+    default_rate: int
+    source_rates: Dict[str, int]
+    tier_volumes: Any
+    tier_rates: Any
+
+
+def _rate(value: Any) -> int:
+    '''Percent (up to two decimals) as an integer count of hundredths.'''
+    try:
+        hundredths = Decimal(str(value)) * 100
+    except InvalidOperation:
+        hundredths = Decimal('NaN')
+    if isinstance(value, bool) or not hundredths.is_finite() or hundredths != hundredths.to_integral_value():
+        raise ValueError('%r is not a percentage with at most two decimals' % (value,))
+    if abs(hundredths) > MAX_PERCENT * 100:
+        raise ValueError('%r is more than %d percent' % (value, MAX_PERCENT))
+    return int(hundredths)
+
+
+def load_rules(path: str) -> Rules:
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if 'percent' not in data:
+        raise ValueError('percent is required')
+    tiers = sorted(data.get('tiers') or [[0, 0]])
+    if tiers[0][0] > 0:
+        tiers.insert(0, [0, 0])
+    return Rules(
+        statuses=list(data.get('statuses') or ['approved']),
+        default_rate=_rate(data['percent']),
+        source_rates={source: _rate(value) for source, value in (data.get('traffic_sources') or {}).items()},
+        tier_volumes=np.array([int(volume) for volume, _ in tiers], dtype=np.int64),
+        tier_rates=np.array([_rate(extra) for _, extra in tiers], dtype=np.int64),
+    )
+
+
+def partner_rates(conn: Any, rules: Rules) -> Tuple[Any, Any]:
+    '''Sorted partner ids and each partner's rate in hundredths of a percent.'''
+    cur = conn.cursor()
+    cur.execute(PARTNERS_SQL)
+    partners = cur.fetchall()
+    cur.close()
+    ids = np.array([row[0] for row in partners], dtype=np.int64)
+    volumes = np.array([row[2] for row in partners], dtype=np.int64)
+    source = np.array([rules.source_rates.get(row[1], rules.default_rate) for row in partners], dtype=np.int64)
+    tier = np.searchsorted(rules.tier_volumes, volumes, side='right') - 1
+    return ids, source + rules.tier_rates[tier]
+
+
+def compute(chunk: Any, ids: Any, rates: Any) -> Any:
+    '''
+    New commissions in kopecks for a chunk of (id, partner_id, estimate,
+    commission, created_at) rows. Raises ValueError when one does not fit
+    commission_amount, before anything of the chunk is staged.
+    '''
+    position = np.minimum(np.searchsorted(ids, chunk[:, 1]), len(ids) - 1)
+    rate = rates[position]
+    estimate = chunk[:, 2]
+    # kopecks * hundredths of a percent / 10000, rounded half away from zero
+    commission = (np.abs(estimate) * rate + 5000) // 10000 * np.sign(estimate)
+    # A partner missing from the snapshot (registered meanwhile) keeps the old value
+    new = np.where(ids[position] == chunk[:, 1], commission, chunk[:, 3])
+    overflow = (new != NULL_KOPECKS) & (np.abs(new) > MAX_KOPECKS)
+    if overflow.any():
+        first = np.flatnonzero(overflow)[0]
+        raise ValueError('%d leads get a commission beyond DECIMAL(12, 2), e.g. lead %d: %s' % (
+            int(overflow.sum()), chunk[first, 0], rubles(int(new[first]))))
+    return new
+
+
+def copy_rows(chunk: Any, new: Any, batches: Any) -> io.StringIO:
+    buffer = io.StringIO()
+    # created_at comes as microseconds since the epoch
+    created = np.datetime_as_string(chunk[:, 4].astype('datetime64[us]'))
+    for lead_id, created_at, batch, estimate, old, commission in zip(
+        chunk[:, 0].tolist(), created.tolist(), batches.tolist(), chunk[:, 2].tolist(), chunk[:, 3].tolist(),
+        new.tolist()
+    ):
+        buffer.write('%d\t%s\t%d\t%d\t%s\t%d\n' % (
+            lead_id, created_at, batch, estimate, '\\N' if old == NULL_KOPECKS else old, commission))
+    buffer.seek(0)
+    return buffer
+
+
+def rubles(kopecks: int) -> str:
+    return str((Decimal(kopecks) / 100).quantize(Decimal('0.01')))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rules', required=True, help='JSON file with the commission rules')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='leads fetched and computed at a time')
+    parser.add_argument('--batch-size', type=int, default=5000, help='leads updated per transaction')
+    parser.add_argument('--dry-run', action='store_true', help='report the changes without writing them')
+    parser.add_argument('--show', type=int, default=20, help='changed leads printed with --dry-run')
+    args = parser.parse_args()
+
+    try:
+        rules = load_rules(args.rules)
+    except (OSError, ValueError, TypeError) as e:
+        raise SystemExit('bad rules file %s: %s' % (args.rules, e))
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        started = time.perf_counter()
+        ids, rates = partner_rates(conn, rules)
+        if not len(ids):
+            print('no partners')
+            return 0
+
+        write = conn.cursor()
+        if not args.dry_run:
+            write.execute(STAGING_SQL)
+        leads = conn.cursor(name='commission_recompute')
+        leads.execute(LEADS_SQL, (NULL_KOPECKS, rules.statuses))
+        scanned = changed = old_total = new_total = 0
+        copy_seconds = 0.0
+        while True:
+            rows = leads.fetchmany(args.chunk_size)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.int64)
+            try:
+                new = compute(chunk, ids, rates)
+            except ValueError as e:
+                # Nothing is committed before the whole read phase is done
+                raise SystemExit('rules out of range, nothing written: %s' % e)
+            diff = new != chunk[:, 3]
+            scanned += len(chunk)
+            if not diff.any():
+                continue
+            chunk, new = chunk[diff], new[diff]
+            if args.dry_run:
+                old = chunk[:, 3]
+                old_total += int(old[old != NULL_KOPECKS].sum())
+                new_total += int(new.sum())
+                shown = max(args.show - changed, 0)
+                for lead_id, partner_id, _, before, after in zip(
+                    *[column[:shown].tolist() for column in chunk[:, :4].T], new[:shown].tolist()
+                ):
+                    print('lead %d (partner %d): %s -> %s' % (
+                        lead_id, partner_id, '-' if before == NULL_KOPECKS else rubles(before), rubles(after)))
+                changed += len(chunk)
+                continue
+            copy_started = time.perf_counter()
+            # Rows come in table order, so a batch mostly stays within one partition
+            numbers = (changed + np.arange(len(chunk))) // args.batch_size
+            write.copy_expert(COPY_SQL, copy_rows(chunk, new, numbers))
+            copy_seconds += time.perf_counter() - copy_started
+            changed += len(chunk)
+        leads.close()
+        read_seconds = time.perf_counter() - started - copy_seconds
+
+        if args.dry_run:
+            conn.rollback()
+            print('%d leads scanned, %d commissions would change: %s -> %s in total' % (
+                scanned, changed, rubles(old_total), rubles(new_total)))
+            print('%.1f s, %.0f rows/s' % (read_seconds, scanned / max(read_seconds, 1e-9)))
+            return 0
+
+        # The staging table outlives the commit (it is dropped with the session)
+        write.execute('CREATE INDEX ON commission_recompute (batch)')
+        write.execute('ANALYZE commission_recompute')
+        write.execute(BATCHES_SQL)
+        batches = write.fetchall()
+        conn.commit()
+
+        update_started = time.perf_counter()
+        updated = old_total = new_total = 0
+        longest = 0.0
+        for batch, first, last in batches:
+            batch_started = time.perf_counter()
+            write.execute(UPDATE_SQL, (batch, first, last, rules.statuses))
+            groups = write.fetchall()
+            # Each group is leads of one partner, day and status whose commission
+            # went from the old sum to the new one; their counts do not change
+            partner_stats.apply_lead_changes(write, [
+                (partner_id, day, status, Decimal(old) / 100, status, Decimal(new) / 100)
+                for partner_id, day, status, old, new, _ in groups
+            ])
+            conn.commit()
+            longest = max(longest, time.perf_counter() - batch_started)
+            updated += sum(group[5] for group in groups)
+            old_total += sum(group[3] for group in groups)
+            new_total += sum(group[4] for group in groups)
+        write.close()
+        update_seconds = time.perf_counter() - update_started
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print('%d leads scanned, %d commissions changed: %s -> %s in total' % (
+        scanned, updated, rubles(old_total), rubles(new_total)))
+    if changed > updated:
+        print('%d leads changed while the job ran and were skipped' % (changed - updated))
+    print('read and compute %.1f s, copy %.1f s, update %.1f s (longest transaction %.2f s); %.0f rows/s' % (
+        read_seconds, copy_seconds, update_seconds, longest, scanned / max(elapsed, 1e-9)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
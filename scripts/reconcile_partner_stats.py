@@ -0,0 +1,51 @@
+'''
+Check the partner_stats rollup against a full recompute from leads.
+
+Usage:
+    DATABASE_URL=... python scripts/reconcile_partner_stats.py [--fix]
+
+Exits with status 1 when mismatches were found (and not fixed). With --fix,
+lead writes wait on the partner_stats lock until the rewrite commits.
+'''
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend' / 'admin-manage'))
+
+import psycopg2  # noqa: E402
+import partner_stats  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fix', action='store_true', help='rewrite mismatching rollup rows from the recompute')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        mismatches = partner_stats.reconcile(conn, fix=args.fix)
+    finally:
+        conn.close()
+
+    for mismatch in mismatches:
+        diff = ', '.join(
+            '%s %s != %s' % (column, mismatch['actual'][column], mismatch['expected'][column])
+            for column in partner_stats.COLUMNS
+            if mismatch['actual'][column] != mismatch['expected'][column]
+        )
+        print('partner %s: %s' % (mismatch['partner_id'], diff))
+
+    if not mismatches:
+        print('partner_stats is consistent with leads')
+        return 0
+    if args.fix:
+        print('fixed %d partners' % len(mismatches))
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
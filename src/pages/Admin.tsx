@@ -23,6 +23,7 @@ const Admin = () => {
   const navigate = useNavigate();
   const [admin, setAdmin] = useState<any>(null);
   const [partners, setPartners] = useState<Partner[]>([]);
+  const [watermark, setWatermark] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [approvalModal, setApprovalModal] = useState<{partnerId: number, name: string} | null>(null);
   const [password, setPassword] = useState('');
@@ -54,6 +55,7 @@ const Admin = () => {
 
       if (data.success) {
         setPartners(data.partners);
+        setWatermark(data.watermark);
       }
     } catch (error) {
       console.error('Error fetching partners:', error);
@@ -62,6 +64,32 @@ const Admin = () => {
     }
   };
 
+  // Only partners changed since the last response are downloaded and merged in
+  const refreshPartners = async (adminId: number) => {
+    if (!watermark) {
+      return fetchPartners(adminId);
+    }
+
+    try {
+      const response = await fetch(
+        `https://functions.poehali.dev/2d79683e-baac-45a9-badc-580ddb033645?admin_id=${adminId}&since=${encodeURIComponent(watermark)}`
+      );
+      const data = await response.json();
+
+      if (data.success) {
+        const changed = new Map<number, Partner>(data.partners.map((partner: Partner) => [partner.id, partner]));
+        const deleted = new Set<number>(data.deleted);
+        setPartners(prev => [
+          ...changed.values(),
+          ...prev.filter(partner => !changed.has(partner.id) && !deleted.has(partner.id))
+        ].sort((a, b) => b.created_at.localeCompare(a.created_at)));
+        setWatermark(data.watermark);
+      }
+    } catch (error) {
+      console.error('Error refreshing partners:', error);
+    }
+  };
+
   const handleLogout = () => {
     localStorage.removeItem('partner');
     localStorage.removeItem('session_token');
@@ -77,7 +105,7 @@ const Admin = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'X-User-Id': admin.email
+          'X-Auth-Token': localStorage.getItem('session_token') || ''
         },
         body: JSON.stringify({
           partner_id: approvalModal.partnerId,
@@ -91,7 +119,7 @@ const Admin = () => {
       if (data.success) {
         setApprovalModal(null);
         setPassword('');
-        fetchPartners(admin.id);
+        refreshPartners(admin.id);
       }
     } catch (error) {
       console.error('Error approving partner:', error);
@@ -109,7 +137,7 @@ const Admin = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'X-User-Id': admin.email
+          'X-Auth-Token': localStorage.getItem('session_token') || ''
         },
         body: JSON.stringify({
           partner_id: partnerId,
@@ -120,7 +148,7 @@ const Admin = () => {
       const data = await response.json();
 
       if (data.success) {
-        fetchPartners(admin.id);
+        refreshPartners(admin.id);
       }
     } catch (error) {
       console.error('Error rejecting partner:', error);
@@ -33,7 +33,10 @@ const Dashboard = () => {
     approved_leads: 0,
     total_commission: 0
   });
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [watermark, setWatermark] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [showAddForm, setShowAddForm] = useState(false);
   const [formData, setFormData] = useState({
     name: '',
@@ -57,16 +60,23 @@ const Dashboard = () => {
     fetchLeads(parsedPartner.id);
   }, [navigate]);
 
-  const fetchLeads = async (partnerId: number) => {
+  const fetchLeads = async (partnerId: number, cursor?: string) => {
     try {
+      const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
       const response = await fetch(
-        `https://functions.poehali.dev/f84da5a5-d817-45a3-b926-d3e064fe8e7a?partner_id=${partnerId}`
+        `https://functions.poehali.dev/f84da5a5-d817-45a3-b926-d3e064fe8e7a?partner_id=${partnerId}${query}`
       );
       const data = await response.json();
 
       if (data.success) {
-        setLeads(data.leads);
-        setStatistics(data.statistics);
+        setLeads(prev => cursor ? [...prev, ...data.leads] : data.leads);
+        setNextCursor(data.next_cursor);
+        if (data.statistics) {
+          setStatistics(data.statistics);
+        }
+        if (data.watermark) {
+          setWatermark(data.watermark);
+        }
       }
     } catch (error) {
       console.error('Error fetching leads:', error);
@@ -75,6 +85,49 @@ const Dashboard = () => {
     }
   };
 
+  // Only leads changed since the last response are downloaded and merged in
+  const refreshLeads = async (partnerId: number) => {
+    if (!watermark) {
+      return fetchLeads(partnerId);
+    }
+
+    try {
+      const response = await fetch(
+        `https://functions.poehali.dev/f84da5a5-d817-45a3-b926-d3e064fe8e7a?partner_id=${partnerId}&since=${encodeURIComponent(watermark)}`
+      );
+      const data = await response.json();
+
+      if (data.reset) {
+        return fetchLeads(partnerId);
+      }
+      if (data.success) {
+        setLeads(prev => {
+          const changed = new Map<number, Lead>(data.leads.map((lead: Lead) => [lead.id, lead]));
+          const oldest = prev.length ? prev[prev.length - 1].created_at : '';
+          const kept = prev.filter(lead => !changed.has(lead.id));
+          // Leads older than the loaded pages arrive with "load more"
+          const shown = [...changed.values()].filter(
+            lead => !nextCursor || lead.created_at >= oldest || prev.some(old => old.id === lead.id)
+          );
+          return [...shown, ...kept].sort(
+            (a, b) => b.created_at.localeCompare(a.created_at) || b.id - a.id
+          );
+        });
+        setStatistics(data.statistics);
+        setWatermark(data.watermark);
+      }
+    } catch (error) {
+      console.error('Error refreshing leads:', error);
+    }
+  };
+
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    await fetchLeads(partner.id, nextCursor);
+    setIsLoadingMore(false);
+  };
+
   const handleLogout = () => {
     localStorage.removeItem('partner');
     localStorage.removeItem('session_token');
@@ -90,11 +143,16 @@ const Dashboard = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'X-User-Id': partner.email
+          'X-Auth-Token': localStorage.getItem('session_token') || ''
         },
         body: JSON.stringify(formData)
       });
 
+      if (response.status === 401) {
+        handleLogout();
+        return;
+      }
+
       const data = await response.json();
 
       if (data.success) {
@@ -106,7 +164,7 @@ const Dashboard = () => {
           notes: ''
         });
         setShowAddForm(false);
-        fetchLeads(partner.id);
+        refreshLeads(partner.id);
       } else {
         console.error('Error creating lead:', data.error);
       }
@@ -369,6 +427,18 @@ const Dashboard = () => {
                     )}
                   </div>
                 ))}
+                {nextCursor && (
+                  <div className="text-center pt-2">
+                    <Button
+                      onClick={handleLoadMore}
+                      disabled={isLoadingMore}
+                      variant="outline"
+                      className="border-primary/20"
+                    >
+                      {isLoadingMore ? 'Загрузка...' : 'Показать ещё'}
+                    </Button>
+                  </div>
+                )}
               </div>
             )}
           </CardContent>